@@ -0,0 +1,178 @@
+"""
+Grant budget allocation
+
+Distributes a fixed budget across event participants, given each participant's
+country rate and requested hours. Three allocation modes:
+
+- ``proportional``: every participant is funded the same fraction of their
+  request (all requests are scaled down together when the budget is short)
+- ``capped``: water-filling; each participant receives at most a common cap,
+  chosen so the budget is used exactly, so small requests are funded in full
+  before large ones are cut
+- ``priority``: priority tiers (1 = highest) are funded in full one after the
+  other; the first tier the budget cannot cover is funded proportionally
+
+Every mode is solved in closed form with numpy (a sort and a cumulative sum at
+most), so events with 10^5+ participants allocate in milliseconds.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+from typing import Dict, Iterable, Optional, Sequence
+
+from lazy_import import lazy_module
+from rate_table import RateTable
+
+np = lazy_module('numpy')
+
+MODES = ('proportional', 'capped', 'priority')
+
+
+def _water_level(costs: np.ndarray, budget: float) -> float:
+    """Largest cap such that sum(min(costs, cap)) <= budget"""
+    ordered = np.sort(costs)
+    n = len(ordered)
+    # Spend when the cap sits at each sorted cost: costs below it in full, the rest capped
+    spent = np.cumsum(ordered) + ordered * (n - 1 - np.arange(n))
+    k = int(np.searchsorted(spent, budget, side='right'))
+    if k >= n:
+        return float(ordered[-1]) if n else 0.0
+    below = float(ordered[:k].sum())
+    return (budget - below) / (n - k)
+
+
+def allocate(rates: Sequence[float], hours: Sequence[float], budget: float,
+             mode: str = 'proportional', priority: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+    """
+    Allocate a budget across participants.
+
+    Returns arrays aligned with the inputs: ``requested`` (hours x rate),
+    ``amount`` (funding, floored to cents so the total never exceeds the
+    budget), ``hours`` (funded hours) and ``fraction`` (funded share of the
+    request).
+    """
+    rates = np.asarray(rates, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    if rates.shape != hours.shape:
+        raise ValueError("rates and hours must have the same length")
+    # NaN and infinity pass every comparison below and would end up as NaN amounts
+    if not (np.isfinite(rates).all() and np.isfinite(hours).all() and np.isfinite(budget)):
+        raise ValueError("Rates, hours and budget must be finite numbers")
+    if (hours < 0).any() or (rates <= 0).any():
+        raise ValueError("Hours must be non-negative and rates positive")
+    if budget < 0:
+        raise ValueError("Budget must be non-negative")
+    if mode not in MODES:
+        raise ValueError(f"Unknown allocation mode: {mode}")
+
+    requested = rates * hours
+    total = requested.sum()
+
+    if total <= budget:
+        amount = requested.copy()
+    elif mode == 'proportional':
+        amount = requested * (budget / total)
+    elif mode == 'capped':
+        amount = np.minimum(requested, _water_level(requested, budget))
+    else:
+        if priority is None:
+            raise ValueError("Priority mode needs a priority per participant")
+        priority = np.asarray(priority)
+        if priority.shape != rates.shape:
+            raise ValueError("priority and hours must have the same length")
+
+        # Cost per tier, in priority order, and the budget left when each tier starts
+        tiers, tier_of = np.unique(priority, return_inverse=True)
+        tier_cost = np.bincount(tier_of, weights=requested, minlength=len(tiers))
+        remaining = budget - np.concatenate(([0.0], np.cumsum(tier_cost)[:-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tier_fraction = np.clip(np.where(tier_cost > 0, remaining / tier_cost, 1.0), 0.0, 1.0)
+        amount = requested * tier_fraction[tier_of]
+
+    # Partially funded amounts are floored to cents; full requests are kept as is
+    amount = np.where(amount >= requested, requested, np.floor(amount * 100) / 100)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(requested > 0, amount / requested, 1.0)
+
+    return {
+        'requested': requested,
+        'amount': amount,
+        'hours': amount / rates,
+        'fraction': fraction,
+    }
+
+
+def allocate_participants(table: RateTable, countries: Sequence[str], hours: Sequence[float],
+                          budget: float, mode: str = 'proportional',
+                          priority: Optional[Sequence[int]] = None) -> Dict:
+    """
+    Allocate a budget across participants identified by country code, using
+    the rates in the table. Raises KeyError listing any unknown countries.
+    """
+    # Resolve each distinct country once
+    unique_codes, inverse = np.unique(np.asarray(countries, dtype=str), return_inverse=True)
+    positions = [table.lookup(code) for code in unique_codes.tolist()]
+    unknown = [code for code, position in zip(unique_codes.tolist(), positions) if position is None]
+    if unknown:
+        raise KeyError(f"Unknown country codes: {', '.join(unknown)}")
+
+    unique_rates = np.array([table.rate(position) for position in positions], dtype=float)
+    rates = unique_rates[inverse]
+    result = allocate(rates, hours, budget, mode, priority)
+    result['rate'] = rates
+
+    total_amount = float(result['amount'].sum())
+    result['summary'] = {
+        'mode': mode,
+        'participants': len(rates),
+        'budget': budget,
+        'requested': round(float(result['requested'].sum()), 2),
+        'allocated': round(total_amount, 2),
+        'remaining': round(budget - total_amount, 2),
+        'funded_hours': round(float(result['hours'].sum()), 2),
+    }
+    return result
+
+
+def read_participants(rows: Iterable[Dict]):
+    """Country codes, hours and priorities (default 1) from participant records"""
+    countries, hours, priority = [], [], []
+    for row in rows:
+        countries.append(str(row['country']).upper())
+        hours.append(float(row['hours']))
+        priority.append(int(row.get('priority') or 1))
+    return countries, hours, priority
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Allocate a grant budget across event participants")
+    parser.add_argument('participants', help="CSV with country, hours and optional priority columns ('-' for stdin)")
+    parser.add_argument('--budget', type=float, required=True)
+    parser.add_argument('--mode', choices=MODES, default='proportional')
+    args = parser.parse_args(argv)
+
+    # Imported here to keep the library free of the CLI's table loading
+    from rates_cli import load_table
+
+    stream = sys.stdin if args.participants == '-' else open(args.participants, 'r', encoding='utf-8', newline='')
+    try:
+        countries, hours, priority = read_participants(csv.DictReader(stream))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    result = allocate_participants(load_table(), countries, hours, args.budget, args.mode, priority)
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(['country', 'rate', 'requested_hours', 'funded_hours', 'amount'])
+    for row in zip(countries, result['rate'].tolist(), hours, result['hours'].tolist(), result['amount'].tolist()):
+        writer.writerow([row[0], row[1], row[2], round(row[3], 2), row[4]])
+    print(result['summary'], file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,151 @@
-from flask import Flask, render_template, jsonify, request
-import pandas as pd
+from flask import Flask, Response, render_template, jsonify, request, send_file, stream_with_context
+from werkzeug.wsgi import wrap_file
 import os
-import json
+
+from allocation import MODES, allocate_participants, read_participants
+from country_groups import GROUP_DIMENSIONS
+from factor_cache import FactorCache
+from projection import MAX_HORIZON_YEARS, METHODS, MIN_TREND_YEARS, STEPS, RateProjector
+from rate_export import (EXPORT_FORMATS, export_columns, export_name, iter_csv, iter_ndjson, parquet_export,
+                         open_prebuilt, parse_include, program_rates)
+from rate_store import RATES_DB_PATH, SQLiteRateStore, rate_backend
+from rate_table import RECORD_FIELDS, SORT_COLUMNS, RateTable, decode_cursor, encode_cursor
+from relative_rates import RelativeRateMatrix
+from snapshot import SNAPSHOT_PATH, SharedSnapshot, SnapshotError, load_country_mapping
+from snapshot_diff import diff_snapshots, list_versions, load_version
+from snapshot_events import SnapshotBroadcaster
 
 app = Flask(__name__)
 
-def load_country_mapping():
+RATES_CSV_PATH = os.path.join('rates', 'rates.csv')
+# Largest page /api/rates returns; bulk consumers should follow cursors
+MAX_PER_PAGE = 500
+# 'snapshot' (in-memory tables) or 'sqlite' (rates/rates.db), from RATES_BACKEND
+RATES_BACKEND = rate_backend()
+
+_country_mapping = None
+# Mapped read-only and shared with the other workers; swapped when its generation changes
+_shared_snapshot = SharedSnapshot(SNAPSHOT_PATH)
+_table_state = {'key': None, 'table': None}
+_store = None
+# (store version, snapshot version) last reported as out of step
+_stale_store = {'versions': None}
+_relative_state = {'version': None, 'matrix': None}
+_projector_state = {'version': None, 'projector': None}
+# Diff results per (from, to) version pair; versions are content digests, so entries never go stale
+_diff_cache = FactorCache(maxsize=32)
+# Pushes snapshot version changes to /api/stream clients (poller thread starts on first use)
+_broadcaster = SnapshotBroadcaster(shared=_shared_snapshot)
+
+def get_country_mapping():
+    """Country mapping, loaded on first use"""
+    global _country_mapping
+    if _country_mapping is None:
+        _country_mapping = load_country_mapping()
+    return _country_mapping
+
+def get_snapshot():
+    """Current binary rates snapshot, remapped when a new generation is published. None if unavailable."""
     try:
-        with open('country_mapping.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading country mapping: {e}")
-        return {}
+        return _shared_snapshot.current()
+    except SnapshotError as e:
+        print(f"Error loading snapshot: {e}")
+        return None
+
+def warm_up():
+    """Load the serving data ahead of the first request (e.g. from a worker start hook)"""
+    table = load_rates_data()
+    if table is not None:
+        # Precompute the default sort order used by the dashboard
+        table.order('CountryName', True)
 
-COUNTRY_MAPPING = load_country_mapping()
+def get_store():
+    """SQLite rate store, opened on first use. None until the pipeline has published one."""
+    global _store
+    if _store is None and os.path.exists(RATES_DB_PATH):
+        _store = SQLiteRateStore(RATES_DB_PATH)
+    return _store
 
 # Load the rates data
 def load_rates_data():
+    """
+    Compact rate table for the current snapshot (or rates/rates.csv when no
+    snapshot exists). Rebuilt only when the underlying file changes. With the
+    SQLite backend, the store is queried instead of holding a table in memory.
+    """
+    snapshot = get_snapshot()
+    if RATES_BACKEND == 'sqlite':
+        store = get_store()
+        if store is not None:
+            # Never serve a store left behind by an older pipeline run
+            store_version = store.version
+            if snapshot is None or store_version == snapshot.version:
+                return store
+            if _stale_store['versions'] != (store_version, snapshot.version):
+                _stale_store['versions'] = (store_version, snapshot.version)
+                app.logger.warning(f"rates.db holds version {store_version}, snapshot is "
+                                   f"{snapshot.version}; serving the snapshot")
+    
     try:
-        csv_path = os.path.join('rates', 'rates.csv')
-        df = pd.read_csv(csv_path)
+        if snapshot is not None:
+            key = ('snapshot', snapshot.version, _shared_snapshot.generation)
+        else:
+            key = ('csv', os.stat(RATES_CSV_PATH).st_mtime_ns)
         
-        df['CountryName'] = df['CountryCode'].apply(lambda code: COUNTRY_MAPPING.get(code, {}).get('name', code))
-        df['CountryFlag'] = df['CountryCode'].apply(lambda code: COUNTRY_MAPPING.get(code, {}).get('flag', '🏳️'))
+        if _table_state['key'] != key:
+            if snapshot is not None:
+                table = RateTable.from_snapshot(snapshot)
+            else:
+                table = RateTable.from_csv(RATES_CSV_PATH, get_country_mapping())
+            _table_state['table'] = table
+            _table_state['key'] = key
         
-        return df
+        return _table_state['table']
     except Exception as e:
         print(f"Error loading data: {e}")
-        return pd.DataFrame()
+        return None
+
+def load_program_table():
+    """
+    Rate table for the grant program selected by the ``program`` query
+    parameter (the default program when absent). Returns (table, error response).
+    """
+    table = load_rates_data()
+    
+    if not table:
+        return None, (jsonify({'error': 'No data available'}), 500)
+    
+    program = request.args.get('program')
+    program_table = table.for_program(program)
+    
+    if program_table is None:
+        return None, (jsonify({'error': f'Unknown program: {program}'}), 400)
+    
+    return program_table, None
+
+def load_relative_matrix():
+    """Relative factor matrix for the current snapshot, or None if the snapshot has no indicators"""
+    snapshot = get_snapshot()
+    if snapshot is None or not snapshot.has_column('adjustment_factor'):
+        return None
+    
+    if _relative_state['version'] != snapshot.version:
+        _relative_state['matrix'] = RelativeRateMatrix.from_snapshot(snapshot)
+        _relative_state['version'] = snapshot.version
+    
+    return _relative_state['matrix']
+
+def load_projector():
+    """Rate projector for the current snapshot, or None if the snapshot has no indicators"""
+    snapshot = get_snapshot()
+    if snapshot is None or not snapshot.has_column('inflation'):
+        return None
+    
+    if _projector_state['version'] != snapshot.version:
+        _projector_state['projector'] = RateProjector.from_snapshot(snapshot)
+        _projector_state['version'] = snapshot.version
+    
+    return _projector_state['projector']
 
 @app.route('/')
 def index():
@@ -35,96 +153,382 @@ def index():
 
 @app.route('/api/rates')
 def get_rates():
-    df = load_rates_data()
+    table, error = load_program_table()
     
-    if df.empty:
-        return jsonify({'error': 'No data available'}), 500
+    if error:
+        return error
     
     search = request.args.get('search', '').lower()
     page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
+    # Capped server-side, whatever the client asks for
+    per_page = max(1, min(int(request.args.get('per_page', 20)), MAX_PER_PAGE))
     sort_by = request.args.get('sort_by', 'CountryName')
     sort_order = request.args.get('sort_order', 'asc')
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
     
-    if search:
-        df = df[
-            df['CountryCode'].str.lower().str.contains(search, na=False) |
-            df['CountryName'].str.lower().str.contains(search, na=False)
-        ]
+    if sort_by not in SORT_COLUMNS:
+        return jsonify({'error': f'Invalid sort_by: {sort_by}'}), 400
     
-    ascending = sort_order == 'asc'
-    df = df.sort_values(by=sort_by, ascending=ascending)
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in RECORD_FIELDS]
+        if unknown:
+            return jsonify({'error': f'Invalid fields: {", ".join(unknown)}'}), 400
+    else:
+        fields = None
     
-    total_records = len(df)
-    total_pages = (total_records + per_page - 1) // per_page
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    
-    paginated_df = df.iloc[start_idx:end_idx]
-    
-    rates_data = paginated_df.to_dict('records')
+    ascending = sort_order == 'asc'
     
-    return jsonify({
-        'data': rates_data,
-        'pagination': {
+    if cursor:
+        # Keyset pagination: the page after the cursor's row, stable across snapshot swaps
+        try:
+            after = decode_cursor(cursor, sort_by, ascending)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        positions, total_records = table.query(search, sort_by, ascending, per_page=per_page + 1, after=after)
+        has_next = len(positions) > per_page
+        positions = positions[:per_page]
+        pagination = {'per_page': per_page, 'total_records': total_records, 'has_next': has_next}
+    else:
+        positions, total_records = table.query(search, sort_by, ascending, page, per_page)
+        total_pages = (total_records + per_page - 1) // per_page
+        has_next = page < total_pages
+        pagination = {
             'current_page': page,
             'per_page': per_page,
             'total_pages': total_pages,
             'total_records': total_records,
-            'has_next': page < total_pages,
+            'has_next': has_next,
             'has_prev': page > 1
         }
+    
+    pagination['next_cursor'] = None
+    if has_next and positions:
+        last = table.records(positions[-1:], ['CountryCode', sort_by])[0]
+        pagination['next_cursor'] = encode_cursor(sort_by, ascending, last)
+    
+    return jsonify({
+        'data': table.records(positions, fields),
+        'pagination': pagination
     })
 
+@app.route('/api/rates/export')
+def export_rates():
+    fmt = request.args.get('format', 'csv')
+    program = request.args.get('program')
+    
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Invalid format: {fmt}'}), 400
+    
+    try:
+        include = parse_include(request.args.get('include'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return jsonify({'error': 'No data available'}), 500
+    
+    try:
+        rates = program_rates(snapshot, program)
+    except SnapshotError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        columns = export_columns(snapshot, include)
+    except SnapshotError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    download_name = export_name(snapshot, fmt, include)
+    if rates is not None:
+        download_name = download_name.replace(f'.{fmt}', f'-{program}.{fmt}')
+    
+    # Files on disk get sendfile, conditional requests and byte ranges
+    if fmt == 'parquet':
+        try:
+            path = parquet_export(snapshot, columns, include, rates, program if rates is not None else None)
+        except ImportError:
+            return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+        return send_file(os.path.abspath(path), mimetype=EXPORT_FORMATS[fmt], as_attachment=True,
+                         download_name=download_name, conditional=True)
+    
+    prebuilt = open_prebuilt(snapshot, fmt, include) if rates is None else None
+    if prebuilt is not None:
+        # Served from the verified open file (wsgi.file_wrapper, so sendfile where available),
+        # tagged with the snapshot version so a ranged resume (If-Range) never mixes versions
+        size = os.fstat(prebuilt.fileno()).st_size
+        response = Response(
+            wrap_file(request.environ, prebuilt),
+            mimetype=EXPORT_FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{download_name}"'},
+            direct_passthrough=True
+        )
+        response.content_length = size
+        response.set_etag(download_name)
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
+    
+    # Streamed in chunks straight from the snapshot
+    chunks = iter_csv if fmt == 'csv' else iter_ndjson
+    response = Response(
+        stream_with_context(chunks(snapshot, columns, rates)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
+    response.set_etag(download_name)
+    return response.make_conditional(request)
+
 @app.route('/api/stats')
 def get_stats():
-    df = load_rates_data()
+    table, error = load_program_table()
     
-    if df.empty:
-        return jsonify({'error': 'No data available'}), 500
+    if error:
+        return error
+    
+    group_by = request.args.get('group_by')
+    
+    if not group_by:
+        return jsonify(table.stats())
+    
+    if group_by not in GROUP_DIMENSIONS:
+        return jsonify({'error': f'Invalid group_by: {group_by}'}), 400
+    
+    # Precomputed when the snapshot was built
+    groups = table.group_stats(group_by)
     
-    stats = {
-        'total_countries': len(df),
-        'avg_rate': round(df['Rate'].mean(), 2),
-        'min_rate': round(df['Rate'].min(), 2),
-        'max_rate': round(df['Rate'].max(), 2),
-        'median_rate': round(df['Rate'].median(), 2)
-    }
+    if groups is None:
+        return jsonify({'error': 'No group statistics available for the current rates'}), 404
     
-    return jsonify(stats)
+    return jsonify({'group_by': group_by, 'groups': groups})
 
 @app.route('/api/countries')
 def get_countries():
-    df = load_rates_data()
+    table = load_rates_data()
     
-    if df.empty:
+    if not table:
         return jsonify({'error': 'No data available'}), 500
     
-    countries = []
-    for _, row in df.iterrows():
-        countries.append({
-            'code': row['CountryCode'],
-            'name': row['CountryName'],
-            'flag': row['CountryFlag']
-        })
-    
-    countries = sorted(countries, key=lambda x: x['name'])
+    countries = [
+        {'code': record['CountryCode'], 'name': record['CountryName'], 'flag': record['CountryFlag']}
+        for record in table.records(table.order('CountryName', True))
+    ]
     
     return jsonify(countries)
 
+@app.route('/api/programs')
+def get_programs():
+    table = load_rates_data()
+    
+    if not table:
+        return jsonify({'error': 'No data available'}), 500
+    
+    return jsonify(table.programs())
+
 @app.route('/api/country/<country_code>')
 def get_country_rate(country_code):
-    df = load_rates_data()
+    table, error = load_program_table()
     
-    if df.empty:
+    if error:
+        return error
+    
+    position = table.lookup(country_code)
+    
+    if position is None:
+        return jsonify({'error': 'Country not found'}), 404
+    
+    return jsonify(table.record(position))
+
+@app.route('/api/country/<country_code>/explain')
+def explain_country_rate(country_code):
+    table = load_rates_data()
+    
+    if not table:
         return jsonify({'error': 'No data available'}), 500
     
-    country_data = df[df['CountryCode'].str.upper() == country_code.upper()]
+    position = table.lookup(country_code)
     
-    if country_data.empty:
+    if position is None:
         return jsonify({'error': 'Country not found'}), 404
     
-    return jsonify(country_data.iloc[0].to_dict())
+    explanation = table.explain(position)
+    
+    if explanation is None:
+        return jsonify({'error': 'No explanation available for the current rates'}), 404
+    
+    return jsonify(explanation)
+
+@app.route('/api/country/<country_code>/projection')
+def get_country_projection(country_code):
+    table, error = load_program_table()
+    
+    if error:
+        return error
+    
+    projector = load_projector()
+    
+    if projector is None:
+        return jsonify({'error': 'No projection data available for the current rates'}), 404
+    
+    method = request.args.get('method', 'latest')
+    step = request.args.get('step', 'year')
+    
+    try:
+        horizon = int(request.args.get('horizon', 5))
+    except ValueError:
+        return jsonify({'error': f"Invalid horizon: {request.args.get('horizon')}"}), 400
+    
+    if method not in METHODS:
+        return jsonify({'error': f'Invalid method: {method}'}), 400
+    if step not in STEPS:
+        return jsonify({'error': f'Invalid step: {step}'}), 400
+    if not 1 <= horizon <= MAX_HORIZON_YEARS * STEPS[step]:
+        return jsonify({'error': f'Invalid horizon: {horizon}'}), 400
+    
+    position = table.lookup(country_code)
+    
+    if position is None:
+        return jsonify({'error': 'Country not found'}), 404
+    
+    record = table.record(position)
+    projector_position = projector.position(record['CountryCode'])
+    
+    # The trend needs MIN_TREND_YEARS of history; say so rather than quietly projecting 'latest'
+    method_applied = method
+    if method == 'trend':
+        trended = projector.trended()
+        if not trended.any():
+            return jsonify({'error': f'Trend projection needs {MIN_TREND_YEARS} years of inflation '
+                                     f'history; the current rates have {len(projector.years)}'}), 400
+        if not trended[projector_position]:
+            method_applied = 'latest'
+            record['notice'] = (f'Fewer than {MIN_TREND_YEARS} years of inflation history for this '
+                                f'country; projected at its latest inflation')
+    
+    record.update({
+        'method': method,
+        'method_applied': method_applied,
+        'step': step,
+        'horizon': horizon,
+        'projection': projector.project_country(
+            projector_position, record['Rate'], method, step, horizon
+        )
+    })
+    return jsonify(record)
+
+@app.route('/api/relative')
+def get_relative_rates():
+    matrix = load_relative_matrix()
+    
+    if matrix is None:
+        return jsonify({'error': 'No data available'}), 500
+    
+    reference = request.args.get('from', '')
+    recipient = request.args.get('to')
+    
+    if matrix.position(reference) is None:
+        return jsonify({'error': f'Unknown reference country: {reference}'}), 404
+    
+    if recipient is not None:
+        if matrix.position(recipient) is None:
+            return jsonify({'error': f'Unknown recipient country: {recipient}'}), 404
+        return jsonify({
+            'from': reference.upper(),
+            'to': recipient.upper(),
+            'factor': matrix.factor(reference, recipient),
+            'Rate': matrix.rate(reference, recipient)
+        })
+    
+    # Whole reference column: every recipient relative to one funding country
+    factors = matrix.column(reference).tolist()
+    return jsonify({
+        'from': reference.upper(),
+        # Recipients held at the factor bounds rather than priced by the formula
+        'clipped': matrix.clipped(reference),
+        'data': [
+            {'CountryCode': code, 'factor': factor, 'Rate': round(matrix.base_rate * factor, 2)}
+            for code, factor in zip(matrix.codes, factors)
+        ]
+    })
+
+@app.route('/api/allocate', methods=['POST'])
+def allocate_budget():
+    table, error = load_program_table()
+    
+    if error:
+        return error
+    
+    payload = request.get_json(silent=True) or {}
+    mode = payload.get('mode', 'proportional')
+    
+    if mode not in MODES:
+        return jsonify({'error': f'Invalid mode: {mode}'}), 400
+    
+    try:
+        budget = float(payload['budget'])
+        countries, hours, priority = read_participants(payload.get('participants', []))
+        result = allocate_participants(table, countries, hours, budget, mode, priority)
+    except KeyError as e:
+        # Missing field, or unknown country codes
+        return jsonify({'error': f'Invalid request: {e.args[0]}'}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    allocations = [
+        {'country': country, 'rate': rate, 'requested_hours': requested,
+         'funded_hours': round(funded, 2), 'amount': amount}
+        for country, rate, requested, funded, amount in zip(
+            countries, result['rate'].tolist(), hours, result['hours'].tolist(), result['amount'].tolist()
+        )
+    ]
+    
+    return jsonify({'summary': result['summary'], 'allocations': allocations})
+
+@app.route('/api/versions')
+def get_versions():
+    snapshot = get_snapshot()
+    return jsonify({
+        'current': snapshot.version if snapshot is not None else None,
+        'versions': list_versions()
+    })
+
+@app.route('/api/diff')
+def get_diff():
+    from_version = request.args.get('from')
+    to_version = request.args.get('to', 'current')
+    
+    if not from_version:
+        return jsonify({'error': 'Missing from version'}), 400
+    
+    def resolve(version):
+        if version == 'current':
+            snapshot = get_snapshot()
+            if snapshot is None:
+                raise SnapshotError("No current snapshot")
+            return snapshot
+        return load_version(version)
+    
+    try:
+        old, new = resolve(from_version), resolve(to_version)
+        diff = _diff_cache.get_or_compute(None, (old.version, new.version),
+                                          lambda: diff_snapshots(old, new))
+    except SnapshotError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    return jsonify(diff)
+
+@app.route('/api/stream')
+def stream_updates():
+    include_delta = request.args.get('delta', '').lower() in ('1', 'true', 'yes')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    
+    return Response(
+        stream_with_context(_broadcaster.stream(include_delta, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 if __name__ == '__main__':
-    app.run(port=8080, host='0.0.0.0')
\ No newline at end of file
+    # Development server only: each /api/stream client pins a thread here.
+    # Serve with gevent workers instead: gunicorn -c gunicorn.conf.py app:app
+    warm_up()
+    app.run(port=8080, host='0.0.0.0')
@@ -0,0 +1,293 @@
+"""
+Weight calibration for the EconomicRateCalculator blend
+
+Fits the indicator weights, the inflation boost cap and the adjustment factor
+bounds so the calculator reproduces a table of reference rates, optionally
+combined with a fairness term that penalises unequal purchasing power between
+countries.
+
+The objective is evaluated in closed form over the merged indicator matrix and
+its gradient is derived analytically (sub-gradients at the clipping points), so
+a few thousand projected Adam steps run in a fraction of a second. Fitted
+parameters are written as a new versioned config next to config.json; the
+active config is never overwritten.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from core_algo import EconomicRateCalculator, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Parameter vector layout: weights (ppp, inflation, coli), inflation cap, factor bounds
+PARAMETERS = ('ppp', 'inflation', 'coli', 'inflation_cap', 'lower_bound', 'upper_bound')
+INFLATION_SENSITIVITY = 0.1
+
+# Feasible ranges for the non-weight parameters
+CAP_RANGE = (0.0, 0.5)
+BOUND_RANGE = (0.05, 2.0)
+MIN_BOUND_GAP = 0.05
+
+
+def _project(theta: np.ndarray) -> np.ndarray:
+    """Project parameters onto the feasible set: weights on the simplex, limits in range"""
+    w_ppp, w_inf, w_coli, cap, lower, upper = theta.tolist()
+
+    # Euclidean projection of the three weights onto {w >= 0, sum(w) = 1}
+    weights = [w_ppp, w_inf, w_coli]
+    ordered = sorted(weights, reverse=True)
+    shift, running = 0.0, 0.0
+    for k, value in enumerate(ordered, start=1):
+        running += value
+        if value - (running - 1.0) / k > 0:
+            shift = (running - 1.0) / k
+    w_ppp, w_inf, w_coli = (max(w - shift, 0.0) for w in weights)
+
+    cap = min(max(cap, CAP_RANGE[0]), CAP_RANGE[1])
+    lower = min(max(lower, BOUND_RANGE[0]), BOUND_RANGE[1] - MIN_BOUND_GAP)
+    upper = min(max(upper, lower + MIN_BOUND_GAP), BOUND_RANGE[1])
+    return np.array([w_ppp, w_inf, w_coli, cap, lower, upper])
+
+
+class CalibrationProblem:
+    """
+    Rate model and objective over a fixed indicator matrix
+    """
+
+    def __init__(self, calculator: EconomicRateCalculator, targets: Optional[pd.Series] = None,
+                 fairness_weight: float = 0.0):
+        if calculator.merged_data is None:
+            raise ValueError("No merged data available. Call merge_datasets() first.")
+
+        merged = calculator.merged_data
+        # The USA is pinned to the base rate and carries no information
+        merged = merged[merged['country_code'] != 'USA']
+
+        # A single missing indicator makes the loss and gradient NaN, and Adam
+        # would then return NaN parameters
+        indicators = merged[['ppp', 'inflation', 'coli']].to_numpy(dtype=float)
+        usable = np.isfinite(indicators).all(axis=1) & (indicators[:, 0] > 0)
+        if not usable.all():
+            dropped = merged['country_code'][~usable].tolist()
+            logger.warning(f"Calibrating without {len(dropped)} countries with missing or invalid "
+                           f"indicators: {', '.join(dropped[:10])}{' ...' if len(dropped) > 10 else ''}")
+            merged = merged[usable]
+        self.dropped = int((~usable).sum())
+        if merged.empty:
+            raise ValueError("No countries with complete indicators to calibrate on")
+
+        # One parameter set for the problem and the starting point
+        self.params = calculator.parameters()
+        self.base_rate = self.params['base_rate']
+        self.fairness_weight = fairness_weight
+        self.target = None
+        self.target_index = None
+
+        if targets is not None:
+            aligned = merged['country_code'].map(targets).to_numpy(dtype=float)
+            has_target = np.isfinite(aligned)
+            if not has_target.any():
+                raise ValueError("None of the target countries have complete indicator data")
+            if fairness_weight <= 0:
+                # Only the target countries enter the objective
+                merged = merged[has_target]
+                aligned = aligned[has_target]
+                has_target = np.ones(len(merged), dtype=bool)
+            self.target = aligned[has_target]
+            self.target_index = np.nonzero(has_target)[0]
+        elif fairness_weight <= 0:
+            raise ValueError("Calibration needs target rates, a fairness weight, or both")
+
+        self.codes = merged['country_code'].to_numpy()
+        self.ppp_factor = merged['ppp'].to_numpy(dtype=float) / self.params['usa_ppp']
+        self.coli_factor = merged['coli'].to_numpy(dtype=float) / self.params['usa_coli']
+        inflation_ratio = merged['inflation'].to_numpy(dtype=float) / self.params['usa_inflation']
+        self.inflation_boost = (inflation_ratio - 1.0) * INFLATION_SENSITIVITY
+        self.fairness_scale = self.base_rate * self.ppp_factor
+
+    def rates(self, theta: np.ndarray) -> np.ndarray:
+        w_ppp, w_inf, w_coli, cap, lower, upper = theta
+        inflation_factor = 1.0 + np.minimum(self.inflation_boost, cap)
+        combined = w_ppp * self.ppp_factor + w_inf * inflation_factor + w_coli * self.coli_factor
+        return self.base_rate * np.clip(combined, lower, upper)
+
+    def loss_and_gradient(self, theta: np.ndarray):
+        """Objective value and its analytic gradient with respect to theta"""
+        w_ppp, w_inf, w_coli, cap, lower, upper = theta.tolist()
+
+        capped = self.inflation_boost > cap
+        inflation_factor = 1.0 + np.minimum(self.inflation_boost, cap)
+        combined = w_ppp * self.ppp_factor + w_inf * inflation_factor + w_coli * self.coli_factor
+        below = combined <= lower
+        above = combined >= upper
+        rates = self.base_rate * np.minimum(np.maximum(combined, lower), upper)
+
+        # d loss / d rate for every country
+        loss = 0.0
+        rate_gradient = np.zeros(len(rates))
+
+        if self.target is not None:
+            residual = rates[self.target_index] - self.target
+            loss += float(residual @ residual) / len(residual)
+            rate_gradient[self.target_index] += 2.0 * residual / len(residual)
+
+        if self.fairness_weight > 0:
+            # Dispersion of the rate in purchasing-power terms across countries
+            equalised = rates / self.fairness_scale
+            deviation = equalised - equalised.sum() / len(equalised)
+            loss += self.fairness_weight * float(deviation @ deviation) / len(rates)
+            rate_gradient += self.fairness_weight * 2.0 * deviation / (len(rates) * self.fairness_scale)
+
+        # Chain rule through the clip: weights and cap act inside the bounds,
+        # each bound acts on the countries clipped to it
+        rate_gradient *= self.base_rate
+        inside_gradient = np.where(below | above, 0.0, rate_gradient)
+        gradient = np.array([
+            inside_gradient @ self.ppp_factor,
+            inside_gradient @ inflation_factor,
+            inside_gradient @ self.coli_factor,
+            w_inf * inside_gradient[capped].sum(),
+            rate_gradient[below].sum(),
+            rate_gradient[above].sum(),
+        ])
+        return loss, gradient
+
+
+def calibrate(calculator: EconomicRateCalculator, targets: Optional[pd.Series] = None,
+              fairness_weight: float = 0.0, iterations: int = 3000,
+              learning_rate: float = 0.01, tolerance: float = 1e-12) -> Dict:
+    """
+    Fit weights, inflation cap and factor bounds with projected Adam, starting
+    from the calculator's current parameters. Returns the fitted parameters and
+    fit diagnostics.
+    """
+    problem = CalibrationProblem(calculator, targets, fairness_weight)
+
+    params = problem.params
+    theta = _project(np.array([
+        params['weights']['ppp'], params['weights']['inflation'], params['weights']['coli'],
+        params['inflation_cap'], params['factor_bounds'][0], params['factor_bounds'][1]
+    ], dtype=float))
+    initial_loss, _ = problem.loss_and_gradient(theta)
+
+    first_moment = np.zeros_like(theta)
+    second_moment = np.zeros_like(theta)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    best_theta, best_loss = theta, initial_loss
+    previous_loss = np.inf
+
+    step = 0
+    for step in range(1, iterations + 1):
+        loss, gradient = problem.loss_and_gradient(theta)
+        if loss < best_loss:
+            best_theta, best_loss = theta, loss
+        if abs(previous_loss - loss) < tolerance:
+            break
+        previous_loss = loss
+
+        # Keep weight updates on the simplex plane (their sum is fixed at 1)
+        gradient[:3] -= (gradient[0] + gradient[1] + gradient[2]) / 3.0
+
+        first_moment = beta1 * first_moment + (1 - beta1) * gradient
+        second_moment = beta2 * second_moment + (1 - beta2) * gradient * gradient
+        step_size = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+        theta = _project(theta - step_size * first_moment / (np.sqrt(second_moment) + eps))
+
+    logger.info(f"Calibration finished after {step} iterations: loss {initial_loss:.6f} -> {best_loss:.6f}")
+
+    result = {
+        'weights': {name: round(float(value), 6) for name, value in zip(PARAMETERS[:3], best_theta[:3])},
+        'inflation_cap': round(float(best_theta[3]), 6),
+        'factor_bounds': [round(float(best_theta[4]), 6), round(float(best_theta[5]), 6)],
+        'calibration': {
+            'initial_loss': float(initial_loss),
+            'final_loss': float(best_loss),
+            'iterations': step,
+            'fairness_weight': fairness_weight,
+            'target_countries': len(problem.target) if problem.target is not None else 0,
+            'dropped_countries': problem.dropped,
+        }
+    }
+    if problem.target is not None:
+        residual = problem.rates(best_theta)[problem.target_index] - problem.target
+        result['calibration']['rmse'] = float(np.sqrt(np.mean(residual ** 2)))
+    return result
+
+
+def load_targets(targets_path: str) -> pd.Series:
+    """Reference rates table with CountryCode and Rate columns"""
+    targets = pd.read_csv(targets_path)
+    return targets.set_index('CountryCode')['Rate'].astype(float)
+
+
+def write_versioned_config(fitted: Dict, config_path: str = "config.json") -> str:
+    """
+    Write fitted parameters as config.v<N>.json next to the active config,
+    carrying over its other settings. Returns the new file's path.
+    """
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+
+    directory = os.path.dirname(config_path) or '.'
+    stem, ext = os.path.splitext(os.path.basename(config_path))
+    pattern = re.compile(rf'^{re.escape(stem)}\.v(\d+){re.escape(ext)}$')
+    versions = [int(m.group(1)) for m in
+                (pattern.match(os.path.basename(p)) for p in glob.glob(os.path.join(directory, f'{stem}.v*{ext}')))
+                if m]
+    version = max(versions, default=0) + 1
+
+    config.update({
+        'weights': fitted['weights'],
+        'inflation_cap': fitted['inflation_cap'],
+        'factor_bounds': fitted['factor_bounds'],
+        'calibration': dict(fitted['calibration'], version=version,
+                            fitted_at=datetime.now(timezone.utc).isoformat(),
+                            based_on=os.path.basename(config_path)),
+    })
+
+    output_path = os.path.join(directory, f'{stem}.v{version}{ext}')
+    with open(output_path, 'w') as f:
+        json.dump(config, f, indent=4)
+    logger.info(f"Calibrated config saved to {output_path}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the rate calculator's weights and limits")
+    parser.add_argument('--targets', help="CSV of reference rates (CountryCode, Rate)")
+    parser.add_argument('--fairness', type=float, default=0.0,
+                        help="Weight of the purchasing-power fairness term")
+    parser.add_argument('--iterations', type=int, default=3000)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--config', default="config.json")
+    args = parser.parse_args()
+
+    configure_logging()
+
+    calculator = EconomicRateCalculator(args.config)
+    calculator.load_economic_data()
+    calculator.merge_datasets()
+    calculator.fill_missing_data()
+
+    targets = load_targets(args.targets) if args.targets else None
+    fitted = calibrate(calculator, targets, args.fairness, args.iterations, args.learning_rate)
+    write_versioned_config(fitted, args.config)
+
+    print(json.dumps(fitted, indent=2))
+
+
+if __name__ == "__main__":
+    main()
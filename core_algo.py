@@ -9,19 +9,423 @@ This algorithm calculates fair grant rates for different countries based on thei
 The algorithm uses weighted economic theory to ensure fair distribution based on economic conditions.
 """
 
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+
+import argparse
+import hashlib
 import json
 import os
 import logging
+import threading
+import time
+from types import MappingProxyType
 from typing import Dict, Tuple, Optional
 import warnings
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from country_groups import GROUP_DIMENSIONS, build_group_cube, group_labels, load_country_groups
+from imputation import DEFAULT_NEIGHBOURS, knn_impute
+from lazy_import import lazy_module
+from pipeline_trace import PipelineTracer
+from rate_store import RATES_DB_PATH, publish_snapshot
+from screening import DEFAULT_SCREENING, POLICIES, SCALES, clip_values, column_report, screen_column
+from snapshot import SNAPSHOT_PATH, build_rates_snapshot, read_snapshot
+from snapshot_diff import archive_snapshot
+
+# pandas/numpy are imported on first use, so single-country lookups stay light
+pd = lazy_module('pandas')
+np = lazy_module('numpy')
+
 logger = logging.getLogger(__name__)
 
-warnings.filterwarnings('ignore', category=FutureWarning)
+# Machine-readable run reports, written next to rates/rates.csv
+RUN_REPORT_PATH = os.path.join('rates', 'run_report.json')
+RUN_HISTORY_PATH = os.path.join('rates', 'run_history.jsonl')
+EXPLANATIONS_PATH = os.path.join('rates', 'explanations.csv')
+QUALITY_REPORT_PATH = os.path.join('rates', 'quality_report.json')
+PROGRAM_RATES_PATH = os.path.join('rates', 'program_rates.csv')
+
+# Program whose rates are published in rates/rates.csv (config.json's base_rate)
+DEFAULT_PROGRAM = 'default'
+
+# Per-country breakdown stored with the rates: column -> snapshot column kind.
+# Years use 0 for unknown; clipped is 0 (inside bounds), 1 (lower) or 2 (upper).
+EXPLANATION_COLUMNS = {
+    'ppp': 'f64',
+    'inflation': 'f64',
+    'coli': 'f64',
+    'ppp_factor': 'f64',
+    'inflation_factor': 'f64',
+    'coli_factor': 'f64',
+    'ppp_contribution': 'f64',
+    'inflation_contribution': 'f64',
+    'coli_contribution': 'f64',
+    'combined_factor': 'f64',
+    'adjustment_factor': 'f64',
+    'clipped': 'u8',
+    'inflation_capped': 'u8',
+    'inflation_imputed': 'u8',
+    'coli_imputed': 'u8',
+    'pinned': 'u8',
+    'ppp_year': 'u32',
+    'inflation_year': 'u32',
+}
+
+DEFAULT_WEIGHTS = {
+    'ppp': 0.5,        # 50% - Primary purchasing power consideration
+    'inflation': 0.25,  # 25% - Economic stability factor
+    'coli': 0.25       # 25% - Living cost adjustment
+}
+
+# How missing COLI is estimated: the PPP power curve, or k nearest neighbours
+DEFAULT_IMPUTATION = {
+    'coli': 'curve',
+    'neighbours': DEFAULT_NEIGHBOURS,
+    'same_region': False
+}
+
+# Maximum inflation buffer, and bounds on the final adjustment factor
+DEFAULT_INFLATION_CAP = 0.1
+DEFAULT_FACTOR_BOUNDS = (0.2, 1.2)
+
+# How often config.json is re-checked
+CONFIG_CHECK_INTERVAL = 1.0
+
+# Per-year inflation values (optional), kept for rate projections
+INFLATION_HISTORY_PATH = 'final_data/INFLATION_HISTORY.csv'
+
+# Files whose contents determine the published rates and snapshot
+INPUT_FILES = ('final_data/PPP.csv', 'final_data/INFLATION.csv', 'final_data/COLI.csv',
+               INFLATION_HISTORY_PATH)
+
+
+def write_csv_atomic(df: pd.DataFrame, path: str) -> Dict:
+    """
+    Write a DataFrame as CSV through a temporary file renamed into place, so
+    readers never see a partial file. Returns the written file's signature
+    (size, mtime_ns, inode), which identifies it even if the path is later
+    rewritten.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        df.to_csv(tmp_path, index=False)
+        stat = os.stat(tmp_path)
+        os.replace(tmp_path, path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Configure logging and warning filters for command-line pipeline runs"""
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
+    warnings.filterwarnings('ignore', category=FutureWarning)
+
+
+def compute_input_fingerprint(config_path: str = "config.json") -> str:
+    """Digest of the indicator files and config, used to skip unchanged recomputes"""
+    digest = hashlib.sha1()
+    for path in INPUT_FILES + (config_path,):
+        digest.update(path.encode('utf-8'))
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b'<missing>')
+    return digest.hexdigest()[:16]
+
+
+def _file_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def adjustment_components(ppp, inflation, coli, weights: Dict[str, float],
+                          usa_ppp: float, usa_inflation: float, usa_coli: float,
+                          inflation_cap: float = DEFAULT_INFLATION_CAP,
+                          factor_bounds: Tuple[float, float] = DEFAULT_FACTOR_BOUNDS) -> Dict:
+    """
+    Vectorised form of compute_adjustment_factor, returning every
+    intermediate term of the formula.
+    
+    Accepts scalars or numpy arrays of any (broadcastable) shape, so the same
+    formula serves whole countries x samples matrices.
+    """
+    ppp_factor = np.asarray(ppp, dtype=float) / usa_ppp
+    
+    inflation_ratio = np.asarray(inflation, dtype=float) / usa_inflation
+    inflation_boost = (inflation_ratio - 1.0) * 0.1
+    inflation_factor = 1.0 + np.minimum(inflation_boost, inflation_cap)
+    
+    coli_factor = np.asarray(coli, dtype=float) / usa_coli
+    
+    ppp_contribution = weights['ppp'] * ppp_factor
+    inflation_contribution = weights['inflation'] * inflation_factor
+    coli_contribution = weights['coli'] * coli_factor
+    combined_factor = ppp_contribution + inflation_contribution + coli_contribution
+    
+    lower_bound, upper_bound = factor_bounds
+    return {
+        'ppp_factor': ppp_factor,
+        'inflation_factor': inflation_factor,
+        'coli_factor': coli_factor,
+        'ppp_contribution': ppp_contribution,
+        'inflation_contribution': inflation_contribution,
+        'coli_contribution': coli_contribution,
+        'combined_factor': combined_factor,
+        'adjustment_factor': np.clip(combined_factor, lower_bound, upper_bound),
+        'inflation_capped': inflation_boost > inflation_cap,
+        # 0: inside the bounds, 1: raised to the lower bound, 2: cut to the upper bound
+        'clipped': np.where(combined_factor > upper_bound, 2, np.where(combined_factor < lower_bound, 1, 0)),
+    }
+
+
+def adjustment_factors(ppp, inflation, coli, weights: Dict[str, float],
+                       usa_ppp: float, usa_inflation: float, usa_coli: float,
+                       inflation_cap: float = DEFAULT_INFLATION_CAP,
+                       factor_bounds: Tuple[float, float] = DEFAULT_FACTOR_BOUNDS):
+    """Vectorised adjustment factors (see adjustment_components)"""
+    return adjustment_components(
+        ppp, inflation, coli, weights, usa_ppp, usa_inflation, usa_coli,
+        inflation_cap, factor_bounds
+    )['adjustment_factor']
+
+
+def round_rates(values) -> list:
+    """Round rates to cents with Python's round, exactly as the per-country path does"""
+    return [round(value, 2) for value in np.asarray(values, dtype=float).ravel().tolist()]
+
+
+def program_rate_matrix(factors, programs: Dict[str, Dict], pinned=None):
+    """
+    Rates for every program and country from one adjustment factor vector.
+    
+    Returns a (programs x countries) array: each program's base rate times the
+    factors, rounded to cents and limited to the program's rate floor/cap.
+    Pinned countries (the USA) and countries without a factor get the base rate.
+    """
+    factors = np.asarray(factors, dtype=float)
+    bases = np.array([program['base_rate'] for program in programs.values()], dtype=float)
+    
+    rates = np.array(round_rates(np.multiply.outer(bases, factors))).reshape(len(bases), len(factors))
+    
+    fallback = np.isnan(factors)
+    if pinned is not None:
+        fallback |= np.asarray(pinned, dtype=bool)
+    rates[:, fallback] = bases[:, None]
+    
+    floors = np.array([program.get('rate_floor') or -np.inf for program in programs.values()])
+    caps = np.array([program.get('rate_cap') or np.inf for program in programs.values()])
+    return np.clip(rates, floors[:, None], caps[:, None])
+
+
+def parameters_fingerprint(params: Dict) -> Tuple:
+    """Hashable form of a parameter set (see EconomicRateCalculator.parameters)"""
+    return (
+        params['base_rate'],
+        tuple(sorted(params['weights'].items())),
+        params['inflation_cap'],
+        tuple(params['factor_bounds']),
+        params['usa_ppp'],
+        params['usa_inflation'],
+        params['usa_coli']
+    )
+
+
+def scenario_parameters(params: Dict, overrides: Optional[Dict] = None) -> Dict:
+    """
+    Copy of a parameter set with scenario overrides applied: base_rate,
+    weights (merged over the current ones), inflation_cap, factor_bounds
+    and programs. Raises ValueError for anything else.
+    """
+    overrides = overrides or {}
+    unknown = set(overrides) - {'base_rate', 'weights', 'inflation_cap', 'factor_bounds', 'programs'}
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+    
+    scenario = dict(params, weights=dict(params['weights']))
+    scenario.update({key: value for key, value in overrides.items() if key != 'weights'})
+    scenario['weights'].update(overrides.get('weights', {}))
+    scenario['factor_bounds'] = tuple(scenario['factor_bounds'])
+    return scenario
+
+
+def fill_missing_columns(ppp: np.ndarray, inflation: np.ndarray, coli: np.ndarray,
+                         inflation_median: float, usa_coli: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Copies of the inflation and COLI arrays with missing values filled in:
+    the median inflation, and COLI estimated from PPP. Only the missing COLI
+    values are estimated, one at a time on Python floats, so they match
+    estimate_coli exactly.
+    """
+    inflation = np.array(inflation, dtype=float)
+    inflation[np.isnan(inflation)] = inflation_median
+    coli = np.array(coli, dtype=float)
+    for i in np.flatnonzero(np.isnan(coli)).tolist():
+        coli[i] = estimate_coli(float(ppp[i]), usa_coli)
+    return inflation, coli
+
+
+def estimate_coli(ppp: float, usa_coli: float) -> float:
+    """COLI estimated from PPP, for countries without a COLI value"""
+    # Countries with higher PPP typically have higher COLI
+    # Use regression-based estimation
+    estimated_coli = usa_coli * (ppp ** 0.7)  # Power relationship
+    return max(50, min(200, estimated_coli))  # Bound between reasonable limits
+
+
+def compute_adjustment_factor(ppp: float, inflation: float, coli: float, params: Dict) -> float:
+    """
+    CORRECTED VERSION:
+    - Lower PPP = LOWER dollar amount (but equal purchasing power)
+    - Lower COLI = LOWER dollar amount (but equal purchasing power)
+    - Higher inflation = SMALL buffer increase
+    """
+    weights = params['weights']
+    
+    # PPP Factor: DIRECT relationship now
+    # Pakistan PPP=0.3 → factor=0.3 → $50 * 0.3 = $15
+    ppp_factor = ppp / params['usa_ppp']  # This gives us the right scaling
+    
+    # Inflation Factor: Small buffer for volatile economies
+    # But don't overdo it - maybe 10% max boost for high inflation
+    inflation_ratio = inflation / params['usa_inflation']
+    inflation_factor = 1.0 + min((inflation_ratio - 1.0) * 0.1, params['inflation_cap'])  # Max 10% boost by default
+    
+    # COLI Factor: DIRECT relationship  
+    # Lower COLI = lower costs = lower grant needed
+    coli_factor = coli / params['usa_coli']
+    
+    # Weighted combination - ALL factors now reduce the rate for developing economies
+    combined_factor = (
+        weights['ppp'] * ppp_factor +
+        weights['inflation'] * inflation_factor +
+        weights['coli'] * coli_factor
+    )
+    
+    # Final adjustment - this should be LESS than 1 for developing countries
+    adjustment_factor = combined_factor
+    
+    # Apply reasonable bounds (by default, don't go below 20% of US rate)
+    lower_bound, upper_bound = params['factor_bounds']
+    adjustment_factor = max(lower_bound, min(upper_bound, adjustment_factor))
+    
+    return adjustment_factor
+
+
+class PreparedInputs:
+    """
+    Loaded, merged and imputed indicators as read-only arrays, one entry per
+    country in merge order. Never modified after construction, so a single
+    instance can be shared by any number of threads or tasks evaluating
+    scenarios.
+    """
+    
+    __slots__ = ('country_codes', 'ppp', 'inflation', 'coli', 'inflation_imputed', 'coli_imputed',
+                 'ppp_year', 'inflation_year', 'fingerprint', '_index')
+    
+    def __init__(self, country_codes, ppp, inflation, coli, inflation_imputed, coli_imputed,
+                 ppp_year, inflation_year, fingerprint: Optional[str] = None):
+        arrays = {
+            'country_codes': np.array(country_codes, dtype=object),
+            'ppp': np.array(ppp, dtype=float),
+            'inflation': np.array(inflation, dtype=float),
+            'coli': np.array(coli, dtype=float),
+            'inflation_imputed': np.array(inflation_imputed, dtype=bool),
+            'coli_imputed': np.array(coli_imputed, dtype=bool),
+            # NaN where the source year is unknown
+            'ppp_year': np.array(ppp_year, dtype=float),
+            'inflation_year': np.array(inflation_year, dtype=float),
+        }
+        for name, values in arrays.items():
+            values.flags.writeable = False
+            object.__setattr__(self, name, values)
+        object.__setattr__(self, 'fingerprint', fingerprint)
+        object.__setattr__(self, '_index', MappingProxyType(
+            {code: position for position, code in enumerate(arrays['country_codes'].tolist())}
+        ))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("PreparedInputs is immutable")
+    
+    @classmethod
+    def from_frame(cls, merged: pd.DataFrame, fingerprint: Optional[str] = None) -> 'PreparedInputs':
+        """Prepared inputs from a merged (normally filled) dataset; the frame is copied, not referenced"""
+        rows = len(merged)
+        
+        def column(name, default):
+            return merged[name].to_numpy() if name in merged else np.full(rows, default)
+        
+        return cls(
+            merged['country_code'].to_numpy(),
+            merged['ppp'].to_numpy(dtype=float),
+            merged['inflation'].to_numpy(dtype=float),
+            merged['coli'].to_numpy(dtype=float),
+            column('inflation_imputed', False),
+            column('coli_imputed', False),
+            column('ppp_year', np.nan),
+            column('inflation_year', np.nan),
+            fingerprint
+        )
+    
+    def __len__(self) -> int:
+        return len(self.country_codes)
+    
+    def position(self, country_code: str) -> Optional[int]:
+        """Row of a country, or None if it has no data"""
+        return self._index.get(country_code)
+
+
+def compute_rate_components(inputs: PreparedInputs, params: Dict) -> pd.DataFrame:
+    """
+    Per-country rates together with the factors, weighted contributions,
+    clipping, imputation and source years that produced them. Pure: the
+    result depends only on the inputs and the parameter set.
+    """
+    components = adjustment_components(
+        inputs.ppp, inputs.inflation, inputs.coli,
+        params['weights'], params['usa_ppp'], params['usa_inflation'], params['usa_coli'],
+        params['inflation_cap'], params['factor_bounds']
+    )
+    
+    # Columns are copies; the prepared arrays stay read-only and shared
+    result = pd.DataFrame({'country_code': inputs.country_codes.copy()})
+    for column in ('ppp', 'inflation', 'coli'):
+        result[column] = getattr(inputs, column).copy()
+    for column, values in components.items():
+        result[column] = values
+    for column in ('inflation_imputed', 'coli_imputed', 'ppp_year', 'inflation_year'):
+        result[column] = getattr(inputs, column).copy()
+        
+    # Round each rate to cents (Python round on the float)
+    base_rate = params['base_rate']
+    result['rate'] = round_rates(base_rate * components['adjustment_factor'])
+    
+    # Special case: USA gets exact base rate
+    result['pinned'] = result['country_code'] == 'USA'
+    result.loc[result['pinned'], 'rate'] = base_rate
+    
+    failed = result['rate'].isna() & ~result['pinned']
+    for country_code in result.loc[failed, 'country_code']:
+        logger.error(f"Error calculating rate for {country_code}: missing indicator values")
+    # Use base rate as fallback
+    result.loc[failed, 'rate'] = base_rate
+    
+    return result
+
+
+def compute_program_rates(components: pd.DataFrame, programs: Dict[str, Dict]) -> pd.DataFrame:
+    """Rates for every program, one column per program, from compute_rate_components() output"""
+    matrix = program_rate_matrix(
+        components['adjustment_factor'].to_numpy(), programs, components['pinned'].to_numpy()
+    )
+    program_rates = pd.DataFrame(matrix.T, columns=list(programs))
+    program_rates.insert(0, 'CountryCode', components['country_code'].to_numpy())
+    return program_rates
+
 
 class EconomicRateCalculator:
     """
@@ -31,6 +435,8 @@ class EconomicRateCalculator:
     def __init__(self, config_path: str = "config.json"):
         """Initialize the calculator with configuration"""
         self.config_path = config_path
+        # Guards config reloads, so parameters() never sees a half-applied config
+        self._config_lock = threading.Lock()
         self.base_rate = self._load_config()
         
         # USA reference values (normalized to 1.0 for calculations)
@@ -38,56 +444,201 @@ class EconomicRateCalculator:
         self.usa_inflation = 2.95  # USA inflation rate
         self.usa_coli = 128.03     # USA COLI
         
-        # Algorithm weights (tuned for optimal fairness)
-        self.weights = {
-            'ppp': 0.5,        # 50% - Primary purchasing power consideration
-            'inflation': 0.25,  # 25% - Economic stability factor
-            'coli': 0.25       # 25% - Living cost adjustment
-        }
+        # Algorithm weights (tuned for optimal fairness), overridable via config.json
+        self.weights = self._load_weights()
+        self.inflation_cap, self.factor_bounds = self._load_limits()
+        self.programs = self._load_programs()
+        self.screening = self._load_screening()
+        self.imputation = self._load_imputation()
         
         # Data containers
         self.ppp_data = None
         self.inflation_data = None  
         self.coli_data = None
         self.merged_data = None
+        self.inflation_history = None
+        self.quality_report = None
+        # (merged frame, PreparedInputs built from it), replaced as a whole
+        self._prepared = (None, None)
         
-    def _load_config(self) -> float:
-        """Load base rate from configuration file"""
+        # Stage timing/memory records for the current run; heap tracing is
+        # opt-in (config.json "trace_memory") as it slows every stage down
+        self.trace_memory = bool(self.config.get('trace_memory', False))
+        self.tracer = PipelineTracer(trace_memory=self.trace_memory)
+        self.rate_components = None
+        self.program_rates = None
+        self.snapshot_version = None
+        self.inputs_fingerprint = None
+        
+    def _read_config(self) -> Dict:
+        """Read config.json, returning an empty dict if it is missing or invalid"""
+        self._config_mtime = _file_mtime(self.config_path)
+        self._config_checked_at = time.monotonic()
         try:
             with open(self.config_path, 'r') as f:
-                config = json.load(f)
-                base_rate = config.get('base_rate', 7.5)
-                logger.info(f"Loaded base rate: ${base_rate}")
-                return base_rate
+                return json.load(f)
         except FileNotFoundError:
-            logger.warning(f"Config file {self.config_path} not found, using default rate $7.50")
-            return 7.5
+            logger.warning(f"Config file {self.config_path} not found, using defaults")
+            return {}
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing config file: {e}")
-            return 7.5
+            return {}
             
+    def _load_config(self) -> float:
+        """Load base rate from configuration file"""
+        self.config = self._read_config()
+        base_rate = self.config.get('base_rate', 7.5)
+        logger.info(f"Loaded base rate: ${base_rate}")
+        return base_rate
+        
+    def _load_weights(self) -> Dict[str, float]:
+        """Algorithm weights, with any overrides from the configuration file"""
+        weights = dict(DEFAULT_WEIGHTS)
+        weights.update(self.config.get('weights', {}))
+        return weights
+        
+    def _load_limits(self) -> Tuple[float, Tuple[float, float]]:
+        """Inflation boost cap and adjustment factor bounds, with any config overrides"""
+        inflation_cap = self.config.get('inflation_cap', DEFAULT_INFLATION_CAP)
+        lower_bound, upper_bound = self.config.get('factor_bounds', DEFAULT_FACTOR_BOUNDS)
+        return inflation_cap, (lower_bound, upper_bound)
+        
+    def _load_screening(self) -> Dict:
+        """Input screening policy and thresholds, with any config overrides"""
+        screening = dict(DEFAULT_SCREENING)
+        screening.update(self.config.get('screening', {}))
+        if screening['policy'] not in POLICIES:
+            logger.warning(f"Unknown screening policy '{screening['policy']}', using 'flag'")
+            screening['policy'] = 'flag'
+        return screening
+        
+    def _load_imputation(self) -> Dict:
+        """Missing-value imputation settings, with any config overrides"""
+        imputation = dict(DEFAULT_IMPUTATION)
+        imputation.update(self.config.get('imputation', {}))
+        if imputation['coli'] not in ('curve', 'knn'):
+            logger.warning(f"Unknown COLI imputation '{imputation['coli']}', using 'curve'")
+            imputation['coli'] = 'curve'
+        return imputation
+        
+    def _load_programs(self) -> Dict[str, Dict]:
+        """
+        Grant program registry: the default program (config.json's base_rate)
+        followed by each entry of the config's ``programs`` section. A program
+        has a base rate and an optional rate floor and cap; all programs share
+        the same adjustment factors.
+        """
+        programs = {DEFAULT_PROGRAM: {'base_rate': self.base_rate, 'rate_floor': None, 'rate_cap': None}}
+        for name, settings in self.config.get('programs', {}).items():
+            if name == DEFAULT_PROGRAM:
+                logger.warning(f"Program name '{DEFAULT_PROGRAM}' is reserved, ignoring its config entry")
+                continue
+            programs[name] = {
+                'base_rate': settings.get('base_rate', self.base_rate),
+                'rate_floor': settings.get('rate_floor'),
+                'rate_cap': settings.get('rate_cap')
+            }
+        return programs
+        
+    def refresh_config(self) -> bool:
+        """
+        Reload config.json if it changed on disk (checked at most once per
+        CONFIG_CHECK_INTERVAL seconds). Returns True if it was reloaded.
+        """
+        now = time.monotonic()
+        if now - self._config_checked_at < CONFIG_CHECK_INTERVAL:
+            return False
+        self._config_checked_at = now
+        
+        if _file_mtime(self.config_path) == self._config_mtime:
+            return False
+            
+        with self._config_lock:
+            self.base_rate = self._load_config()
+            self.weights = self._load_weights()
+            self.inflation_cap, self.factor_bounds = self._load_limits()
+            self.programs = self._load_programs()
+            self.screening = self._load_screening()
+            self.imputation = self._load_imputation()
+        logger.info("Configuration changed on disk, reloaded base rate and weights")
+        return True
+        
+    def config_fingerprint(self) -> Tuple:
+        """Everything the adjustment factor and rate depend on besides the indicators"""
+        return parameters_fingerprint(self._current_parameters())
+        
+    def _current_parameters(self) -> Dict:
+        with self._config_lock:
+            return {
+                'base_rate': self.base_rate,
+                'weights': dict(self.weights),
+                'usa_ppp': self.usa_ppp,
+                'usa_inflation': self.usa_inflation,
+                'usa_coli': self.usa_coli,
+                'inflation_cap': self.inflation_cap,
+                'factor_bounds': tuple(self.factor_bounds),
+                'programs': {name: dict(program) for name, program in self.programs.items()}
+            }
+        
+    def parameters(self) -> Dict:
+        """
+        Consistent copy of everything the rates depend on besides the
+        indicators (after picking up config.json changes), for the pure
+        compute functions. Safe to call from any thread.
+        """
+        self.refresh_config()
+        return self._current_parameters()
+        
+    def prepared_inputs(self) -> PreparedInputs:
+        """Immutable, shareable form of the merged data, built once per merged dataset"""
+        merged, inputs = self._prepared
+        if merged is not self.merged_data or inputs is None:
+            if self.merged_data is None:
+                raise ValueError("No merged data available. Call merge_datasets() first.")
+            merged = self.merged_data
+            inputs = PreparedInputs.from_frame(merged, self.inputs_fingerprint)
+            self._prepared = (merged, inputs)
+        return inputs
+        
     def load_economic_data(self) -> None:
         """Load all economic indicator CSV files"""
         logger.info("Loading economic data files...")
         
         try:
-            # Load PPP data
-            self.ppp_data = pd.read_csv('final_data/PPP.csv')
-            self.ppp_data.columns = ['country_code', 'ppp']
-            logger.info(f"Loaded PPP data: {len(self.ppp_data)} countries")
-            
-            # Load Inflation data  
-            self.inflation_data = pd.read_csv('final_data/INFLATION.csv')
-            self.inflation_data.columns = ['country_code', 'inflation']
-            logger.info(f"Loaded Inflation data: {len(self.inflation_data)} countries")
-            
-            # Load COLI data
-            self.coli_data = pd.read_csv('final_data/COLI.csv')
-            self.coli_data.columns = ['country_code', 'coli']
-            logger.info(f"Loaded COLI data: {len(self.coli_data)} countries")
+            with self.tracer.stage('load') as stage:
+                self.inputs_fingerprint = compute_input_fingerprint(self.config_path)
+                
+                # Load PPP data
+                self.ppp_data = self._read_indicator('final_data/PPP.csv', 'ppp')
+                logger.info(f"Loaded PPP data: {len(self.ppp_data)} countries")
+                
+                # Load Inflation data  
+                self.inflation_data = self._read_indicator('final_data/INFLATION.csv', 'inflation')
+                logger.info(f"Loaded Inflation data: {len(self.inflation_data)} countries")
+                
+                # Load COLI data
+                self.coli_data = self._read_indicator('final_data/COLI.csv', 'coli')
+                logger.info(f"Loaded COLI data: {len(self.coli_data)} countries")
+                
+                # Load inflation history, if available
+                self.inflation_history = self._read_inflation_history(INFLATION_HISTORY_PATH)
+                
+                stage['rows'] = {
+                    'ppp': len(self.ppp_data),
+                    'inflation': len(self.inflation_data),
+                    'coli': len(self.coli_data)
+                }
             
             # Validate data ranges
-            self._validate_data_ranges()
+            with self.tracer.stage('validate') as stage:
+                self._validate_data_ranges()
+                stage['rows'] = len(self.ppp_data) + len(self.inflation_data) + len(self.coli_data)
+            
+            # Screen for outliers and apply the screening policy
+            with self.tracer.stage('screen') as stage:
+                self.screen_inputs()
+                stage['rows'] = sum(len(report['flagged']) for report in self.quality_report['indicators'].values())
+                stage['policy'] = self.screening['policy']
             
         except FileNotFoundError as e:
             logger.error(f"Data file not found: {e}")
@@ -96,6 +647,26 @@ class EconomicRateCalculator:
             logger.error(f"Empty data file encountered: {e}")
             raise
             
+    def _read_indicator(self, path: str, name: str) -> pd.DataFrame:
+        """Read an indicator CSV as country_code, <name> and, when recorded, <name>_year"""
+        data = pd.read_csv(path)
+        columns = ['country_code', name]
+        if len(data.columns) > 2:
+            columns.append(f'{name}_year')
+        data = data.iloc[:, :len(columns)]
+        data.columns = columns
+        return data
+        
+    def _read_inflation_history(self, path: str) -> Optional[pd.DataFrame]:
+        """Per-year inflation indexed by country code, one column per year. None if unavailable."""
+        if not os.path.exists(path):
+            return None
+        history = pd.read_csv(path, index_col=0)
+        history.index.name = 'country_code'
+        history.columns = [int(year) for year in history.columns]
+        logger.info(f"Loaded inflation history: {len(history)} countries, years {list(history.columns)}")
+        return history
+        
     def _validate_data_ranges(self) -> None:
         """Validate data ranges and log statistics"""
         logger.info("Data validation summary:")
@@ -118,18 +689,62 @@ class EconomicRateCalculator:
         if ppp_min < 0.1:
             logger.warning(f"Very low PPP detected: {ppp_min:.3f}")
             
+    def screen_inputs(self) -> Dict:
+        """
+        Screen each indicator with robust z-scores (and year-over-year jumps
+        where history exists), apply the screening policy to flagged values,
+        and build the quality report.
+        """
+        policy = self.screening['policy']
+        z_threshold = self.screening['z_threshold']
+        indicators = {}
+        
+        for name in ('ppp', 'inflation', 'coli'):
+            data = getattr(self, f'{name}_data')
+            values = data[name].to_numpy(dtype=float)
+            
+            history = None
+            if name == 'inflation' and self.inflation_history is not None:
+                history = self.inflation_history.reindex(data['country_code'].to_numpy()).to_numpy(dtype=float)
+            
+            screen = screen_column(values, history, SCALES[name], z_threshold, self.screening['jump_threshold'])
+            flagged = screen['outlier'] | screen['jumped']
+            indicators[name] = column_report(data['country_code'].to_numpy(), values, screen, policy)
+            
+            if policy == 'clip' and screen['outlier'].any():
+                data = data.copy()
+                data[name] = clip_values(values, screen, z_threshold)
+            elif policy == 'quarantine' and flagged.any():
+                # Dropped values are treated as missing (PPP rows leave the rate table)
+                data = data[~flagged].reset_index(drop=True)
+            setattr(self, f'{name}_data', data)
+            
+            if flagged.any():
+                logger.warning(f"Screening flagged {int(flagged.sum())} {name} values (policy: {policy})")
+        
+        self.quality_report = {
+            'policy': policy,
+            'z_threshold': z_threshold,
+            'jump_threshold': self.screening['jump_threshold'],
+            'inputs_fingerprint': self.inputs_fingerprint,
+            'indicators': indicators
+        }
+        return self.quality_report
+        
     def merge_datasets(self) -> pd.DataFrame:
         """Merge all economic datasets on country codes"""
         logger.info("Merging economic datasets...")
         
-        # Start with PPP as base (most complete dataset)
-        merged = self.ppp_data.copy()
-        
-        # Left join with inflation data
-        merged = merged.merge(self.inflation_data, on='country_code', how='left')
-        
-        # Left join with COLI data
-        merged = merged.merge(self.coli_data, on='country_code', how='left')
+        with self.tracer.stage('merge') as stage:
+            # Start with PPP as base (most complete dataset)
+            merged = self.ppp_data.copy()
+            
+            # Left join with inflation data
+            merged = merged.merge(self.inflation_data, on='country_code', how='left')
+            
+            # Left join with COLI data
+            merged = merged.merge(self.coli_data, on='country_code', how='left')
+            stage['rows'] = len(merged)
         
         # Log merge statistics
         total_countries = len(merged)
@@ -145,90 +760,95 @@ class EconomicRateCalculator:
         self.merged_data = merged
         return merged
         
-    def _handle_missing_data(self, row: pd.Series) -> pd.Series:
-        """Handle missing data using intelligent defaults"""
-        country_code = row['country_code']
-        
-        # Handle missing inflation (use global median for stability)
-        if pd.isna(row['inflation']):
-            row['inflation'] = self.merged_data['inflation'].median()
-            logger.debug(f"Using median inflation for {country_code}")
+    def fill_missing_data(self) -> pd.DataFrame:
+        """Fill missing indicators in the merged dataset ahead of rate calculation"""
+        if self.merged_data is None:
+            raise ValueError("No merged data available. Call merge_datasets() first.")
             
-        # Handle missing COLI (estimate from PPP relationship)
-        if pd.isna(row['coli']):
-            # Countries with higher PPP typically have higher COLI
-            # Use regression-based estimation
-            estimated_coli = self.usa_coli * (row['ppp'] ** 0.7)  # Power relationship
-            row['coli'] = max(50, min(200, estimated_coli))  # Bound between reasonable limits
-            logger.debug(f"Estimated COLI for {country_code}: {row['coli']:.2f}")
+        with self.tracer.stage('fill_missing') as stage:
+            missing_rows = int(self.merged_data[['inflation', 'coli']].isna().any(axis=1).sum())
             
-        return row
+            source = self.merged_data
+            if self.imputation['coli'] == 'knn':
+                # Nearest-neighbour COLI first; the PPP curve covers anything left
+                source = self._impute_coli_knn(source)
+                
+            # Rows are filled against the unfilled data, so the inflation median is unchanged
+            inflation_median = self.merged_data['inflation'].median()
+            inflation, coli = fill_missing_columns(
+                source['ppp'].to_numpy(dtype=float), source['inflation'].to_numpy(dtype=float),
+                source['coli'].to_numpy(dtype=float), inflation_median, self.usa_coli
+            )
+            filled = source.copy()
+            filled['inflation'] = inflation
+            filled['coli'] = coli
+            
+            # Remember which values were imputed rather than observed
+            filled['inflation_imputed'] = self.merged_data['inflation'].isna()
+            filled['coli_imputed'] = self.merged_data['coli'].isna()
+            
+            self.merged_data = filled
+            stage['rows'] = missing_rows
+            
+        logger.info(f"Filled missing indicators for {missing_rows} countries")
+        return filled
         
-    def calculate_economic_adjustment_factor(self, ppp: float, inflation: float, coli: float) -> float:
+    def _impute_coli_knn(self, merged: pd.DataFrame) -> pd.DataFrame:
         """
-        CORRECTED VERSION:
-        - Lower PPP = LOWER dollar amount (but equal purchasing power)
-        - Lower COLI = LOWER dollar amount (but equal purchasing power)
-        - Higher inflation = SMALL buffer increase
+        Copy of the merged data with missing COLI estimated from the nearest
+        countries by log PPP and inflation (optionally within the same region).
         """
+        ppp = merged['ppp'].to_numpy(dtype=float)
+        inflation = merged['inflation'].to_numpy(dtype=float)
+        usable = ppp > 0
         
-        # PPP Factor: DIRECT relationship now
-        # Pakistan PPP=0.3 → factor=0.3 → $50 * 0.3 = $15
-        ppp_factor = ppp / self.usa_ppp  # This gives us the right scaling
-        
-        # Inflation Factor: Small buffer for volatile economies
-        # But don't overdo it - maybe 10% max boost for high inflation
-        inflation_ratio = inflation / self.usa_inflation
-        inflation_factor = 1.0 + min((inflation_ratio - 1.0) * 0.1, 0.1)  # Max 10% boost
-        
-        # COLI Factor: DIRECT relationship  
-        # Lower COLI = lower costs = lower grant needed
-        coli_factor = coli / self.usa_coli
-        
-        # Weighted combination - ALL factors now reduce the rate for developing economies
-        combined_factor = (
-            self.weights['ppp'] * ppp_factor +
-            self.weights['inflation'] * inflation_factor +
-            self.weights['coli'] * coli_factor
-        )
+        # Features must be complete: missing inflation counts as the median
+        features = np.column_stack([
+            np.log(np.where(usable, ppp, 1.0)),
+            np.where(np.isnan(inflation), np.nanmedian(inflation), inflation)
+        ])[usable]
         
-        # Final adjustment - this should be LESS than 1 for developing countries
-        adjustment_factor = combined_factor
-        
-        # Apply reasonable bounds (don't go below 20% of US rate)
-        adjustment_factor = max(0.2, min(1.2, adjustment_factor))
-        
-        return adjustment_factor
-        
-    def calculate_country_rate(self, country_data: pd.Series) -> float:
-        """Calculate the final grant rate for a specific country"""
-        country_code = country_data['country_code']
-        
-        # Handle missing data
-        country_data = self._handle_missing_data(country_data)
-        
-        # Special case: USA gets exact base rate
-        if country_code == 'USA':
-            return self.base_rate
+        groups = None
+        if self.imputation['same_region']:
+            labels = group_labels(merged['country_code'].tolist(), load_country_groups())['region']
+            groups = np.asarray(labels)[usable]
             
-        # Extract economic indicators
-        ppp = country_data['ppp']
-        inflation = country_data['inflation']
-        coli = country_data['coli']
-        
-        # Calculate adjustment factor
-        adjustment_factor = self.calculate_economic_adjustment_factor(ppp, inflation, coli)
+        coli = merged['coli'].to_numpy(dtype=float, copy=True)
+        coli[usable] = knn_impute(features, coli[usable], self.imputation['neighbours'], groups)
         
-        # Apply to base rate
-        adjusted_rate = self.base_rate * adjustment_factor
+        imputed = merged.copy()
+        imputed['coli'] = coli
+        logger.info(f"Imputed COLI for {int(merged['coli'].isna().sum())} countries from nearest neighbours")
+        return imputed
         
-        # Round to 2 decimal places for currency
-        adjusted_rate = round(adjusted_rate, 2)
+    def calculate_adjustment_factors(self, ppp, inflation, coli, params: Optional[Dict] = None):
+        """
+        Vectorised adjustment factors for arrays of indicators, under params
+        (a parameters() snapshot; a fresh one is taken when omitted)
+        """
+        if params is None:
+            params = self.parameters()
+        return adjustment_factors(
+            ppp, inflation, coli, params['weights'],
+            params['usa_ppp'], params['usa_inflation'], params['usa_coli'],
+            params['inflation_cap'], params['factor_bounds']
+        )
         
-        logger.debug(f"{country_code}: PPP={ppp:.3f}, Inflation={inflation:.2f}%, "
-                    f"COLI={coli:.2f}, Factor={adjustment_factor:.3f}, Rate=${adjusted_rate}")
+    def calculate_rate_components(self) -> pd.DataFrame:
+        """
+        Per-country rates together with the factors, weighted contributions,
+        clipping, imputation and source years that produced them.
+        """
+        return compute_rate_components(self.prepared_inputs(), self.parameters())
         
-        return adjusted_rate
+    def calculate_program_rates(self, components: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Rates for every registered program, one column per program, from the
+        adjustment factors of calculate_rate_components().
+        """
+        if components is None:
+            components = self.calculate_rate_components()
+        return compute_program_rates(components, self.parameters()['programs'])
         
     def generate_all_rates(self) -> pd.DataFrame:
         """Generate rates for all countries with available data"""
@@ -237,42 +857,127 @@ class EconomicRateCalculator:
         if self.merged_data is None:
             raise ValueError("No merged data available. Call merge_datasets() first.")
             
-        # Calculate rates for each country
-        rates_data = []
-        
-        for _, row in self.merged_data.iterrows():
-            country_code = row['country_code']
-            try:
-                rate = self.calculate_country_rate(row)
-                rates_data.append({
-                    'CountryCode': country_code,
-                    'Rate': rate
-                })
-            except Exception as e:
-                logger.error(f"Error calculating rate for {country_code}: {e}")
-                # Use base rate as fallback
-                rates_data.append({
-                    'CountryCode': country_code,  
-                    'Rate': self.base_rate
-                })
-                
-        rates_df = pd.DataFrame(rates_data)
+        if 'coli_imputed' not in self.merged_data:
+            self.fill_missing_data()
+            
+        with self.tracer.stage('calculate_rates') as stage:
+            # Rates and their factor breakdown, for all countries at once
+            params = self.parameters()
+            components = compute_rate_components(self.prepared_inputs(), params)
+            rates_df = components[['country_code', 'rate']].rename(
+                columns={'country_code': 'CountryCode', 'rate': 'Rate'}
+            )
+            self.rate_components = components
+            
+            # Every program's rates from the same factors
+            self.program_rates = compute_program_rates(components, params['programs'])
+            stage['rows'] = len(rates_df)
+            stage['programs'] = len(params['programs'])
+            
         logger.info(f"Generated rates for {len(rates_df)} countries")
         
         return rates_df
         
-    def save_rates(self, rates_df: pd.DataFrame, output_path: str = "rates/rates.csv") -> None:
-        """Save the calculated rates to CSV file"""
-        
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    def save_rates(self, rates_df: pd.DataFrame, output_path: str = "rates/rates.csv",
+                   snapshot_path: Optional[str] = SNAPSHOT_PATH) -> None:
+        """Save the calculated rates to CSV file and the binary serving snapshot"""
         
-        # Sort by country code for consistency
-        rates_df_sorted = rates_df.sort_values('CountryCode')
-        
-        # Save to CSV
-        rates_df_sorted.to_csv(output_path, index=False)
+        with self.tracer.stage('save') as stage:
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            
+            # Sort by country code for consistency
+            rates_df_sorted = rates_df.sort_values('CountryCode')
+            
+            # Save to CSV (atomically, the app may be reading it); the signatures of
+            # the files written are stored with the snapshot so exports can serve them
+            csv_files = {os.path.basename(output_path): write_csv_atomic(rates_df_sorted, output_path)}
+            
+            # Save the per-country factor breakdown in the same row order
+            explanations = self._explanation_columns(rates_df_sorted['CountryCode'])
+            if explanations is not None:
+                csv_files[os.path.basename(EXPLANATIONS_PATH)] = write_csv_atomic(
+                    explanations,
+                    os.path.join(os.path.dirname(output_path), os.path.basename(EXPLANATIONS_PATH))
+                )
+            
+            # Save the program x country rate matrix when programs are configured
+            program_rates = self._program_rate_columns(rates_df_sorted['CountryCode'])
+            if program_rates is not None and len(self.programs) > 1:
+                write_csv_atomic(
+                    program_rates,
+                    os.path.join(os.path.dirname(output_path), os.path.basename(PROGRAM_RATES_PATH))
+                )
+            
+            # Save the pandas-free serving snapshot
+            if snapshot_path:
+                extra_columns = {}
+                kinds = dict(EXPLANATION_COLUMNS)
+                if explanations is not None:
+                    extra_columns.update({column: explanations[column].tolist() for column in EXPLANATION_COLUMNS})
+                if program_rates is not None:
+                    # One column per program, stored as program:<name>
+                    for program in self.programs:
+                        extra_columns[f'program:{program}'] = program_rates[program].tolist()
+                        kinds[f'program:{program}'] = 'f64'
+                # Grouping dimensions, and the per-group statistics cube for every program
+                codes = rates_df_sorted['CountryCode'].tolist()
+                labels = group_labels(codes, load_country_groups())
+                for dimension, column in GROUP_DIMENSIONS.items():
+                    extra_columns[column] = labels[dimension]
+                    kinds[column] = 'str'
+                if program_rates is not None:
+                    cube_rates = {program: program_rates[program].to_numpy() for program in self.programs}
+                else:
+                    cube_rates = {DEFAULT_PROGRAM: rates_df_sorted['Rate'].to_numpy()}
+                group_cube = build_group_cube(labels, cube_rates)
+                
+                history_years = []
+                if self.inflation_history is not None:
+                    # One column per year, stored as inflation_history:<year> (NaN where missing)
+                    history = self.inflation_history.reindex(rates_df_sorted['CountryCode'].to_numpy())
+                    for year in history.columns:
+                        extra_columns[f'inflation_history:{year}'] = history[year].astype(float).tolist()
+                        kinds[f'inflation_history:{year}'] = 'f64'
+                        history_years.append(int(year))
+                self.snapshot_version = build_rates_snapshot(
+                    rates_df_sorted['CountryCode'].tolist(),
+                    rates_df_sorted['Rate'].tolist(),
+                    path=snapshot_path,
+                    meta={
+                        'base_rate': self.base_rate,
+                        'inputs_fingerprint': self.inputs_fingerprint,
+                        'weights': self.weights,
+                        'inflation_cap': self.inflation_cap,
+                        'factor_bounds': list(self.factor_bounds),
+                        'reference': {
+                            'ppp': self.usa_ppp,
+                            'inflation': self.usa_inflation,
+                            'coli': self.usa_coli
+                        },
+                        'programs': self.programs if program_rates is not None else {},
+                        'default_program': DEFAULT_PROGRAM,
+                        'inflation_history_years': history_years,
+                        'group_stats': group_cube,
+                        'explanation_columns': list(EXPLANATION_COLUMNS) if explanations is not None else [],
+                        'files': csv_files
+                    },
+                    extra_columns=extra_columns,
+                    kinds=kinds,
+                    sorted_columns=[f'program:{program}' for program in self.programs
+                                    if program != DEFAULT_PROGRAM] if program_rates is not None else ()
+                )
+                # Keep every version for diffs (rates/history/<version>.snapshot)
+                archive_snapshot(snapshot_path, self.snapshot_version,
+                                 os.path.join(os.path.dirname(snapshot_path), 'history'))
+                # Publish into the SQLite serving store too, whichever backend this
+                # process uses, so a sqlite-backed app never serves stale rates
+                publish_snapshot(read_snapshot(snapshot_path),
+                                 os.path.join(os.path.dirname(snapshot_path), os.path.basename(RATES_DB_PATH)))
+            stage['rows'] = len(rates_df_sorted)
         logger.info(f"Rates saved to {output_path}")
+        if snapshot_path:
+            logger.info(f"Snapshot {self.snapshot_version} saved to {snapshot_path}")
         
         # Log statistics
         min_rate = rates_df['Rate'].min()
@@ -286,29 +991,94 @@ class EconomicRateCalculator:
         if usa_rate:
             logger.info(f"  USA rate: ${usa_rate:.2f} (should be ${self.base_rate:.2f})")
             
-    def run_complete_calculation(self) -> pd.DataFrame:
-        """Execute the complete rate calculation pipeline"""
-        logger.info("Starting complete rate calculation pipeline...")
+    def _explanation_columns(self, country_codes: pd.Series) -> Optional[pd.DataFrame]:
+        """
+        Rate components from the last generate_all_rates() call, aligned to
+        the given country codes and encoded for storage. None if unavailable.
+        """
+        if self.rate_components is None:
+            return None
+        
+        components = self.rate_components.set_index('country_code')
+        if not country_codes.isin(components.index).all():
+            logger.warning("Rate components do not cover all countries, skipping explanations")
+            return None
+        
+        components = components.reindex(country_codes.to_numpy())
+        explanations = pd.DataFrame({'CountryCode': country_codes.to_numpy(),
+                                     'Rate': components['rate'].to_numpy()})
+        for column, kind in EXPLANATION_COLUMNS.items():
+            values = components[column]
+            if kind == 'u32':
+                values = values.fillna(0)
+            explanations[column] = values.astype(float if kind == 'f64' else int).to_numpy()
+        return explanations
         
-        # Load data
-        self.load_economic_data()
+    def _program_rate_columns(self, country_codes: pd.Series) -> Optional[pd.DataFrame]:
+        """Program rates from the last generate_all_rates() call, aligned to the given country codes"""
+        if self.program_rates is None:
+            return None
         
-        # Merge datasets
-        self.merge_datasets()
+        program_rates = self.program_rates.set_index('CountryCode')
+        if not country_codes.isin(program_rates.index).all():
+            logger.warning("Program rates do not cover all countries, skipping program matrix")
+            return None
         
-        # Generate rates
-        rates_df = self.generate_all_rates()
+        return program_rates.reindex(country_codes.to_numpy()).reset_index()
         
-        # Save results
-        self.save_rates(rates_df)
+    def run_complete_calculation(self, workers: Optional[int] = None, shards: Optional[int] = None,
+                                 shard_by: str = 'country') -> pd.DataFrame:
+        """
+        Execute the complete rate calculation pipeline. With more than one
+        worker, filling and rating run sharded on a process pool (see
+        sharding.py), with identical results.
+        """
+        logger.info("Starting complete rate calculation pipeline...")
+        self.tracer = PipelineTracer(trace_memory=self.trace_memory)
+        
+        try:
+            # Load data
+            self.load_economic_data()
+            
+            # Merge datasets
+            self.merge_datasets()
+            
+            if workers and workers > 1:
+                # Imported here, sharding builds on this module
+                from sharding import generate_rates_sharded
+                rates_df = generate_rates_sharded(self, workers, shards, shard_by)
+            else:
+                # Fill missing indicators
+                self.fill_missing_data()
+                
+                # Generate rates
+                rates_df = self.generate_all_rates()
+            
+            # Save results
+            self.save_rates(rates_df)
+            
+            # Write the run and data-quality reports next to the rates output
+            self.tracer.write_report(RUN_REPORT_PATH, RUN_HISTORY_PATH)
+            with open(QUALITY_REPORT_PATH, 'w') as f:
+                json.dump(self.quality_report, f, indent=2)
+        finally:
+            self.tracer.close()
         
         logger.info("Rate calculation pipeline completed successfully!")
         return rates_df
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Calculate grant rates for every country")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record peak Python heap per stage in the run report (slower)")
+    args = parser.parse_args()
+    
+    configure_logging()
+    
     try:
         calculator = EconomicRateCalculator()
+        calculator.trace_memory = calculator.trace_memory or args.trace_memory
         
         rates_df = calculator.run_complete_calculation()
         
@@ -0,0 +1,100 @@
+"""
+Country grouping dimensions and the precomputed group statistics cube
+
+The World Bank exports used by the pipeline contain country rows only, so the
+groupings live in country_groups.json, maintained by hand:
+- ``region``: World Bank region
+- ``income_group``: World Bank income classification (FY2025)
+- ``currency_union``: monetary union sharing a currency (null if none)
+
+Group statistics for every dimension and program are computed once when the
+snapshot is built and stored in its header, so serving a grouped view is a
+dictionary lookup.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Dict, List, Optional, Sequence
+
+from lazy_import import lazy_module
+
+# numpy is only needed when building the cube, not when reading it
+np = lazy_module('numpy')
+
+COUNTRY_GROUPS_PATH = 'country_groups.json'
+
+# Dimension -> snapshot column holding each country's group
+GROUP_DIMENSIONS = {
+    'region': 'Region',
+    'income_group': 'IncomeGroup',
+    'currency_union': 'CurrencyUnion',
+}
+
+# Label for countries without a classification (or outside any currency union)
+UNCLASSIFIED = 'Unclassified'
+NO_UNION = 'None'
+
+PERCENTILES = (10, 25, 75, 90)
+
+
+def load_country_groups(groups_path: str = COUNTRY_GROUPS_PATH) -> Dict:
+    """Load the ISO3 -> {region, income_group, currency_union} table"""
+    try:
+        with open(groups_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading country groups: {e}")
+        return {}
+
+
+def group_labels(codes: Sequence[str], groups: Dict) -> Dict[str, List[str]]:
+    """Group label of every country, per dimension"""
+    labels = {}
+    for dimension in GROUP_DIMENSIONS:
+        missing = NO_UNION if dimension == 'currency_union' else UNCLASSIFIED
+        labels[dimension] = [groups.get(code, {}).get(dimension) or missing for code in codes]
+    return labels
+
+
+def _summarise(rates: np.ndarray) -> Dict:
+    summary = {
+        'count': int(len(rates)),
+        'mean': round(float(rates.mean()), 2),
+        'median': round(float(np.median(rates)), 2),
+        'min': round(float(rates.min()), 2),
+        'max': round(float(rates.max()), 2),
+    }
+    for q, value in zip(PERCENTILES, np.percentile(rates, PERCENTILES)):
+        summary[f'p{q}'] = round(float(value), 2)
+    return summary
+
+
+def build_group_cube(labels: Dict[str, List[str]], rates: Dict[str, Sequence[float]]) -> Dict:
+    """
+    Statistics of each program's rates per group, as
+    {program: {dimension: {group: {count, mean, median, min, max, p10..p90}}}}.
+    """
+    cube = {}
+    for program, values in rates.items():
+        values = np.asarray(values, dtype=float)
+        cube[program] = {}
+        for dimension, dimension_labels in labels.items():
+            # Sort once by group, then summarise each contiguous run
+            keys = np.asarray(dimension_labels)
+            order = np.argsort(keys, kind='stable')
+            names, starts = np.unique(keys[order], return_index=True)
+            bounds = list(starts) + [len(order)]
+            cube[program][dimension] = {
+                str(name): _summarise(values[order[bounds[i]:bounds[i + 1]]])
+                for i, name in enumerate(names)
+            }
+    return cube
+
+
+def group_stats(snapshot, dimension: str, program: Optional[str] = None) -> Optional[Dict]:
+    """Precomputed statistics per group from a snapshot's header, or None if unavailable"""
+    cube = snapshot.meta.get('group_stats') if snapshot is not None else None
+    if not cube:
+        return None
+    return cube.get(program or snapshot.meta.get('default_program', 'default'), {}).get(dimension)
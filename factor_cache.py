@@ -0,0 +1,71 @@
+"""
+Bounded LRU cache for computed factors and tables
+
+Values are pure functions of their key once a configuration (weights and
+reference values, or a snapshot version) is fixed. Every entry is stored under
+that configuration's fingerprint together with its key, so a value is never
+returned for another configuration, while entries for several configurations
+live side by side: alternating between two scenario parameter sets keeps both
+warm, and entries of configurations no longer in use age out of the LRU.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class FactorCache:
+    """
+    Least-recently-used cache with hit/miss counters
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Tuple[Hashable, Tuple], object]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, fingerprint: Hashable, key: Tuple, compute: Callable[[], object]):
+        """Return the cached value for key under fingerprint, computing and storing it on a miss"""
+        entry = (fingerprint, key)
+        with self._lock:
+            value = self._entries.get(entry)
+            if value is not None:
+                self._entries.move_to_end(entry)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[entry] = value
+            self._entries.move_to_end(entry)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'evictions': self.evictions,
+                'fingerprints': len({fingerprint for fingerprint, _ in self._entries}),
+            }
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Fetch raw indicator files into data/
+
+Downloads every configured source concurrently with asyncio over a small
+HTTP/1.1 connection pool (keep-alive, bounded connections per host), using
+only the standard library. Each response is validated with conditional
+requests: the ETag and Last-Modified of the last download are kept in an
+on-disk cache (data/.fetch_cache.json), so an unchanged source costs a single
+304 and leaves its file untouched.
+
+Bodies are streamed chunk by chunk into the file the processors read (through
+a sibling .part file that is renamed into place), so the ingestors never see
+a partial download.
+
+Connections follow HTTP/1.0 and HTTP/1.1 persistence rules: a connection goes
+back to the pool only when the server keeps it open and the body length is
+known. A pooled connection the server has since closed is retried once on a
+fresh connection.
+
+Sources are configured in config.json as target file name -> URL:
+
+    "sources": {
+        "raw data from worldbank.csv": "https://example.org/ppp.csv",
+        "COLI Numbeo Raw data.csv": "https://example.org/coli.csv"
+    }
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import ssl
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = 'data'
+CACHE_PATH = os.path.join(DATA_DIR, '.fetch_cache.json')
+
+DEFAULT_CONCURRENCY = 8
+CONNECTIONS_PER_HOST = 4
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+TIMEOUT = 60.0
+
+USER_AGENT = 'daydream-rates-fetcher/1.0'
+
+
+class FetchError(Exception):
+    """Raised when a source cannot be downloaded"""
+
+
+class ConnectionClosed(FetchError):
+    """Raised when the server closes the connection before sending a response"""
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP connections, reused per (scheme, host, port) with a bound
+    on open connections per host
+    """
+
+    def __init__(self, per_host: int = CONNECTIONS_PER_HOST):
+        self.per_host = per_host
+        self._idle: Dict[Tuple, List] = {}
+        self._limits: Dict[Tuple, asyncio.Semaphore] = {}
+        self._ssl = ssl.create_default_context()
+        self.opened = 0
+        self.reused = 0
+
+    async def acquire(self, key: Tuple, fresh: bool = False):
+        """(connection, reused): an idle connection for key, or a new one if none (or fresh)"""
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.per_host))
+        await limit.acquire()
+        idle = self._idle.get(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            if not fresh and not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return (reader, writer), True
+            writer.close()
+
+        scheme, host, port = key
+        try:
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=self._ssl if scheme == 'https' else None),
+                TIMEOUT
+            )
+        except BaseException:
+            limit.release()
+            raise
+        self.opened += 1
+        return connection, False
+
+    def release(self, key: Tuple, connection, reusable: bool) -> None:
+        reader, writer = connection
+        if reusable and not writer.is_closing():
+            self._idle.setdefault(key, []).append(connection)
+        else:
+            writer.close()
+        self._limits[key].release()
+
+    async def close(self) -> None:
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_headers(reader) -> Tuple[str, int, Dict[str, str]]:
+    """(HTTP version, status, lower-cased headers) of a response"""
+    status_line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+    if not status_line:
+        raise ConnectionClosed("Connection closed before a response was received")
+    parts = status_line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise FetchError(f"Malformed status line: {status_line!r}")
+    version, status = parts[0], int(parts[1])
+
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return version, status, headers
+
+
+async def _iter_body(reader, headers: Dict[str, str]):
+    """Yield the response body in chunks (chunked, sized or close-delimited)"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Trailers end with an empty line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            remaining = size
+            while remaining:
+                chunk = await asyncio.wait_for(reader.read(min(remaining, CHUNK_SIZE)), TIMEOUT)
+                if not chunk:
+                    raise FetchError("Connection closed mid-chunk")
+                remaining -= len(chunk)
+                yield chunk
+            await reader.readline()
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining:
+            chunk = await asyncio.wait_for(reader.read(min(remaining, CHUNK_SIZE)), TIMEOUT)
+            if not chunk:
+                raise FetchError("Connection closed before the full body was received")
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(CHUNK_SIZE), TIMEOUT)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _keep_alive(version: str, headers: Dict[str, str], has_body: bool = True) -> bool:
+    """
+    Whether the connection can be reused after this response: HTTP/1.1 unless
+    the server sent Connection: close, HTTP/1.0 only with Connection:
+    keep-alive, and only if the body's end is known without the server closing.
+    """
+    tokens = {token.strip().lower() for token in headers.get('connection', '').split(',')}
+    if 'close' in tokens:
+        return False
+    if version == 'HTTP/1.0' and 'keep-alive' not in tokens:
+        return False
+    return not has_body or 'content-length' in headers or headers.get('transfer-encoding', '').lower() == 'chunked'
+
+
+class Fetcher:
+    """
+    Concurrent conditional downloader for the configured sources
+    """
+
+    def __init__(self, sources: Dict[str, str], data_dir: str = DATA_DIR, cache_path: str = CACHE_PATH,
+                 concurrency: int = DEFAULT_CONCURRENCY, force: bool = False):
+        self.sources = sources
+        self.data_dir = data_dir
+        self.cache_path = cache_path
+        self.concurrency = concurrency
+        self.force = force
+        self.cache = self._load_cache()
+        self.pool = ConnectionPool()
+
+    def _load_cache(self) -> Dict:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self) -> None:
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def _request_headers(self, target: str, url: str) -> Dict[str, str]:
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'}
+        entry = self.cache.get(target)
+        if not self.force and entry and entry.get('url') == url and \
+                os.path.exists(os.path.join(self.data_dir, target)):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    async def _request(self, key: Tuple, request: bytes):
+        """
+        Send a request and read the response head: (connection, version,
+        status, headers). A pooled connection found closed is retried once on
+        a fresh connection. The caller releases the connection.
+        """
+        for fresh in (False, True):
+            connection, reused = await self.pool.acquire(key, fresh)
+            reader, writer = connection
+            try:
+                writer.write(request)
+                await writer.drain()
+                version, status, headers = await _read_headers(reader)
+                return connection, version, status, headers
+            except (ConnectionClosed, ConnectionResetError, BrokenPipeError):
+                self.pool.release(key, connection, False)
+                if not reused:
+                    raise
+                logger.debug(f"Pooled connection to {key[1]} was closed, retrying on a new one")
+            except BaseException:
+                self.pool.release(key, connection, False)
+                raise
+        raise ConnectionClosed("Connection closed before a response was received")
+
+    async def fetch(self, target: str, url: str) -> Dict:
+        """Download one source into data/<target>. Returns a result record."""
+        started = time.perf_counter()
+        source_url = url
+        request_headers = self._request_headers(target, url)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise FetchError(f"Unsupported URL: {url}")
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            key = (parts.scheme, parts.hostname, port)
+            path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+            host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+
+            lines = [f'GET {path} HTTP/1.1', f'Host: {host}', 'Connection: keep-alive']
+            lines += [f'{name}: {value}' for name, value in request_headers.items()]
+            request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+            connection, version, status, headers = await self._request(key, request)
+            reusable = False
+            try:
+                reader, _ = connection
+
+                if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                    async for _ in _iter_body(reader, headers):
+                        pass
+                    reusable = _keep_alive(version, headers)
+                    url = urljoin(url, headers['location'])
+                    continue
+
+                if status == 304:
+                    # 304 responses never carry a body
+                    reusable = _keep_alive(version, headers, has_body=False)
+                    return {'target': target, 'status': 'not_modified', 'bytes': 0,
+                            'seconds': round(time.perf_counter() - started, 3)}
+
+                if status != 200:
+                    raise FetchError(f"{url} returned HTTP {status}")
+
+                size = await self._stream_to_file(target, _iter_body(reader, headers))
+                reusable = _keep_alive(version, headers)
+            finally:
+                self.pool.release(key, connection, reusable)
+
+            # Validators are keyed on the configured URL; redirects are followed again on revalidation
+            self.cache[target] = {
+                'url': source_url,
+                'final_url': url,
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'bytes': size,
+            }
+            return {'target': target, 'status': 'fetched', 'bytes': size,
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+        raise FetchError(f"Too many redirects for {target}")
+
+    async def _stream_to_file(self, target: str, chunks) -> int:
+        """Write body chunks to data/<target> as they arrive; renamed into place when complete"""
+        path = os.path.join(self.data_dir, target)
+        part_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        size = 0
+        try:
+            with open(part_path, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return size
+
+    async def run(self) -> List[Dict]:
+        """Fetch all sources concurrently; failures are reported, not raised"""
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(target: str, url: str) -> Dict:
+            async with limit:
+                try:
+                    return await self.fetch(target, url)
+                except (FetchError, OSError, asyncio.TimeoutError, ValueError) as e:
+                    logger.error(f"Failed to fetch {target}: {e}")
+                    return {'target': target, 'status': 'failed', 'error': str(e)}
+
+        try:
+            results = await asyncio.gather(*(bounded(target, url) for target, url in self.sources.items()))
+        finally:
+            await self.pool.close()
+            self._save_cache()
+        return list(results)
+
+
+def load_sources(config_path: str = "config.json") -> Dict[str, str]:
+    """Configured sources (data/ file name -> URL) from config.json"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f).get('sources', {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def fetch_all(sources: Optional[Dict[str, str]] = None, **kwargs) -> List[Dict]:
+    """Fetch every source (from config.json by default). Returns one result record per source."""
+    fetcher = Fetcher(load_sources() if sources is None else sources, **kwargs)
+    return asyncio.run(fetcher.run())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Download raw indicator files into data/")
+    parser.add_argument('--config', default="config.json", help="Config file with the 'sources' section")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--force', action='store_true', help="Ignore cached validators and download everything")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    sources = load_sources(args.config)
+    if not sources:
+        print(f"No sources configured in {args.config}", file=sys.stderr)
+        return 1
+
+    results = fetch_all(sources, data_dir=args.data_dir,
+                        cache_path=os.path.join(args.data_dir, '.fetch_cache.json'),
+                        concurrency=args.concurrency, force=args.force)
+    for result in results:
+        logger.info(json.dumps(result))
+    return 1 if any(result['status'] == 'failed' for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+gunicorn configuration for serving the rates API
+
+Run from the repository root:
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers use gevent, so every request runs in a greenlet: an idle /api/stream
+(Server-Sent Events) client is a parked greenlet waiting on the snapshot
+broadcaster, not a thread, and one worker holds thousands of them. The
+snapshot is mapped once and shared by the workers (see SharedSnapshot).
+
+RATES_BIND and RATES_WORKERS override the address and the worker count.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('RATES_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('RATES_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gevent'
+# Concurrent connections per worker, idle event streams included
+worker_connections = 10000
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """Load the serving data before the worker accepts requests"""
+    from app import warm_up
+    warm_up()
@@ -0,0 +1,80 @@
+"""
+Nearest-neighbour imputation of missing indicator values
+
+Missing COLI values are estimated from the countries with complete data that
+are most similar in the other indicators. Features (log PPP and inflation) are
+standardised over the donor countries, every gap is resolved in one batch
+k-nearest-neighbour query, and the neighbours' values are averaged in log space
+with inverse-distance weights. Neighbours can be restricted to the same region.
+
+Neighbours are found with scipy's cKDTree: building it is O(donors log
+donors) and each query O(log donors), so imputation stays fast on
+sub-national tables with many gaps.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+from lazy_import import lazy_module
+
+np = lazy_module('numpy')
+spatial = lazy_module('scipy.spatial')
+
+DEFAULT_NEIGHBOURS = 5
+
+
+def _nearest(donors: np.ndarray, queries: np.ndarray, k: int):
+    """Distances and indices of the k nearest donors for every query row"""
+    distances, indices = spatial.cKDTree(donors).query(queries, k=k)
+    return distances.reshape(len(queries), k), indices.reshape(len(queries), k)
+
+
+def knn_impute(features: np.ndarray, target: np.ndarray, k: int = DEFAULT_NEIGHBOURS,
+               groups: Optional[Sequence[str]] = None, log_target: bool = True) -> np.ndarray:
+    """
+    Fill NaNs in ``target`` from the k nearest rows (by ``features``) whose
+    target is known. Features must be complete. With ``groups``, neighbours
+    come from the same group when it has at least k donors.
+    Returns a copy of target with the gaps filled.
+    """
+    features = np.asarray(features, dtype=float)
+    target = np.asarray(target, dtype=float)
+    result = target.copy()
+
+    missing = np.isnan(target)
+    donors = ~missing
+    if not missing.any() or not donors.any():
+        return result
+
+    # Standardise over the donors so every feature counts equally
+    mean = features[donors].mean(axis=0)
+    std = features[donors].std(axis=0)
+    scaled = (features - mean) / np.where(std > 0, std, 1.0)
+    values = np.log(target) if log_target else target
+
+    def fill(query_rows: np.ndarray, donor_rows: np.ndarray) -> None:
+        neighbours = min(k, len(donor_rows))
+        distances, indices = _nearest(scaled[donor_rows], scaled[query_rows], neighbours)
+        weights = 1.0 / (distances + 1e-9)
+        estimate = (weights * values[donor_rows][indices]).sum(axis=1) / weights.sum(axis=1)
+        result[query_rows] = np.exp(estimate) if log_target else estimate
+
+    if groups is None:
+        fill(np.nonzero(missing)[0], np.nonzero(donors)[0])
+        return result
+
+    groups = np.asarray(groups)
+    pooled = []
+    for group in np.unique(groups[missing]):
+        in_group = groups == group
+        group_donors = np.nonzero(in_group & donors)[0]
+        group_missing = np.nonzero(in_group & missing)[0]
+        if len(group_donors) >= k:
+            fill(group_missing, group_donors)
+        else:
+            pooled.append(group_missing)
+    if pooled:
+        # Groups too small to supply k neighbours draw from all donors
+        fill(np.concatenate(pooled), np.nonzero(donors)[0])
+    return result
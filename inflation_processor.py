@@ -5,14 +5,18 @@ def process_inflation_data():
     """
     Process the World Bank raw inflation data to create INFLATION.csv with country code and inflation values.
     Priority: Use 2024 data if available, otherwise use 2023 data. Skip if neither available.
+    The year the value was taken from is recorded alongside it.
+    Both years' values are also kept in INFLATION_HISTORY.csv for rate projections.
     """
     input_file = 'data/raw inflation data from world bank.csv'
     output_file = 'final_data/INFLATION.csv'
+    history_file = 'final_data/INFLATION_HISTORY.csv'
     
     # Ensure output directory exists
     os.makedirs('final_data', exist_ok=True)
     
     processed_data = []
+    history_data = []
     
     with open(input_file, 'r', encoding='utf-8') as infile:
         csv_reader = csv.reader(infile)
@@ -33,13 +37,15 @@ def process_inflation_data():
             if not country_code:
                 continue
             
-            # Determine which inflation value to use
+            # Determine which inflation value to use, and from which year
             inflation_value = None
+            source_year = None
             
             # Priority: Use 2024 if available and not ".."
             if inflation_2024 and inflation_2024 != "..":
                 try:
                     inflation_value = float(inflation_2024)
+                    source_year = 2024
                 except ValueError:
                     inflation_value = None
             
@@ -47,24 +53,36 @@ def process_inflation_data():
             if inflation_value is None and inflation_2023 and inflation_2023 != "..":
                 try:
                     inflation_value = float(inflation_2023)
+                    source_year = 2023
                 except ValueError:
                     inflation_value = None
             
             # If we have a valid inflation value, add to processed data
             if inflation_value is not None:
-                processed_data.append([country_code, inflation_value])
+                processed_data.append([country_code, inflation_value, source_year])
+                history_data.append([
+                    country_code,
+                    inflation_2023 if inflation_2023 != ".." else "",
+                    inflation_2024 if inflation_2024 != ".." else ""
+                ])
     
     # Write the processed data to output CSV
     with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
         csv_writer = csv.writer(outfile)
         
         # Write header
-        csv_writer.writerow(['country code', 'inflation'])
+        csv_writer.writerow(['country code', 'inflation', 'year'])
         
         # Write data rows
         csv_writer.writerows(processed_data)
     
-    print(f"Successfully created {output_file}")
+    # Write the per-year history (blank where a year is missing)
+    with open(history_file, 'w', newline='', encoding='utf-8') as outfile:
+        csv_writer = csv.writer(outfile)
+        csv_writer.writerow(['country code', '2023', '2024'])
+        csv_writer.writerows(history_data)
+    
+    print(f"Successfully created {output_file} and {history_file}")
     print(f"Processed {len(processed_data)} countries with valid inflation data")
     
     return len(processed_data)
@@ -0,0 +1,45 @@
+"""
+Deferred module imports
+
+Heavy dependencies such as pandas and numpy are only needed by the pipeline and
+a few analysis paths. Binding them through ``lazy_module`` keeps the familiar
+``pd.read_csv(...)`` call sites while postponing the actual import until the
+first attribute access, so short-lived lookups never pay for it.
+"""
+
+import importlib
+import sys
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Module proxy that imports the real module on first attribute access"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = None
+
+    def _load(self) -> ModuleType:
+        target = self.__dict__['_lazy_target']
+        if target is None:
+            target = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_target'] = target
+        return target
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> ModuleType:
+    """Return the module if it is already imported, otherwise a lazy proxy for it"""
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    """Whether the named module has actually been imported"""
+    return name in sys.modules
@@ -0,0 +1,153 @@
+"""
+Pipeline stage tracing
+
+Wraps each stage of the rate pipeline (load, validate, merge, missing-data fill,
+rate calc, save) and records:
+- Wall time and CPU time
+- The change in resident set size (RSS) over the stage, the process peak RSS
+  so far and, when enabled, peak Python heap allocation (tracemalloc)
+- Row counts reported by the stage
+
+Heap tracing slows the traced code down considerably, so it is opt-in
+(``trace_memory``). It runs only while a stage is executing and is stopped
+when the stage ends, even if it fails, so long-lived processes never keep it
+on.
+
+The collected records are written as a machine-readable JSON run report next to
+the rates output so pipeline cost can be tracked across data refreshes.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, if the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 2)
+    return round(peak / 1024, 2)
+
+
+def _current_rss_mb() -> Optional[float]:
+    """Current resident set size of this process in MB, where /proc reports it"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 2)
+
+
+class PipelineTracer:
+    """
+    Collects timing and memory records for named pipeline stages
+    """
+
+    def __init__(self, pipeline: str = "rate_calculation", trace_memory: bool = False):
+        self.pipeline = pipeline
+        self.trace_memory = trace_memory
+        self.stages: List[Dict] = []
+        self.started_at = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._owns_tracemalloc = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """
+        Trace a single pipeline stage.
+
+        Yields the stage record so the caller can attach row counts or other
+        details, e.g. ``record['rows'] = len(df)``.
+        """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+
+        record = {'stage': name, 'rows': None, 'status': 'ok'}
+        rss_start = _current_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield record
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+            raise
+        finally:
+            record['wall_time_s'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_time_s'] = round(time.process_time() - cpu_start, 6)
+            if self.trace_memory and tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                record['peak_tracemalloc_mb'] = round(peak / (1024 * 1024), 3)
+            if started_tracing:
+                self.close()
+            # ru_maxrss only ever grows over the process lifetime, so the stage's
+            # own footprint is the change in current RSS
+            rss_end = _current_rss_mb()
+            record['rss_delta_mb'] = (round(rss_end - rss_start, 2)
+                                      if rss_start is not None and rss_end is not None else None)
+            record['process_peak_rss_mb'] = _peak_rss_mb()
+            self.stages.append(record)
+
+            logger.debug(f"Stage '{name}': wall={record['wall_time_s']:.3f}s, "
+                         f"cpu={record['cpu_time_s']:.3f}s, rows={record['rows']}")
+
+    def report(self) -> Dict:
+        """Build the run report as a JSON-serialisable dict"""
+        return {
+            'pipeline': self.pipeline,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'total_wall_time_s': round(time.perf_counter() - self._wall_start, 6),
+            'total_cpu_time_s': round(time.process_time() - self._cpu_start, 6),
+            'process_peak_rss_mb': _peak_rss_mb(),
+            'stages': self.stages,
+        }
+
+    def write_report(self, report_path: str, history_path: Optional[str] = None) -> Dict:
+        """
+        Write the run report as JSON, optionally appending it to a JSON-lines
+        history file so cost can be compared across runs.
+        """
+        report = self.report()
+
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        if history_path:
+            with open(history_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report) + '\n')
+
+        logger.info(f"Run report saved to {report_path} "
+                    f"(total {report['total_wall_time_s']:.3f}s)")
+        return report
+
+    def close(self) -> None:
+        """Stop memory tracing if this tracer started it (stages do this themselves when they end)"""
+        if self._owns_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._owns_tracemalloc = False
@@ -5,6 +5,7 @@ def process_ppp_data():
     """
     Process the World Bank raw data to create PPP.csv with country code and PPP values.
     Priority: Use 2024 data if available, otherwise use 2023 data. Skip if neither available.
+    The year the value was taken from is recorded alongside it.
     """
     input_file = 'data/raw data from worldbank.csv'
     output_file = 'final_data/PPP.csv'
@@ -33,13 +34,15 @@ def process_ppp_data():
             if not country_code:
                 continue
             
-            # Determine which PPP value to use
+            # Determine which PPP value to use, and from which year
             ppp_value = None
+            source_year = None
             
             # Priority: Use 2024 if available and not ".."
             if ppp_2024 and ppp_2024 != "..":
                 try:
                     ppp_value = float(ppp_2024)
+                    source_year = 2024
                 except ValueError:
                     ppp_value = None
             
@@ -47,19 +50,20 @@ def process_ppp_data():
             if ppp_value is None and ppp_2023 and ppp_2023 != "..":
                 try:
                     ppp_value = float(ppp_2023)
+                    source_year = 2023
                 except ValueError:
                     ppp_value = None
             
             # If we have a valid PPP value, add to processed data
             if ppp_value is not None:
-                processed_data.append([country_code, ppp_value])
+                processed_data.append([country_code, ppp_value, source_year])
     
     # Write the processed data to output CSV
     with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
         csv_writer = csv.writer(outfile)
         
         # Write header
-        csv_writer.writerow(['country code', 'PPP'])
+        csv_writer.writerow(['country code', 'PPP', 'year'])
         
         # Write data rows
         csv_writer.writerows(processed_data)
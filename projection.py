@@ -0,0 +1,166 @@
+"""
+Forward rate projections under compounding inflation
+
+Projects each country's rate forward by year or by month, compounding it with
+the country's own inflation path:
+
+- ``latest``: the inflation value used for the current rates, held constant
+- ``mean``: the mean of the yearly history (INFLATION_HISTORY.csv), held constant
+- ``trend``: the linear trend through the yearly history, damped so it levels
+  off, and kept within the range the country has actually observed
+
+Countries without history fall back to the latest value, and ``trend`` falls
+back to it for countries with fewer than MIN_TREND_YEARS observed years. Growth paths are
+computed for all countries at once as a countries x horizon array and cached
+per snapshot, so serving one country's projection is a row lookup.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence
+
+from factor_cache import FactorCache
+from lazy_import import lazy_module
+
+np = lazy_module('numpy')
+
+METHODS = ('latest', 'mean', 'trend')
+STEPS = {'year': 1, 'month': 12}
+
+# Longest projection served, in years
+MAX_HORIZON_YEARS = 50
+
+# Annual inflation never goes below -99% (prices stay positive) when extrapolating a trend
+MIN_ANNUAL_INFLATION = -99.0
+
+# Observed years needed before a trend is extrapolated
+MIN_TREND_YEARS = 3
+# Share of the trend's yearly change carried into each following year; the
+# total change levels off at slope * TREND_DAMPING / (1 - TREND_DAMPING)
+TREND_DAMPING = 0.5
+
+# Growth tables kept per snapshot
+MAX_CACHED_TABLES = 32
+
+
+class RateProjector:
+    """
+    Inflation paths and cumulative growth for every country in a snapshot
+    """
+
+    def __init__(self, codes: Sequence[str], inflation, history: Optional[Dict[int, Sequence[float]]] = None,
+                 version: Optional[str] = None):
+        self.codes = list(codes)
+        self.version = version
+        self.latest = np.asarray(inflation, dtype=float)
+        self.years = sorted(history or {})
+        # countries x years, NaN where a year is missing
+        self.history = (np.column_stack([np.asarray(history[year], dtype=float) for year in self.years])
+                        if self.years else np.empty((len(self.codes), 0)))
+        self._index = {code.upper(): i for i, code in enumerate(self.codes)}
+        self._cache = FactorCache(maxsize=MAX_CACHED_TABLES)
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> 'RateProjector':
+        """Build from a rates snapshot with indicator and inflation history columns"""
+        if not snapshot.has_column('inflation'):
+            raise ValueError("Snapshot has no indicator columns")
+        history = {
+            year: snapshot.column(f'inflation_history:{year}')
+            for year in snapshot.meta.get('inflation_history_years', [])
+        }
+        return cls(snapshot.column('CountryCode'), snapshot.column('inflation'), history, snapshot.version)
+
+    def position(self, country_code: str) -> Optional[int]:
+        return self._index.get(country_code.upper())
+
+    def trended(self) -> np.ndarray:
+        """
+        Countries with enough observed years (MIN_TREND_YEARS) for the trend
+        method; the others are projected at their latest inflation.
+        """
+        return (~np.isnan(self.history)).sum(axis=1) >= MIN_TREND_YEARS
+
+    def _baseline(self) -> np.ndarray:
+        """Inflation at the start of the projection: latest history value, else the rate's input"""
+        baseline = self.latest.copy()
+        for column in range(self.history.shape[1]):
+            values = self.history[:, column]
+            baseline = np.where(np.isnan(values), baseline, values)
+        return baseline
+
+    def inflation_paths(self, method: str, step: str, horizon: int) -> np.ndarray:
+        """Annual inflation (%) applied in each projection period, as countries x horizon"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown projection method: {method}")
+        if step not in STEPS:
+            raise ValueError(f"Unknown projection step: {step}")
+
+        n = len(self.codes)
+        if method == 'latest' or not self.years:
+            level = self.latest
+        elif method == 'mean':
+            observed = ~np.isnan(self.history)
+            counts = observed.sum(axis=1)
+            totals = np.where(observed, self.history, 0.0).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                level = np.where(counts > 0, totals / counts, self.latest)
+        else:
+            level = None
+
+        if level is not None:
+            return np.broadcast_to(level[:, None], (n, horizon))
+
+        # Least-squares slope per country over its observed years
+        years = np.asarray(self.years, dtype=float)
+        observed = ~np.isnan(self.history)
+        counts = observed.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            year_mean = np.where(observed, years, 0.0).sum(axis=1) / counts
+            value_mean = np.where(observed, self.history, 0.0).sum(axis=1) / counts
+            dx = np.where(observed, years - year_mean[:, None], 0.0)
+            dy = np.where(observed, self.history - value_mean[:, None], 0.0)
+            slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+            lowest = np.nanmin(np.where(observed, self.history, np.inf), axis=1)
+            highest = np.nanmax(np.where(observed, self.history, -np.inf), axis=1)
+        trended = self.trended()
+        slope = np.where(trended, slope, 0.0)
+
+        # Period k covers years (k-1, k] after the latest observation; use its end point.
+        # Damped trend: the change in year j is slope * TREND_DAMPING ** j
+        elapsed = np.arange(1, horizon + 1) / STEPS[step]
+        damped = TREND_DAMPING * (1.0 - TREND_DAMPING ** elapsed) / (1.0 - TREND_DAMPING)
+        paths = self._baseline()[:, None] + slope[:, None] * damped[None, :]
+        # Never beyond the inflation the country has observed
+        paths = np.clip(paths, np.where(trended, lowest, -np.inf)[:, None],
+                        np.where(trended, highest, np.inf)[:, None])
+        paths = np.where(trended[:, None], paths, self.latest[:, None])
+        return np.maximum(paths, MIN_ANNUAL_INFLATION)
+
+    def _table(self, method: str, step: str, horizon: int):
+        """Inflation paths and cumulative growth for all countries, cached per snapshot"""
+        def compute():
+            paths = self.inflation_paths(method, step, horizon)
+            per_period = (1.0 + paths / 100.0) ** (1.0 / STEPS[step])
+            return paths, np.cumprod(per_period, axis=1)
+
+        return self._cache.get_or_compute(self.version, (method, step, horizon), compute)
+
+    def growth(self, method: str = 'latest', step: str = 'year', horizon: int = 5) -> np.ndarray:
+        """Cumulative price growth after each period, as countries x horizon"""
+        return self._table(method, step, horizon)[1]
+
+    def project(self, rates, method: str = 'latest', step: str = 'year', horizon: int = 5) -> np.ndarray:
+        """Projected rates for every country, as countries x horizon, rounded to cents"""
+        rates = np.asarray(rates, dtype=float)
+        return np.round(rates[:, None] * self.growth(method, step, horizon), 2)
+
+    def project_country(self, position: int, rate: float, method: str = 'latest',
+                        step: str = 'year', horizon: int = 5) -> List[Dict]:
+        """One country's projection: the inflation applied and the rate after each period"""
+        paths, growth = self._table(method, step, horizon)
+        return [
+            {'period': k + 1, 'inflation': round(float(paths[position, k]), 4),
+             'Rate': round(rate * float(growth[position, k]), 2)}
+            for k in range(horizon)
+        ]
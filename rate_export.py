@@ -0,0 +1,207 @@
+"""
+Bulk export of the rates snapshot
+
+Exports hold one row per country, in snapshot (CountryCode) order, with the
+code and rate and optionally the rate explanation columns and the inflation
+history. Formats:
+- ``csv`` / ``ndjson``: streamed from the snapshot in fixed-size chunks, so
+  memory stays constant whatever the table size
+- ``parquet``: written once per snapshot version under rates/exports/
+  (requires pyarrow) and served as a file
+
+The CSV exports without history have the same layout as rates/rates.csv and
+rates/explanations.csv. The pipeline records the signature (size, mtime and
+inode) of the files it wrote in the snapshot header, so while they are still
+those exact files they are served as-is: sendfile, conditional requests and
+byte ranges for resumable downloads. A file rewritten since, even with the
+same size, is not served; the export is streamed from the snapshot instead.
+"""
+
+import csv
+import io
+import json
+import math
+import os
+from typing import BinaryIO, Iterator, List, Optional, Sequence
+
+from snapshot import SnapshotError
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+INCLUDE_OPTIONS = ('explanations', 'history')
+
+EXPORT_DIR = os.path.join('rates', 'exports')
+CHUNK_ROWS = 1000
+
+# Pre-built files written with every snapshot: include options -> file name
+PREBUILT_CSV = {
+    (): 'rates.csv',
+    ('explanations',): 'explanations.csv',
+}
+
+
+def export_columns(snapshot, include: Sequence[str] = ()) -> List[str]:
+    """Snapshot columns in an export, in output order. Raises SnapshotError if included data is missing."""
+    columns = ['CountryCode', 'Rate']
+    if 'explanations' in include:
+        if not snapshot.meta.get('explanation_columns'):
+            raise SnapshotError("Snapshot has no explanation data")
+        columns += snapshot.meta['explanation_columns']
+    if 'history' in include:
+        if not snapshot.meta.get('inflation_history_years'):
+            raise SnapshotError("Snapshot has no inflation history")
+        columns += [f'inflation_history:{year}' for year in snapshot.meta['inflation_history_years']]
+    return columns
+
+
+def _columns(snapshot, columns: Sequence[str], rates: Optional[Sequence[float]]) -> List[Sequence]:
+    """Column data for an export; strings are decoded row by row, not up front"""
+    data = []
+    for name in columns:
+        if name == 'Rate' and rates is not None:
+            data.append(rates)
+        elif snapshot.header['columns'][name]['kind'] == 'str':
+            data.append(snapshot.strings(name))
+        else:
+            data.append(snapshot.column(name))
+    return data
+
+
+def program_rates(snapshot, program: Optional[str]) -> Optional[Sequence[float]]:
+    """
+    Rates of a grant program in snapshot order, or None for the default
+    program (the Rate column). Raises SnapshotError if the program is unknown.
+    """
+    if not program or program == snapshot.meta.get('default_program', 'default'):
+        return None
+    column = f'program:{program}'
+    if not snapshot.has_column(column):
+        raise SnapshotError(f"Unknown program: {program}")
+    return snapshot.column(column)
+
+
+def export_name(snapshot, fmt: str, include: Sequence[str] = ()) -> str:
+    """Download file name, labelled with the snapshot version"""
+    suffix = ''.join(f'-{option}' for option in include)
+    return f'rates-{snapshot.version}{suffix}.{fmt}'
+
+
+def open_prebuilt(snapshot, fmt: str, include: Sequence[str] = ()) -> Optional[BinaryIO]:
+    """
+    Open file already on disk holding this export, if it is still the file
+    written with the snapshot (signature recorded in the snapshot header).
+    The check is made on the opened file, so a concurrent rewrite of the path
+    cannot slip in between. The caller closes the file.
+    """
+    name = PREBUILT_CSV.get(tuple(include)) if fmt == 'csv' else None
+    recorded = snapshot.meta.get('files', {}).get(name) if name else None
+    if not isinstance(recorded, dict) or not snapshot.source:
+        return None
+    try:
+        f = open(os.path.join(os.path.dirname(snapshot.source), name), 'rb')
+    except OSError:
+        return None
+    stat = os.fstat(f.fileno())
+    if (stat.st_size, stat.st_mtime_ns, stat.st_ino) != (recorded.get('size'), recorded.get('mtime_ns'),
+                                                          recorded.get('inode')):
+        f.close()
+        return None
+    return f
+
+
+def _csv_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return value
+
+
+def _json_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def iter_csv(snapshot, columns: Sequence[str], rates: Optional[Sequence[float]] = None) -> Iterator[bytes]:
+    """CSV export as encoded chunks of CHUNK_ROWS rows. ``rates`` replaces the Rate column."""
+    data = _columns(snapshot, columns, rates)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for start in range(0, snapshot.rows, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, snapshot.rows)
+        writer.writerows([_csv_value(column[i]) for column in data] for i in range(start, end))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(snapshot, columns: Sequence[str], rates: Optional[Sequence[float]] = None) -> Iterator[bytes]:
+    """Newline-delimited JSON export as encoded chunks of CHUNK_ROWS rows"""
+    data = _columns(snapshot, columns, rates)
+    for start in range(0, snapshot.rows, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, snapshot.rows)
+        lines = [json.dumps({name: _json_value(column[i]) for name, column in zip(columns, data)},
+                            ensure_ascii=False)
+                 for i in range(start, end)]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def parquet_export(snapshot, columns: Sequence[str], include: Sequence[str] = (),
+                   rates: Optional[Sequence[float]] = None, program: Optional[str] = None,
+                   export_dir: str = EXPORT_DIR) -> str:
+    """
+    Path of the Parquet export for this snapshot version, writing it (in
+    row groups of CHUNK_ROWS) on first use. Raises ImportError without pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    name = export_name(snapshot, 'parquet', include)
+    if program:
+        name = name.replace('.parquet', f'-{program}.parquet')
+    path = os.path.join(export_dir, name)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(export_dir, exist_ok=True)
+    data = _columns(snapshot, columns, rates)
+    kinds = [snapshot.header['columns'][column]['kind'] for column in columns]
+    types = {'str': pa.string(), 'f64': pa.float64(), 'u32': pa.uint32(), 'u8': pa.uint8()}
+    schema = pa.schema([(column, types[kind]) for column, kind in zip(columns, kinds)])
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for start in range(0, snapshot.rows, CHUNK_ROWS):
+                end = min(start + CHUNK_ROWS, snapshot.rows)
+                writer.write_table(pa.table(
+                    [pa.array(list(column[start:end]), type=schema.field(i).type) for i, column in enumerate(data)],
+                    schema=schema
+                ))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Exports of older versions are no longer served
+    current = export_name(snapshot, 'parquet')[:-len('.parquet')]
+    for entry in os.scandir(export_dir):
+        if entry.name.endswith('.parquet') and entry.name != f'{current}.parquet' \
+                and not entry.name.startswith(f'{current}-'):
+            os.remove(entry.path)
+    return path
+
+
+def parse_include(value: Optional[str]) -> List[str]:
+    """Include options from a comma-separated parameter, in canonical order. Raises ValueError."""
+    requested = [option.strip() for option in (value or '').split(',') if option.strip()]
+    unknown = [option for option in requested if option not in INCLUDE_OPTIONS]
+    if unknown:
+        raise ValueError(f"Invalid include: {', '.join(unknown)}")
+    return [option for option in INCLUDE_OPTIONS if option in requested]
@@ -0,0 +1,366 @@
+"""
+SQLite serving store for country rates
+
+An optional alternative to holding every rate table in each worker's memory.
+The pipeline publishes each snapshot into rates/rates.db:
+- ``rates``: one row per country, keyed by its snapshot position, with
+  indexes on the country code (case-insensitive), normalised name and rate
+- ``program_rates``: rates of every other grant program
+- ``rates_fts``: FTS5 trigram index over codes and normalised names, for
+  substring search
+- ``explanations``: the per-country rate breakdown, as JSON
+- ``versions``: every published snapshot version with its header metadata
+
+The database runs in WAL mode and a publish replaces the rows in a single
+transaction, so readers keep serving the previous version until it commits.
+Readers use one connection per thread and constant SQL text, so statements
+are prepared once per connection and reused from sqlite3's statement cache.
+
+The pipeline always publishes the store next to the snapshot; the serving
+backend is selected with the RATES_BACKEND environment variable
+(``snapshot``, the default, or ``sqlite``). The app only serves from the
+store while its version matches the current snapshot.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from country_groups import group_stats
+from rate_table import DEFAULT_PROGRAM, SORT_COLUMNS, RateTable, empty_stats
+
+RATES_DB_PATH = os.path.join('rates', 'rates.db')
+
+BACKEND_ENV = 'RATES_BACKEND'
+BACKENDS = ('snapshot', 'sqlite')
+
+# Shortest search term the trigram index can match; shorter terms scan
+MIN_FTS_TERM = 3
+STATEMENT_CACHE_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    version TEXT PRIMARY KEY,
+    created_at TEXT,
+    published_at TEXT,
+    rows INTEGER,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS rates (
+    position INTEGER PRIMARY KEY,
+    code TEXT NOT NULL COLLATE NOCASE UNIQUE,
+    name TEXT NOT NULL,
+    name_norm TEXT NOT NULL,
+    flag TEXT,
+    rate REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rates_name ON rates (name);
+CREATE INDEX IF NOT EXISTS rates_name_norm ON rates (name_norm);
+CREATE INDEX IF NOT EXISTS rates_rate ON rates (rate);
+CREATE TABLE IF NOT EXISTS program_rates (
+    program TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (program, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS program_rates_rate ON program_rates (program, rate);
+CREATE TABLE IF NOT EXISTS explanations (
+    position INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS rates_fts USING fts5(
+    code, name_norm, content='rates', content_rowid='position', tokenize='trigram'
+);
+"""
+
+# Sort column -> SQL column (Rate depends on the program; ties keep code order, as in RateTable)
+_SORT_SQL = {'CountryName': 'r.name', 'CountryCode': 'r.code'}
+
+
+def rate_backend() -> str:
+    """Serving backend selected by the RATES_BACKEND environment variable"""
+    backend = os.environ.get(BACKEND_ENV, 'snapshot').lower()
+    return backend if backend in BACKENDS else 'snapshot'
+
+
+def normalise_name(name: str) -> str:
+    """Case- and accent-insensitive form of a name, for search"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def _create_schema(connection: sqlite3.Connection) -> bool:
+    """Create the tables; returns whether the FTS5 trigram index is available"""
+    connection.executescript(_SCHEMA)
+    try:
+        connection.executescript(_FTS_SCHEMA)
+        return True
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 (or older than 3.34): search falls back to LIKE
+        return False
+
+
+def publish_snapshot(snapshot, path: str = RATES_DB_PATH) -> bool:
+    """
+    Write a rates snapshot into the store and make it the current version.
+    Returns False if that version is already current.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    connection = _connect(path)
+    try:
+        has_fts = _create_schema(connection)
+        current = connection.execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+        if current and current[0] == snapshot.version:
+            return False
+
+        table = RateTable.from_snapshot(snapshot)
+        programs = [program for program in snapshot.meta.get('programs', {})
+                    if program != DEFAULT_PROGRAM and snapshot.has_column(f'program:{program}')]
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM rates')
+            connection.execute('DELETE FROM program_rates')
+            connection.execute('DELETE FROM explanations')
+            connection.executemany(
+                'INSERT INTO rates (position, code, name, name_norm, flag, rate) VALUES (?, ?, ?, ?, ?, ?)',
+                ((i, table.codes[i], table.names[i], normalise_name(table.names[i]), table.flag(i), table.rates[i])
+                 for i in range(len(table)))
+            )
+            for program in programs:
+                connection.executemany(
+                    'INSERT INTO program_rates (program, position, rate) VALUES (?, ?, ?)',
+                    ((program, i, rate) for i, rate in enumerate(snapshot.column(f'program:{program}')))
+                )
+            if snapshot.has_column('adjustment_factor'):
+                connection.executemany(
+                    'INSERT INTO explanations (position, data) VALUES (?, ?)',
+                    ((i, json.dumps(table.explain(i))) for i in range(len(table)))
+                )
+            if has_fts:
+                connection.execute("INSERT INTO rates_fts (rates_fts) VALUES ('rebuild')")
+            connection.execute(
+                'INSERT OR REPLACE INTO versions (version, created_at, published_at, rows, meta) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (snapshot.version, snapshot.created_at, datetime.now(timezone.utc).isoformat(),
+                 snapshot.rows, json.dumps(snapshot.meta))
+            )
+            connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('version', ?)",
+                               (snapshot.version,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+    finally:
+        connection.close()
+
+
+class SQLiteRateStore:
+    """
+    Read side of the store, with the RateTable interface used by the API
+    handlers. Positions are snapshot row positions. ``for_program`` returns a
+    view of another grant program's rates sharing the same connections.
+    """
+
+    snapshot = None
+
+    def __init__(self, path: str = RATES_DB_PATH):
+        self.path = path
+        self.program = DEFAULT_PROGRAM
+        self._local = threading.local()
+        self._meta_cache: Dict[str, Dict] = {}
+        self._row_counts: Dict[str, int] = {}
+        self._views: Dict[str, 'SQLiteRateStore'] = {DEFAULT_PROGRAM: self}
+        self._has_fts = self._execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'rates_fts'").fetchone() is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True,
+                                         cached_statements=STATEMENT_CACHE_SIZE)
+            connection.execute('PRAGMA query_only=1')
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> sqlite3.Cursor:
+        return self._connection().execute(sql, parameters)
+
+    # Rate source for the selected program: its own table, or the program matrix
+    def _from(self) -> Tuple[str, Tuple]:
+        if self.program == DEFAULT_PROGRAM:
+            return 'rates r', ()
+        return 'rates r JOIN program_rates p ON p.position = r.position AND p.program = ?', (self.program,)
+
+    def _rate(self) -> str:
+        return 'r.rate' if self.program == DEFAULT_PROGRAM else 'p.rate'
+
+    @property
+    def version(self) -> Optional[str]:
+        row = self._execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    @property
+    def meta(self) -> Dict:
+        """Header metadata of the current version"""
+        version = self.version
+        if version not in self._meta_cache:
+            row = self._execute('SELECT meta FROM versions WHERE version = ?', (version,)).fetchone()
+            self._meta_cache = {version: json.loads(row[0]) if row else {}}
+        return self._meta_cache[version]
+
+    def programs(self) -> Dict[str, Dict]:
+        return self.meta.get('programs', {})
+
+    def for_program(self, program: Optional[str]) -> Optional['SQLiteRateStore']:
+        if not program or program == self.program:
+            return self
+        if program not in self._views:
+            if program not in self.programs():
+                return None
+            view = copy.copy(self)
+            view.program = program
+            self._views[program] = view
+        return self._views[program]
+
+    def __len__(self) -> int:
+        # COUNT(*) scans the table, so it is counted once per published version
+        version = self.version
+        count = self._row_counts.get(version)
+        if count is None:
+            count = self._execute('SELECT COUNT(*) FROM rates').fetchone()[0]
+            self._row_counts = {version: count}
+        return count
+
+    def __bool__(self) -> bool:
+        return self._execute('SELECT 1 FROM rates LIMIT 1').fetchone() is not None
+
+    def lookup(self, country_code: str) -> Optional[int]:
+        row = self._execute('SELECT position FROM rates WHERE code = ?', (country_code,)).fetchone()
+        return row[0] if row else None
+
+    def _select(self) -> str:
+        source, _ = self._from()
+        return f'SELECT r.position, r.code, r.name, r.flag, {self._rate()} AS rate FROM {source}'
+
+    @staticmethod
+    def _record(row) -> Dict:
+        return {'CountryCode': row[1], 'CountryName': row[2], 'CountryFlag': row[3], 'Rate': row[4]}
+
+    def record(self, position: int) -> Optional[Dict]:
+        _, parameters = self._from()
+        row = self._execute(f'{self._select()} WHERE r.position = ?', parameters + (position,)).fetchone()
+        return self._record(row) if row else None
+
+    def records(self, positions: Iterable[int], fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        positions = list(positions)
+        _, parameters = self._from()
+        rows = self._execute(
+            f'{self._select()} WHERE r.position IN (SELECT value FROM json_each(?))',
+            parameters + (json.dumps(positions),)
+        ).fetchall()
+        by_position = {row[0]: self._record(row) for row in rows}
+        records = [by_position[position] for position in positions if position in by_position]
+        if fields is not None:
+            records = [{field: record[field] for field in fields} for record in records]
+        return records
+
+    def rate(self, position: int) -> float:
+        return self.record(position)['Rate']
+
+    def explain(self, position: int) -> Optional[Dict]:
+        row = self._execute('SELECT data FROM explanations WHERE position = ?', (position,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def group_stats(self, dimension: str) -> Optional[Dict]:
+        return group_stats(self, dimension, self.program)
+
+    def _search_condition(self, search: str) -> Tuple[str, Tuple]:
+        term = normalise_name(search)
+        if self._has_fts and len(term) >= MIN_FTS_TERM:
+            phrase = '"' + term.replace('"', '""') + '"'
+            return 'r.position IN (SELECT rowid FROM rates_fts WHERE rates_fts MATCH ?)', (phrase,)
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return "(r.name_norm LIKE ? ESCAPE '\\' OR r.code LIKE ? ESCAPE '\\')", (pattern, pattern)
+
+    def order(self, sort_by: str = 'CountryName', ascending: bool = True) -> List[int]:
+        positions, _ = self.query('', sort_by, ascending, 1, -1)
+        return positions
+
+    def query(self, search: str = '', sort_by: str = 'CountryName', ascending: bool = True,
+              page: int = 1, per_page: int = 20, after: Optional[Tuple] = None) -> Tuple[List[int], int]:
+        """
+        Filter, sort and paginate in SQL, by page number or from a keyset
+        cursor (``after``). Returns the page's positions and the match count.
+        """
+        if sort_by not in SORT_COLUMNS:
+            raise KeyError(sort_by)
+        source, parameters = self._from()
+        column = self._rate() if sort_by == 'Rate' else _SORT_SQL[sort_by]
+        direction = 'ASC' if ascending else 'DESC'
+        limit = per_page if per_page >= 0 else -1
+
+        where, search_parameters = '', ()
+        if search:
+            condition, search_parameters = self._search_condition(search)
+            where = f' WHERE {condition}'
+        seek, seek_parameters, offset = '', (), max(page - 1, 0) * max(per_page, 0)
+        if after is not None:
+            # Rows after (value, code) in this order; ties are in code order
+            comparison = '>' if ascending else '<'
+            seek = f'{" AND" if where else " WHERE"} ({column} {comparison} ? OR ({column} = ? AND r.code > ?))'
+            seek_parameters, offset = (after[0], after[0], after[1]), 0
+
+        rows = self._execute(
+            f'SELECT r.position FROM {source}{where}{seek} ORDER BY {column} {direction}, r.position ASC '
+            f'LIMIT ? OFFSET ?',
+            parameters + search_parameters + seek_parameters + (limit, offset)
+        ).fetchall()
+        if where:
+            total = self._execute(f'SELECT COUNT(*) FROM {source}{where}',
+                                  parameters + search_parameters).fetchone()[0]
+        else:
+            total = len(self)
+        return [row[0] for row in rows], total
+
+    def stats(self) -> Dict:
+        """Global summary statistics of the rates, computed in SQL"""
+        source, parameters = self._from()
+        rate = self._rate()
+        count, mean, low, high = self._execute(
+            f'SELECT COUNT(*), AVG({rate}), MIN({rate}), MAX({rate}) FROM {source}', parameters
+        ).fetchone()
+        if not count:
+            return empty_stats()
+        # Median: the middle one or two values along the rate index
+        middle = [row[0] for row in self._execute(
+            f'SELECT {rate} FROM {source} ORDER BY {rate} LIMIT ? OFFSET ?',
+            parameters + (2 - count % 2, (count - 1) // 2)
+        ).fetchall()]
+        return {
+            'total_countries': count,
+            'avg_rate': round(mean, 2),
+            'min_rate': round(low, 2),
+            'max_rate': round(high, 2),
+            'median_rate': round(sum(middle) / len(middle), 2)
+        }
@@ -0,0 +1,429 @@
+"""
+Compact country rate table for serving
+
+Holds the serving data as parallel columns instead of a pandas DataFrame:
+- ``rates``: typed float64 array (or a zero-copy view over the snapshot buffer)
+- ``codes`` / ``names``: lists of interned strings
+- ``flag_ids``: uint16 array indexing into a small table of distinct flags
+
+Lookups, search, sorting and pagination work directly on these columns. Sort
+orders are computed once per table as uint32 permutations and reused by every
+request, so a request only touches the rows it returns.
+
+Pages can also be addressed by a keyset cursor (the sort value and code of
+the last row returned), found by binary search in the sort order. Unlike an
+offset, a cursor stays valid when a new snapshot is swapped in.
+
+Tables over a snapshot that stores its serving indexes attach without any
+per-row work: strings are decoded on access, and the sort orders and code
+lookup come straight from the (shared, mapped) snapshot.
+"""
+
+import base64
+import binascii
+import csv
+import difflib
+import json
+import statistics
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from country_groups import group_stats
+from snapshot import DEFAULT_FLAG, INDEX_COLUMN, ORDERED_COLUMNS, CodeIndex, order_column
+
+SORT_COLUMNS = ('CountryName', 'CountryCode', 'Rate')
+RECORD_FIELDS = ('CountryCode', 'CountryName', 'CountryFlag', 'Rate')
+DEFAULT_PROGRAM = 'default'
+
+# Fuzzy name matching: similarity cutoff and shortest query considered
+FUZZY_CUTOFF = 0.8
+MIN_FUZZY_LENGTH = 4
+
+
+def encode_cursor(sort_by: str, ascending: bool, record: Dict) -> str:
+    """Opaque keyset cursor pointing just after a record in a sort order"""
+    key = [sort_by, 'asc' if ascending else 'desc', record[sort_by], record['CountryCode']]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_by: str, ascending: bool) -> Tuple:
+    """
+    (sort value, country code) of a cursor made by encode_cursor for the same
+    sort. Raises ValueError if the cursor is malformed or for another sort.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if not isinstance(key, list) or len(key) != 4:
+        raise ValueError("Malformed cursor")
+    cursor_sort, direction, value, code = key
+    if cursor_sort != sort_by or direction != ('asc' if ascending else 'desc'):
+        raise ValueError("Cursor was issued for a different sort order")
+    expected = (int, float) if sort_by == 'Rate' else str
+    if not isinstance(value, expected) or isinstance(value, bool) or not isinstance(code, str):
+        raise ValueError("Malformed cursor")
+    return value, code
+
+
+def empty_stats() -> Dict:
+    """stats() of a table without rows"""
+    return {'total_countries': 0, 'avg_rate': None, 'min_rate': None, 'max_rate': None, 'median_rate': None}
+
+
+class RateTable:
+    """
+    Array-backed, read-only table of country rates
+    """
+
+    __slots__ = ('version', 'codes', 'names', 'rates', 'flag_ids', 'flag_table', 'snapshot',
+                 'program', '_index', '_name_index', '_search_keys', '_orders', '_programs')
+
+    def __init__(self, codes: Sequence[str], names: Sequence[str], flags: Sequence[str],
+                 rates: Sequence[float], version: Optional[str] = None, snapshot=None):
+        self.version = version
+        # Source snapshot, for the per-country columns beyond the rate itself
+        self.snapshot = snapshot
+        self.program = DEFAULT_PROGRAM
+        self.codes: List[str] = [sys.intern(code) for code in codes]
+        self.names: List[str] = [sys.intern(name) for name in names]
+        self.rates = rates if isinstance(rates, (array, memoryview)) else array('d', rates)
+
+        # Flags repeat heavily at sub-national scale, so store an id per row
+        flag_lookup: Dict[str, int] = {}
+        self.flag_ids = array('H')
+        for flag in flags:
+            flag_id = flag_lookup.get(flag)
+            if flag_id is None:
+                flag_id = flag_lookup[flag] = len(flag_lookup)
+            self.flag_ids.append(flag_id)
+        self.flag_table: List[str] = list(flag_lookup)
+
+        # Upper-cased code -> row position
+        self._index: Dict[str, int] = {code.upper(): i for i, code in enumerate(self.codes)}
+        self._name_index: Optional[Dict[str, int]] = None
+        self._search_keys: Optional[List[str]] = None
+        self._orders: Dict[Tuple[str, bool], array] = {}
+        self._programs: Dict[str, 'RateTable'] = {DEFAULT_PROGRAM: self}
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> 'RateTable':
+        """Build a table from a binary rates snapshot"""
+        if snapshot.has_column(INDEX_COLUMN):
+            return cls._attach(snapshot)
+        return cls(
+            snapshot.column('CountryCode'),
+            snapshot.column('CountryName'),
+            snapshot.column('CountryFlag'),
+            snapshot.column('Rate'),
+            version=snapshot.version,
+            snapshot=snapshot
+        )
+
+    @classmethod
+    def _attach(cls, snapshot) -> 'RateTable':
+        """Zero-copy table over a snapshot with stored sort orders and code index"""
+        table = cls.__new__(cls)
+        table.version = snapshot.version
+        table.snapshot = snapshot
+        table.program = DEFAULT_PROGRAM
+        table.codes = snapshot.strings('CountryCode')
+        table.names = snapshot.strings('CountryName')
+        table.rates = snapshot.column('Rate')
+        # Flags are read per row: the flag id of row i is i
+        table.flag_ids = range(snapshot.rows)
+        table.flag_table = snapshot.strings('CountryFlag')
+        table._index = CodeIndex(snapshot.column(INDEX_COLUMN), table.codes)
+        table._name_index = None
+        table._search_keys = None
+        table._orders = {}
+        for column in ORDERED_COLUMNS:
+            table._orders.update(cls._stored_orders(snapshot, column, column))
+        table._programs = {DEFAULT_PROGRAM: table}
+        return table
+
+    @staticmethod
+    def _stored_orders(snapshot, column: str, sort_by: str) -> Dict[Tuple[str, bool], Sequence[int]]:
+        """Sort permutations of a column stored in the snapshot, keyed as in ``order``"""
+        if snapshot is None:
+            return {}
+        return {(sort_by, ascending): snapshot.column(order_column(column, ascending))
+                for ascending in (True, False) if snapshot.has_column(order_column(column, ascending))}
+
+    @classmethod
+    def from_csv(cls, csv_path: str, country_mapping: Dict) -> 'RateTable':
+        """Build a table from rates/rates.csv, labelled with the country mapping"""
+        codes, names, flags = [], [], []
+        rates = array('d')
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                code = row['CountryCode']
+                info = country_mapping.get(code, {})
+                codes.append(code)
+                names.append(info.get('name', code))
+                flags.append(info.get('flag', DEFAULT_FLAG))
+                rates.append(float(row['Rate']))
+        return cls(codes, names, flags, rates)
+
+    def programs(self) -> Dict[str, Dict]:
+        """Registered grant programs (name -> base rate, floor, cap) stored with the rates"""
+        if self.snapshot is None:
+            return {}
+        return self.snapshot.meta.get('programs', {})
+
+    def for_program(self, program: Optional[str]) -> Optional['RateTable']:
+        """
+        The table with rates for another grant program, sharing this table's
+        codes, names, flags and indexes. None if the program is unknown.
+        """
+        if not program or program == self.program:
+            return self
+        if program in self._programs:
+            return self._programs[program]
+
+        column = f'program:{program}'
+        if self.snapshot is None or not self.snapshot.has_column(column):
+            return None
+
+        table = RateTable.__new__(RateTable)
+        for slot in ('version', 'codes', 'names', 'flag_ids', 'flag_table', 'snapshot',
+                     '_index', '_name_index', '_search_keys'):
+            setattr(table, slot, getattr(self, slot))
+        table.rates = self.snapshot.column(column)
+        table.program = program
+        # Name and code orders do not depend on the rates
+        table._orders = {key: order for key, order in self._orders.items() if key[0] != 'Rate'}
+        table._orders.update(self._stored_orders(self.snapshot, column, 'Rate'))
+        table._programs = self._programs
+        self._programs[program] = table
+        return table
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def lookup(self, country_code: str) -> Optional[int]:
+        """Row position for a country code (case-insensitive), or None"""
+        return self._index.get(country_code.upper())
+
+    def find(self, query: str, fuzzy: bool = False, cutoff: float = FUZZY_CUTOFF) -> Optional[int]:
+        """
+        Resolve a country code, a country name, or (with ``fuzzy``) a close
+        match of a country name to a row position.
+        """
+        return self.match(query, fuzzy, cutoff)[0]
+
+    def match(self, query: str, fuzzy: bool = False,
+              cutoff: float = FUZZY_CUTOFF) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Row position for a query and how it matched: 'code', 'name' or
+        'fuzzy'; (None, None) if nothing matched. Fuzzy matching only compares
+        full country names, and only for queries of at least
+        MIN_FUZZY_LENGTH characters, so a mistyped code never resolves to a
+        different country.
+        """
+        query = query.strip()
+        if not query:
+            return None, None
+
+        position = self.lookup(query)
+        if position is not None:
+            return position, 'code'
+
+        if self._name_index is None:
+            self._name_index = {}
+            for i, name in enumerate(self.names):
+                self._name_index.setdefault(name.lower(), i)
+
+        key = query.lower()
+        position = self._name_index.get(key)
+        if position is not None:
+            return position, 'name'
+        if not fuzzy or len(key) < MIN_FUZZY_LENGTH:
+            return None, None
+
+        # Names falling back to the code (no mapping entry) are codes, not names
+        candidates = [name for name, i in self._name_index.items()
+                      if len(name) >= MIN_FUZZY_LENGTH and name.upper() != self.codes[i].upper()]
+        matches = difflib.get_close_matches(key, candidates, n=1, cutoff=cutoff)
+        if not matches:
+            return None, None
+        return self._name_index[matches[0]], 'fuzzy'
+
+    def flag(self, position: int) -> str:
+        return self.flag_table[self.flag_ids[position]]
+
+    def record(self, position: int) -> Dict:
+        """A single row as a plain dict"""
+        return {
+            'CountryCode': self.codes[position],
+            'CountryName': self.names[position],
+            'CountryFlag': self.flag(position),
+            'Rate': self.rates[position]
+        }
+
+    def records(self, positions: Iterable[int], fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Rows as plain dicts, optionally restricted to some of RECORD_FIELDS"""
+        if fields is None:
+            return [self.record(position) for position in positions]
+        getters = {
+            'CountryCode': self.codes.__getitem__,
+            'CountryName': self.names.__getitem__,
+            'CountryFlag': self.flag,
+            'Rate': self.rates.__getitem__
+        }
+        selected = [(field, getters[field]) for field in fields]
+        return [{field: getter(position) for field, getter in selected} for position in positions]
+
+    def rate(self, position: int) -> float:
+        return self.rates[position]
+
+    def explain(self, position: int) -> Optional[Dict]:
+        """
+        How a row's rate was derived, read from the explanation columns stored
+        in the snapshot. None when the table has no explanation data (e.g. it
+        was loaded from the CSV).
+        """
+        snapshot = self.snapshot
+        if snapshot is None or not snapshot.has_column('adjustment_factor'):
+            return None
+
+        def value(name: str):
+            return snapshot.column(name)[position]
+
+        def year(name: str) -> Optional[int]:
+            return value(name) or None
+
+        meta = snapshot.meta
+        clipped = value('clipped')
+        return {
+            'CountryCode': self.codes[position],
+            'CountryName': self.names[position],
+            'Rate': self.rates[position],
+            'base_rate': meta.get('base_rate'),
+            'inputs': {'ppp': value('ppp'), 'inflation': value('inflation'), 'coli': value('coli')},
+            'reference': meta.get('reference'),
+            'imputed': {
+                'inflation': bool(value('inflation_imputed')),
+                'coli': bool(value('coli_imputed'))
+            },
+            'source_year': {'ppp': year('ppp_year'), 'inflation': year('inflation_year')},
+            'weights': meta.get('weights'),
+            'factors': {
+                'ppp': value('ppp_factor'),
+                'inflation': value('inflation_factor'),
+                'coli': value('coli_factor')
+            },
+            'contributions': {
+                'ppp': value('ppp_contribution'),
+                'inflation': value('inflation_contribution'),
+                'coli': value('coli_contribution')
+            },
+            'combined_factor': value('combined_factor'),
+            'adjustment_factor': value('adjustment_factor'),
+            'factor_bounds': meta.get('factor_bounds'),
+            'clipped': ('lower' if clipped == 1 else 'upper') if clipped else None,
+            'inflation_cap': meta.get('inflation_cap'),
+            'inflation_capped': bool(value('inflation_capped')),
+            'pinned_to_base_rate': bool(value('pinned')),
+            'snapshot_version': self.version
+        }
+
+    def group_stats(self, dimension: str) -> Optional[Dict]:
+        """Precomputed per-group statistics of this program's rates, or None if unavailable"""
+        return group_stats(self.snapshot, dimension, self.program)
+
+    def _column(self, sort_by: str) -> Sequence:
+        if sort_by == 'CountryName':
+            return self.names
+        if sort_by == 'CountryCode':
+            return self.codes
+        if sort_by == 'Rate':
+            return self.rates
+        raise KeyError(sort_by)
+
+    def order(self, sort_by: str = 'CountryName', ascending: bool = True) -> Sequence[int]:
+        """
+        Row permutation sorted by a column. Ties keep code order in both
+        directions. Computed once and cached.
+        """
+        key = (sort_by, ascending)
+        if key not in self._orders:
+            column = self._column(sort_by)
+            permutation = sorted(range(len(self)), key=column.__getitem__, reverse=not ascending)
+            self._orders[key] = array('I', permutation)
+        return self._orders[key]
+
+    def search(self, term: str) -> bytearray:
+        """Membership mask of rows whose code or name contains the term (case-insensitive)"""
+        if self._search_keys is None:
+            self._search_keys = [f"{code.lower()}\0{name.lower()}"
+                                 for code, name in zip(self.codes, self.names)]
+        term = term.lower()
+        return bytearray(term in key for key in self._search_keys)
+
+    def seek(self, sort_by: str, ascending: bool, after: Tuple) -> int:
+        """
+        Index in the sort order of the first row after a keyset cursor
+        (sort value, country code). Ties are ordered by code, as in ``order``.
+        """
+        order = self.order(sort_by, ascending)
+        column = self._column(sort_by)
+        value, code = after
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            position = order[middle]
+            row_value = column[position]
+            if row_value == value:
+                is_after = self.codes[position] > code
+            else:
+                is_after = (row_value > value) == ascending
+            if is_after:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def query(self, search: str = '', sort_by: str = 'CountryName', ascending: bool = True,
+              page: int = 1, per_page: int = 20, after: Optional[Tuple] = None) -> Tuple[List[int], int]:
+        """
+        Filter, sort and paginate, by page number or from a keyset cursor
+        (``after``). Returns the row positions for the page and the total
+        number of matching rows.
+        """
+        order = self.order(sort_by, ascending)
+        if after is not None:
+            start = self.seek(sort_by, ascending, after)
+        else:
+            start = max(page - 1, 0) * per_page
+        end = start + max(per_page, 0)
+
+        if not search:
+            return list(order[start:end]), len(order)
+
+        mask = self.search(search)
+        if after is None:
+            matches = [position for position in order if mask[position]]
+            return matches[start:end], len(matches)
+
+        # From a cursor, only scan forward until the page is full
+        page_positions = []
+        for index in range(start, len(order)):
+            if len(page_positions) >= per_page:
+                break
+            if mask[order[index]]:
+                page_positions.append(order[index])
+        return page_positions, sum(mask)
+
+    def stats(self) -> Dict:
+        """Global summary statistics of the rates (None for each statistic of an empty table)"""
+        if not len(self):
+            return empty_stats()
+        return {
+            'total_countries': len(self),
+            'avg_rate': round(statistics.fmean(self.rates), 2),
+            'min_rate': round(min(self.rates), 2),
+            'max_rate': round(max(self.rates), 2),
+            'median_rate': round(statistics.median(self.rates), 2)
+        }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+rates - command-line rate lookups
+
+Answers single and batch rate queries straight from the binary snapshot
+(rates/rates.snapshot), falling back to rates/rates.csv. Only the standard
+library is imported for lookups, so each invocation starts in milliseconds.
+
+Queries match a country code or a full country name exactly. With --fuzzy a
+close match of a full name (never of a code, and only for queries of four or
+more characters) is accepted too; every such match is reported on stderr
+with the country it resolved to.
+
+Exit status: 0 when every query matched exactly, 1 when any query was not
+found, 3 when all were found but at least one only by a fuzzy match.
+
+Examples:
+    python rates_cli.py USA IND "south korea"
+    python rates_cli.py --fuzzy "south kroea"
+    python rates_cli.py --format json --batch codes.txt
+    cat codes.txt | python rates_cli.py --format csv --batch -
+    python rates_cli.py --recompute
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, Optional, TextIO, Tuple
+
+from rate_table import RateTable
+from snapshot import SNAPSHOT_PATH, SnapshotError, load_country_mapping, read_snapshot
+
+RATES_CSV_PATH = os.path.join('rates', 'rates.csv')
+OUTPUT_FIELDS = ['query', 'CountryCode', 'CountryName', 'Rate', 'match']
+
+# Exit status when every query resolved but some only by fuzzy matching
+EXIT_FUZZY = 3
+
+
+def load_table(snapshot_path: str = SNAPSHOT_PATH, csv_path: str = RATES_CSV_PATH) -> RateTable:
+    """Rate table from the snapshot, or from the CSV when no snapshot is available"""
+    try:
+        return RateTable.from_snapshot(read_snapshot(snapshot_path))
+    except SnapshotError:
+        return RateTable.from_csv(csv_path, load_country_mapping())
+
+
+def recompute(force: bool = False, config_path: str = "config.json") -> bool:
+    """
+    Re-run the rate pipeline if its inputs changed since the current snapshot
+    was built. Returns True when rates were recomputed.
+    """
+    # Imported here so plain lookups never load the pipeline (or pandas)
+    import core_algo
+
+    if not force:
+        try:
+            snapshot = read_snapshot(SNAPSHOT_PATH)
+            if snapshot.meta.get('inputs_fingerprint') == core_algo.compute_input_fingerprint(config_path):
+                print("Inputs unchanged since snapshot "
+                      f"{snapshot.version}, skipping recompute", file=sys.stderr)
+                return False
+        except SnapshotError:
+            pass
+
+    core_algo.configure_logging()
+    core_algo.EconomicRateCalculator(config_path).run_complete_calculation()
+    return True
+
+
+def iter_queries(queries: Iterable[str], batch: Optional[str]) -> Iterator[str]:
+    """Queries from the command line followed by one query per line of the batch source"""
+    for query in queries:
+        yield query
+
+    if batch is None:
+        return
+
+    stream = sys.stdin if batch == '-' else open(batch, 'r', encoding='utf-8')
+    try:
+        for line in stream:
+            query = line.strip()
+            if query and not query.startswith('#'):
+                yield query
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def resolve(table: RateTable, query: str, fuzzy: bool) -> Dict:
+    position, match = table.match(query, fuzzy=fuzzy)
+    if position is None:
+        return {'query': query, 'CountryCode': None, 'CountryName': None, 'Rate': None, 'match': None}
+    return {
+        'query': query,
+        'CountryCode': table.codes[position],
+        'CountryName': table.names[position],
+        'Rate': table.rates[position],
+        'match': match
+    }
+
+
+def write_results(results: Iterable[Dict], output_format: str, out: TextIO) -> Tuple[int, int]:
+    """
+    Stream results as they are resolved. Returns the number of unresolved
+    queries and the number resolved only by a fuzzy match.
+    """
+    missing = fuzzy = 0
+    writer = None
+    if output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS, lineterminator='\n')
+        writer.writeheader()
+
+    for result in results:
+        found = result['CountryCode'] is not None
+        if not found:
+            missing += 1
+        elif result['match'] == 'fuzzy':
+            fuzzy += 1
+            print(f"{result['query']}: no exact match, using closest name "
+                  f"{result['CountryName']} ({result['CountryCode']})", file=sys.stderr)
+
+        if output_format == 'json':
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        elif output_format == 'csv':
+            writer.writerow(result)
+        elif found:
+            out.write(f"{result['CountryCode']}\t{result['Rate']:.2f}\t{result['CountryName']}\n")
+        else:
+            print(f"{result['query']}: not found", file=sys.stderr)
+
+    return missing, fuzzy
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='rates', description="Look up grant rates by country code or name")
+    parser.add_argument('queries', nargs='*', help="Country codes or names")
+    parser.add_argument('-b', '--batch', metavar='FILE',
+                        help="Read one query per line from FILE ('-' for stdin)")
+    parser.add_argument('-f', '--format', choices=['text', 'json', 'csv'], default='text',
+                        help="Output format; json writes one object per line (default: text)")
+    parser.add_argument('--fuzzy', action='store_true',
+                        help="Accept the closest full country name when nothing matches exactly")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, help="Snapshot file to query")
+    parser.add_argument('--recompute', action='store_true',
+                        help="Re-run the rate pipeline first if its inputs changed")
+    parser.add_argument('--force', action='store_true', help="With --recompute, rebuild even if unchanged")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.recompute:
+        recompute(force=args.force)
+        if not args.queries and args.batch is None:
+            return 0
+
+    if not args.queries and args.batch is None:
+        build_parser().print_usage(sys.stderr)
+        return 2
+
+    table = load_table(args.snapshot)
+    results = (resolve(table, query, fuzzy=args.fuzzy)
+               for query in iter_queries(args.queries, args.batch))
+
+    try:
+        missing, fuzzy = write_results(results, args.format, sys.stdout)
+    except BrokenPipeError:
+        # Downstream consumer (e.g. head) closed the pipe
+        sys.stderr.close()
+        return 0
+
+    if missing:
+        return 1
+    return EXIT_FUZZY if fuzzy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
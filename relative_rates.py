@@ -0,0 +1,170 @@
+"""
+Country-to-country relative adjustment factors
+
+The published rates use the USA as the reference economy. Participants funded
+from other hubs need factors relative to their funding country instead: the
+same formula with the funding country's PPP, inflation and COLI in place of the
+USA reference values.
+
+The full n x n matrix is never built. It is split into square blocks that are
+computed on first use with one broadcast of the factor formula and kept in a
+bounded LRU, so repeated lookups are O(1) while memory stays bounded at
+sub-national scale. A whole reference-country column (one funding country,
+every recipient) is filled in a single vectorised call.
+
+The reference inflation divides the recipient's in the inflation term, so it
+is floored at MIN_REFERENCE_INFLATION: a funding country with deflation or
+near-zero inflation would otherwise invert or blow up the inflation effect.
+When a reference is floored, its recipients' inflation is floored the same
+way, so the ratio compares like with like and every country's factor
+relative to itself is exactly 1. References above the floor (the USA among
+them) use the recipients' inflation as is, so the USA column still matches
+the published rates. Recipients held at the factor bounds are listed by
+``clipped``.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core_algo import DEFAULT_FACTOR_BOUNDS, DEFAULT_INFLATION_CAP, DEFAULT_WEIGHTS, adjustment_factors
+from factor_cache import FactorCache
+from lazy_import import lazy_module
+
+np = lazy_module('numpy')
+
+# Countries per block side, and how many blocks/columns are kept in memory
+BLOCK_SIZE = 256
+MAX_BLOCKS = 64
+
+# Lowest reference inflation (%) used as the denominator of the inflation ratio
+MIN_REFERENCE_INFLATION = 1.0
+
+
+class RelativeRateMatrix:
+    """
+    Lazily materialised matrix of factors between funding (reference) and
+    recipient countries. Entry (reference, recipient) is the recipient's
+    adjustment factor when the reference country takes the USA's place.
+    """
+
+    def __init__(self, codes: Sequence[str], ppp, inflation, coli,
+                 weights: Optional[Dict[str, float]] = None,
+                 inflation_cap: float = DEFAULT_INFLATION_CAP,
+                 factor_bounds: Tuple[float, float] = DEFAULT_FACTOR_BOUNDS,
+                 base_rate: Optional[float] = None, version: Optional[str] = None,
+                 block_size: int = BLOCK_SIZE, max_blocks: int = MAX_BLOCKS):
+        self.codes = list(codes)
+        self.ppp = np.asarray(ppp, dtype=float)
+        self.inflation = np.asarray(inflation, dtype=float)
+        self.coli = np.asarray(coli, dtype=float)
+        self.reference_inflation = np.maximum(self.inflation, MIN_REFERENCE_INFLATION)
+        self.reference_floored = self.inflation < MIN_REFERENCE_INFLATION
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.inflation_cap = inflation_cap
+        self.factor_bounds = tuple(factor_bounds)
+        self.base_rate = base_rate
+        self.version = version
+        self.block_size = block_size
+
+        self._index = {code.upper(): i for i, code in enumerate(self.codes)}
+        # Blocks and columns share one LRU; a new version invalidates both
+        self._cache = FactorCache(maxsize=max_blocks)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **kwargs) -> 'RelativeRateMatrix':
+        """
+        Build from a rates snapshot with explanation columns (indicators and
+        model settings). The USA takes the calculator's reference values, so
+        factors relative to the USA match the published rates.
+        """
+        if not snapshot.has_column('adjustment_factor'):
+            raise ValueError("Snapshot has no indicator columns")
+        meta = snapshot.meta
+        codes = snapshot.column('CountryCode')
+        indicators = {name: np.array(snapshot.column(name), dtype=float) for name in ('ppp', 'inflation', 'coli')}
+
+        reference = meta.get('reference')
+        if reference and 'USA' in codes:
+            usa = codes.index('USA')
+            for name, values in indicators.items():
+                values[usa] = reference[name]
+
+        return cls(
+            codes,
+            indicators['ppp'],
+            indicators['inflation'],
+            indicators['coli'],
+            weights=meta.get('weights'),
+            inflation_cap=meta.get('inflation_cap', DEFAULT_INFLATION_CAP),
+            factor_bounds=meta.get('factor_bounds', DEFAULT_FACTOR_BOUNDS),
+            base_rate=meta.get('base_rate'),
+            version=snapshot.version,
+            **kwargs
+        )
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def position(self, country_code: str) -> Optional[int]:
+        """Row/column position of a country code (case-insensitive), or None"""
+        return self._index.get(country_code.upper())
+
+    def _factors(self, reference: slice, recipients: slice) -> np.ndarray:
+        """Factors for a range of reference countries (rows) x recipients (columns)"""
+        # Floored references compare against recipients floored the same way
+        inflation = self.inflation[recipients][None, :]
+        inflation = np.where(self.reference_floored[reference][:, None],
+                             np.maximum(inflation, MIN_REFERENCE_INFLATION), inflation)
+        return adjustment_factors(
+            self.ppp[recipients][None, :],
+            inflation,
+            self.coli[recipients][None, :],
+            self.weights,
+            self.ppp[reference][:, None],
+            self.reference_inflation[reference][:, None],
+            self.coli[reference][:, None],
+            self.inflation_cap, self.factor_bounds
+        )
+
+    def block(self, block_row: int, block_col: int) -> np.ndarray:
+        """One block_size x block_size block of the matrix, computed on first use"""
+        size = self.block_size
+        rows = slice(block_row * size, (block_row + 1) * size)
+        cols = slice(block_col * size, (block_col + 1) * size)
+        return self._cache.get_or_compute(self.version, ('block', block_row, block_col),
+                                          lambda: self._factors(rows, cols))
+
+    def column(self, reference: str) -> np.ndarray:
+        """Factors of every recipient relative to one reference country, in one vectorised pass"""
+        i = self._require(reference)
+        return self._cache.get_or_compute(self.version, ('column', i),
+                                          lambda: self._factors(slice(i, i + 1), slice(None))[0])
+
+    def clipped(self, reference: str) -> Dict[str, List[str]]:
+        """Codes of the recipients whose factor relative to the reference country is at the lower/upper bound"""
+        factors = self.column(reference)
+        lower_bound, upper_bound = self.factor_bounds
+        return {'lower': [self.codes[i] for i in np.flatnonzero(factors <= lower_bound).tolist()],
+                'upper': [self.codes[i] for i in np.flatnonzero(factors >= upper_bound).tolist()]}
+
+    def factor(self, reference: str, recipient: str) -> float:
+        """Adjustment factor of the recipient country relative to the reference country"""
+        i = self._require(reference)
+        j = self._require(recipient)
+        size = self.block_size
+        return float(self.block(i // size, j // size)[i % size, j % size])
+
+    def rate(self, reference: str, recipient: str, base_rate: Optional[float] = None) -> float:
+        """Recipient's rate for a base rate set in the reference country (the snapshot's base rate by default)"""
+        base_rate = self.base_rate if base_rate is None else base_rate
+        return round(base_rate * self.factor(reference, recipient), 2)
+
+    def _require(self, country_code: str) -> int:
+        position = self.position(country_code)
+        if position is None:
+            raise KeyError(f"Unknown country code: {country_code}")
+        return position
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
@@ -0,0 +1,256 @@
+"""
+Sharded multi-process rate calculation
+
+For large indicator tables (sub-national rows, many vintages) the fill and
+rate stages run on a process pool. The coordinator loads, screens and merges
+the inputs as usual and computes everything that needs all rows at once: the
+global inflation median and, with ``imputation.coli = knn``, the
+nearest-neighbour COLI estimates. The merged columns are then published once
+in shared memory; each worker attaches to them, fills and rates its own
+partition of rows, and returns the rate components and program rates.
+
+Every remaining step is row-wise, and results are put back in merge order by
+row position, so the output is identical to the single-process pipeline
+whatever the shard count or partitioning (tests/test_sharding.py checks this
+for both partitionings, with and without KNN imputation). Rows are
+partitioned either into contiguous blocks (``country``) or by source vintage,
+keeping all rows of a vintage in the same shard (``vintage``).
+
+Only fill and rate are parallel. The coordinator still runs serially:
+- load, validate, screen and merge: vectorised and linear in the rows, but
+  they read and join whole indicator files, so they are not sharded
+- the inflation median and, with ``imputation.coli = knn``, the neighbour
+  search, which needs every donor row and is usually the largest serial
+  cost on big tables
+- publishing the columns to shared memory, concatenating the shard results
+  and saving
+By Amdahl's law the speed-up is bounded by these steps; with the default
+COLI curve they are cheap next to rating, with KNN they may dominate. Each
+worker copies only its own rows out of shared memory, so the copying is
+itself spread across the pool.
+
+Example:
+    python sharding.py --workers 8
+    python sharding.py --workers 8 --shards 32 --shard-by vintage
+"""
+
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core_algo import (EconomicRateCalculator, PreparedInputs, compute_program_rates, compute_rate_components,
+                       configure_logging, fill_missing_columns)
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEYS = ('country', 'vintage')
+
+# Column whose value identifies a row's vintage
+VINTAGE_COLUMN = 'ppp_year'
+
+
+class SharedArrays:
+    """
+    Named numpy arrays copied into shared memory blocks, one block per array.
+    The picklable ``spec`` is all a worker needs to attach (see attach_arrays).
+    Use as a context manager; the blocks are released on exit.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self.spec: Dict[str, Tuple[str, str, Tuple[int, ...]]] = {}
+        try:
+            for name, values in arrays.items():
+                values = np.ascontiguousarray(values)
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                self._blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[...] = values
+                self.spec[name] = (block.name, values.dtype.str, values.shape)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> 'SharedArrays':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach_arrays(spec: Dict, positions: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Copies of the given rows of every shared array. A copy rather than a view,
+    so each block can be closed straight away instead of staying mapped while
+    results built from it are alive.
+    """
+    rows = {}
+    for name, (block_name, dtype, shape) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        try:
+            rows[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)[positions]
+        finally:
+            block.close()
+    return rows
+
+
+def partition_rows(merged: pd.DataFrame, shards: int, shard_by: str = 'country',
+                   vintage_column: str = VINTAGE_COLUMN) -> List[np.ndarray]:
+    """
+    Row positions of each shard (none empty). ``country`` splits the rows into
+    contiguous blocks of equal size; ``vintage`` keeps the rows of each vintage
+    together and balances whole vintages across the shards.
+    """
+    if shard_by not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key '{shard_by}', expected one of {', '.join(SHARD_KEYS)}")
+    rows = len(merged)
+    shards = max(1, min(shards, rows))
+
+    if shard_by == 'country' or vintage_column not in merged:
+        return [block for block in np.array_split(np.arange(rows), shards) if len(block)]
+
+    # Missing vintages form one group of their own
+    vintages = merged[vintage_column].to_numpy(dtype=float)
+    keys = np.where(np.isnan(vintages), -np.inf, vintages)
+    groups = [np.flatnonzero(keys == key) for key in np.unique(keys)]
+
+    # Largest vintages first, each to the least loaded shard (ties: lowest shard)
+    assigned: List[List[np.ndarray]] = [[] for _ in range(min(shards, len(groups)))]
+    loads = [0] * len(assigned)
+    for group in sorted(groups, key=len, reverse=True):
+        shard = loads.index(min(loads))
+        assigned[shard].append(group)
+        loads[shard] += len(group)
+    return [np.sort(np.concatenate(parts)) for parts in assigned]
+
+
+def _rate_shard(spec: Dict, positions: np.ndarray, inflation_median: float, usa_coli: float,
+                params: Dict, fingerprint: Optional[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fill and rate one shard: (rate components, program rates) in position order"""
+    rows = attach_arrays(spec, positions)
+
+    inflation, coli = fill_missing_columns(rows['ppp'], rows['inflation'], rows['coli'], inflation_median, usa_coli)
+
+    inputs = PreparedInputs(
+        rows['country_code'].astype(object), rows['ppp'], inflation, coli,
+        rows['inflation_missing'], rows['coli_missing'], rows['ppp_year'], rows['inflation_year'],
+        fingerprint
+    )
+    components = compute_rate_components(inputs, params)
+    return components, compute_program_rates(components, params['programs'])
+
+
+def generate_rates_sharded(calculator: EconomicRateCalculator, workers: Optional[int] = None,
+                           shards: Optional[int] = None, shard_by: str = 'country') -> pd.DataFrame:
+    """
+    Sharded equivalent of fill_missing_data() followed by generate_all_rates():
+    leaves the calculator in the same state and returns the same rates.
+    """
+    if calculator.merged_data is None:
+        raise ValueError("No merged data available. Call merge_datasets() first.")
+
+    workers = workers or os.cpu_count() or 1
+    merged = calculator.merged_data
+    rows = len(merged)
+    params = calculator.parameters()
+
+    with calculator.tracer.stage('fill_missing') as stage:
+        inflation_missing = merged['inflation_imputed'].to_numpy(dtype=bool) if 'inflation_imputed' in merged \
+            else merged['inflation'].isna().to_numpy()
+        coli_missing = merged['coli_imputed'].to_numpy(dtype=bool) if 'coli_imputed' in merged \
+            else merged['coli'].isna().to_numpy()
+        missing_rows = int((inflation_missing | coli_missing).sum())
+        stage['rows'] = missing_rows
+
+        # Statistics over all rows are computed here, before sharding
+        inflation_median = merged['inflation'].median()
+        source = merged
+        if calculator.imputation['coli'] == 'knn':
+            source = calculator._impute_coli_knn(merged)
+
+        def column(name):
+            return merged[name].to_numpy(dtype=float) if name in merged else np.full(rows, np.nan)
+
+        arrays = {
+            'country_code': merged['country_code'].to_numpy().astype(str),
+            'ppp': merged['ppp'].to_numpy(dtype=float),
+            'inflation': merged['inflation'].to_numpy(dtype=float),
+            'coli': source['coli'].to_numpy(dtype=float),
+            'inflation_missing': inflation_missing,
+            'coli_missing': coli_missing,
+            'ppp_year': column('ppp_year'),
+            'inflation_year': column('inflation_year'),
+        }
+    logger.info(f"Filled missing indicators for {missing_rows} countries")
+
+    partitions = partition_rows(merged, shards or workers, shard_by)
+    logger.info(f"Rating {rows} rows in {len(partitions)} {shard_by} shards on {workers} workers")
+
+    with calculator.tracer.stage('calculate_rates') as stage:
+        with SharedArrays(arrays) as shared:
+            tasks = [(shared.spec, positions, inflation_median, params['usa_coli'], params,
+                      calculator.inputs_fingerprint) for positions in partitions]
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                    results = list(pool.map(_rate_shard, *zip(*tasks)))
+            else:
+                results = [_rate_shard(*task) for task in tasks]
+
+        # Back to merge order, whatever the partitioning
+        order = np.argsort(np.concatenate(partitions), kind='stable')
+        components = pd.concat([result[0] for result in results], ignore_index=True) \
+            .iloc[order].reset_index(drop=True)
+        program_rates = pd.concat([result[1] for result in results], ignore_index=True) \
+            .iloc[order].reset_index(drop=True)
+
+        filled = merged.copy()
+        filled['inflation'] = components['inflation'].to_numpy()
+        filled['coli'] = components['coli'].to_numpy()
+        filled['inflation_imputed'] = inflation_missing
+        filled['coli_imputed'] = coli_missing
+        calculator.merged_data = filled
+        calculator.rate_components = components
+        calculator.program_rates = program_rates
+
+        rates_df = components[['country_code', 'rate']].rename(
+            columns={'country_code': 'CountryCode', 'rate': 'Rate'}
+        )
+        stage['rows'] = len(rates_df)
+        stage['programs'] = len(params['programs'])
+        stage['shards'] = len(partitions)
+        stage['workers'] = workers
+
+    logger.info(f"Generated rates for {len(rates_df)} countries")
+    return rates_df
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the rate pipeline on a process pool")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--shards', type=int, default=None, help="Number of shards (default: one per worker)")
+    parser.add_argument('--shard-by', choices=SHARD_KEYS, default='country', help="How rows are partitioned")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args(argv)
+
+    configure_logging()
+
+    calculator = EconomicRateCalculator(args.config)
+    calculator.run_complete_calculation(workers=args.workers or os.cpu_count() or 1,
+                                        shards=args.shards, shard_by=args.shard_by)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
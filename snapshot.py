@@ -0,0 +1,443 @@
+"""
+Binary rates snapshot
+
+A compact, pandas-free serving format written alongside rates/rates.csv.
+Readers only need the standard library, so read-only serving and CLI lookups
+start without importing pandas or numpy.
+
+File layout (all integers little-endian):
+- 8-byte magic ``DDRSNAP1``
+- uint32 header length, followed by a UTF-8 JSON header
+- Column blobs, each aligned to 8 bytes
+
+Column kinds:
+- ``f64``: packed float64 values
+- ``u32`` / ``u8``: packed unsigned integers
+- ``str``: uint32 offsets (rows + 1 entries) followed by UTF-8 bytes
+
+Rate snapshots also store their serving indexes, computed once at build time:
+sort permutations (``order:<column>:asc|desc``) and an open-addressing hash
+table from upper-cased country code to row (``index:CountryCode``). Workers
+map the file read-only (``map_snapshot``), so every process shares the same
+pages and attaching to a new snapshot costs a header parse, not a rebuild.
+
+Each write increments a generation counter stored next to the snapshot
+(``<snapshot>.generation``). ``SharedSnapshot`` maps the counter and compares
+it on every access, switching to the new snapshot only when it changed.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence as SequenceABC
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+MAGIC = b'DDRSNAP1'
+FORMAT_VERSION = 1
+
+SNAPSHOT_PATH = os.path.join('rates', 'rates.snapshot')
+COUNTRY_MAPPING_PATH = 'country_mapping.json'
+
+DEFAULT_FLAG = '🏳️'
+
+# Column kind -> array typecode
+_TYPECODES = {'f64': 'd', 'u32': 'I', 'u8': 'B'}
+_ALIGNMENT = 8
+
+# Serving index columns of rate snapshots
+INDEX_COLUMN = 'index:CountryCode'
+ORDERED_COLUMNS = ('CountryName', 'CountryCode', 'Rate')
+
+_GENERATION = struct.Struct('<Q')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated or of an unknown format"""
+
+
+def load_country_mapping(mapping_path: str = COUNTRY_MAPPING_PATH) -> Dict:
+    """Load the ISO3 -> {name, flag} mapping used to label countries"""
+    try:
+        with open(mapping_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading country mapping: {e}")
+        return {}
+
+
+def _pad(length: int) -> int:
+    return (-length) % _ALIGNMENT
+
+
+def _encode_column(kind: str, values: Sequence) -> bytes:
+    if kind == 'str':
+        encoded = [str(v).encode('utf-8') for v in values]
+        offsets = array('I', [0])
+        total = 0
+        for item in encoded:
+            total += len(item)
+            offsets.append(total)
+        return _to_little_endian(offsets).tobytes() + b''.join(encoded)
+
+    if kind not in _TYPECODES:
+        raise SnapshotError(f"Unknown column kind: {kind}")
+    return _to_little_endian(array(_TYPECODES[kind], values)).tobytes()
+
+
+def _to_little_endian(arr: array) -> array:
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def _infer_kind(values: Sequence) -> str:
+    if isinstance(values, array):
+        for kind, typecode in _TYPECODES.items():
+            if values.typecode == typecode:
+                return kind
+    sample = next(iter(values), None)
+    if isinstance(sample, str):
+        return 'str'
+    return 'f64'
+
+
+def write_snapshot(path: str, columns: Dict[str, Sequence], meta: Optional[Dict] = None,
+                   kinds: Optional[Dict[str, str]] = None, indexes: Optional[Dict[str, array]] = None) -> str:
+    """
+    Write named, equal-length columns to a snapshot file. ``indexes`` are
+    numeric lookup structures of any length, stored like columns.
+
+    The file is written to a temporary path and renamed into place, so readers
+    never observe a half-written snapshot. Returns the snapshot version, a
+    digest of the column data.
+    """
+    kinds = kinds or {}
+    rows = None
+    blobs = []
+    layout = {}
+    offset = 0
+    digest = hashlib.sha1()
+
+    indexes = indexes or {}
+    for name, values in list(columns.items()) + list(indexes.items()):
+        values = list(values) if not isinstance(values, (list, array)) else values
+        if name not in indexes:
+            if rows is None:
+                rows = len(values)
+            elif len(values) != rows:
+                raise SnapshotError(f"Column {name} has {len(values)} rows, expected {rows}")
+
+        kind = kinds.get(name) or _infer_kind(values)
+        blob = _encode_column(kind, values)
+        digest.update(name.encode('utf-8'))
+        digest.update(blob)
+
+        layout[name] = {'kind': kind, 'offset': offset, 'nbytes': len(blob)}
+        blobs.append(blob + b'\0' * _pad(len(blob)))
+        offset += len(blob) + _pad(len(blob))
+
+    version = digest.hexdigest()[:16]
+    header = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'rows': rows or 0,
+        'meta': meta or {},
+        'columns': layout,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    preamble = MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes
+    preamble += b'\0' * _pad(len(preamble))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(preamble)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    _bump_generation(path)
+
+    return version
+
+
+def generation_path(path: str) -> str:
+    return f"{path}.generation"
+
+
+def _bump_generation(path: str) -> None:
+    """Increment the snapshot's generation counter, updated in place so readers' mappings see it"""
+    counter_path = generation_path(path)
+    with open(counter_path, 'r+b' if os.path.exists(counter_path) else 'w+b') as f:
+        data = f.read(_GENERATION.size)
+        generation = _GENERATION.unpack(data)[0] if len(data) == _GENERATION.size else 0
+        f.seek(0)
+        f.write(_GENERATION.pack(generation + 1))
+
+
+def order_column(column: str, ascending: bool = True) -> str:
+    """Name of the stored sort permutation of a column"""
+    return f"order:{column}:{'asc' if ascending else 'desc'}"
+
+
+def sort_order(values: Sequence, ascending: bool = True) -> array:
+    """Row permutation sorted by values; ties keep row order in both directions"""
+    return array('I', sorted(range(len(values)), key=values.__getitem__, reverse=not ascending))
+
+
+def code_hash(code: str) -> int:
+    """32-bit FNV-1a hash of an upper-cased country code"""
+    value = 0x811C9DC5
+    for byte in code.upper().encode('utf-8'):
+        value = ((value ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return value
+
+
+def build_code_index(codes: Sequence[str]) -> array:
+    """Open-addressing hash table of row + 1 per slot (0 = empty), at most half full"""
+    capacity = 1
+    while capacity < 2 * len(codes):
+        capacity *= 2
+    slots = array('I', bytes(4 * capacity))
+    mask = capacity - 1
+    for position, code in enumerate(codes):
+        slot = code_hash(code) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = position + 1
+    return slots
+
+
+class CodeIndex:
+    """Country code -> row lookups through a stored hash table (dict-style ``get``)"""
+
+    __slots__ = ('_slots', '_codes', '_mask')
+
+    def __init__(self, slots, codes: Sequence[str]):
+        self._slots = slots
+        self._codes = codes
+        self._mask = len(slots) - 1
+
+    def get(self, key: str, default=None):
+        slot = code_hash(key) & self._mask
+        while True:
+            entry = self._slots[slot]
+            if not entry:
+                return default
+            if self._codes[entry - 1].upper() == key.upper():
+                return entry - 1
+            slot = (slot + 1) & self._mask
+
+
+def _numeric_view(blob: memoryview, typecode: str):
+    """Zero-copy typed view of a little-endian blob (copied and swapped on big-endian hosts)"""
+    if sys.byteorder == 'little':
+        return blob.cast(typecode)
+    values = array(typecode, bytes(blob))
+    values.byteswap()
+    return values
+
+
+class StringColumn(SequenceABC):
+    """Strings of a ``str`` column, decoded on access from the snapshot buffer"""
+
+    __slots__ = ('_offsets', '_text')
+
+    def __init__(self, offsets, text: memoryview):
+        self._offsets = offsets
+        self._text = text
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return str(self._text[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+
+class Snapshot:
+    """
+    Read-only view over a snapshot file's columns
+    """
+
+    def __init__(self, buffer: bytes, source: Optional[str] = None):
+        self.source = source
+        self._buffer = memoryview(buffer)
+
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            raise SnapshotError(f"Not a rates snapshot: {source}")
+
+        (header_len,) = struct.unpack_from('<I', self._buffer, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(bytes(self._buffer[header_start:header_start + header_len]))
+        if header.get('format') != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format: {header.get('format')}")
+
+        preamble = header_start + header_len
+        self._data_start = preamble + _pad(preamble)
+        self.header = header
+        self.version: str = header['version']
+        self.created_at: str = header['created_at']
+        self.rows: int = header['rows']
+        self.meta: Dict = header['meta']
+        self._columns: Dict = header['columns']
+        self._cache: Dict = {}
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def has_column(self, name: str) -> bool:
+        return name in self._columns
+
+    def _blob(self, name: str) -> memoryview:
+        if name not in self._columns:
+            raise KeyError(f"Snapshot has no column {name}")
+        info = self._columns[name]
+        start = self._data_start + info['offset']
+        end = start + info['nbytes']
+        if end > len(self._buffer):
+            raise SnapshotError(f"Snapshot truncated in column {name}: {self.source}")
+        return self._buffer[start:end]
+
+    def column(self, name: str):
+        """
+        Return a column: a typed array/memoryview for numeric kinds, or a list of
+        interned strings for ``str`` columns.
+        """
+        if name in self._cache:
+            return self._cache[name]
+
+        kind = self._columns.get(name, {}).get('kind')
+        blob = self._blob(name)
+
+        if kind == 'str':
+            offsets = _numeric_view(blob[:(self.rows + 1) * 4], 'I')
+            text = bytes(blob[(self.rows + 1) * 4:])
+            values = [sys.intern(text[offsets[i]:offsets[i + 1]].decode('utf-8'))
+                      for i in range(self.rows)]
+        else:
+            values = _numeric_view(blob, _TYPECODES[kind])
+
+        self._cache[name] = values
+        return values
+
+    def strings(self, name: str) -> StringColumn:
+        """A ``str`` column without decoding it up front: values are decoded when accessed"""
+        key = ('strings', name)
+        if key not in self._cache:
+            if self._columns.get(name, {}).get('kind') != 'str':
+                raise KeyError(f"Snapshot has no string column {name}")
+            blob = self._blob(name)
+            offsets = _numeric_view(blob[:(self.rows + 1) * 4], 'I')
+            self._cache[key] = StringColumn(offsets, blob[(self.rows + 1) * 4:])
+        return self._cache[key]
+
+
+def read_snapshot(path: str = SNAPSHOT_PATH) -> Snapshot:
+    """Load a snapshot file into memory"""
+    try:
+        with open(path, 'rb') as f:
+            buffer = f.read()
+    except FileNotFoundError:
+        raise SnapshotError(f"Snapshot not found: {path}")
+    return Snapshot(buffer, source=path)
+
+
+def map_snapshot(path: str = SNAPSHOT_PATH) -> Snapshot:
+    """
+    Map a snapshot file read-only. Pages are shared by every process mapping
+    the same file, and stay valid after the file is replaced.
+    """
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        raise SnapshotError(f"Snapshot not found: {path}")
+    except ValueError:
+        raise SnapshotError(f"Snapshot is empty: {path}")
+    return Snapshot(buffer, source=path)
+
+
+class SharedSnapshot:
+    """
+    The current snapshot at a path, mapped once per generation. Checking for
+    a new generation reads the mapped counter, without a system call. Falls
+    back to the file's mtime when the snapshot has no generation counter.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self.generation = None
+        self.snapshot: Optional[Snapshot] = None
+        self._counter = None
+
+    def _read_generation(self):
+        if self._counter is None:
+            try:
+                with open(generation_path(self.path), 'rb') as f:
+                    self._counter = mmap.mmap(f.fileno(), _GENERATION.size, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                try:
+                    return ('mtime', os.stat(self.path).st_mtime_ns)
+                except OSError:
+                    return None
+        return _GENERATION.unpack_from(self._counter)[0]
+
+    def current(self) -> Optional[Snapshot]:
+        """The snapshot for the current generation (None if there is none). Raises SnapshotError."""
+        generation = self._read_generation()
+        if generation is None:
+            return None
+        if generation != self.generation:
+            self.snapshot = map_snapshot(self.path)
+            self.generation = generation
+        return self.snapshot
+
+
+def build_rates_snapshot(codes: Sequence[str], rates: Sequence[float], path: str = SNAPSHOT_PATH,
+                         mapping: Optional[Dict] = None, meta: Optional[Dict] = None,
+                         extra_columns: Optional[Dict[str, Sequence]] = None,
+                         kinds: Optional[Dict[str, str]] = None,
+                         sorted_columns: Sequence[str] = ()) -> str:
+    """
+    Write the serving snapshot for a set of country rates, labelled with the
+    country names and flags from the country mapping. ``extra_columns`` are
+    stored after the rate columns, in the same row order. Sort permutations
+    are stored for the name, code and rate, and for ``sorted_columns``.
+    """
+    if mapping is None:
+        mapping = load_country_mapping()
+
+    codes = [str(code) for code in codes]
+    names = [mapping.get(code, {}).get('name', code) for code in codes]
+    flags = [mapping.get(code, {}).get('flag', DEFAULT_FLAG) for code in codes]
+
+    columns = {
+        'CountryCode': codes,
+        'CountryName': names,
+        'CountryFlag': flags,
+        'Rate': array('d', [float(rate) for rate in rates]),
+    }
+    for name, values in (extra_columns or {}).items():
+        if name in columns:
+            raise SnapshotError(f"Column {name} is reserved")
+        columns[name] = values
+
+    for name in tuple(ORDERED_COLUMNS) + tuple(sorted_columns):
+        for ascending in (True, False):
+            columns[order_column(name, ascending)] = sort_order(columns[name], ascending)
+
+    return write_snapshot(path, columns, meta=meta, kinds=kinds,
+                          indexes={INDEX_COLUMN: build_code_index(codes)})
@@ -0,0 +1,202 @@
+"""
+Differences between rate snapshots
+
+Every snapshot written by the pipeline is also kept under rates/history/,
+named by its version. Two versions are compared with a single sorted merge on
+CountryCode (snapshots are written sorted by code), so a diff is linear in the
+number of rows and needs only the standard library.
+
+For each changed country the diff reports the absolute and percentage rate
+change, and attributes it to the input that moved the rate the most: one of
+the indicators (through its weighted contribution to the factor) or the base
+rate itself.
+"""
+
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from snapshot import SNAPSHOT_PATH, SnapshotError, read_snapshot
+
+HISTORY_DIR = os.path.join('rates', 'history')
+MAX_HISTORY = 50
+
+INDICATORS = ('ppp', 'inflation', 'coli')
+
+
+def history_path(version: str, history_dir: str = HISTORY_DIR) -> str:
+    return os.path.join(history_dir, f'{version}.snapshot')
+
+
+def archive_snapshot(snapshot_path: str, version: str, history_dir: str = HISTORY_DIR,
+                     keep: int = MAX_HISTORY) -> str:
+    """Copy a snapshot into the history directory and prune the oldest beyond ``keep``"""
+    os.makedirs(history_dir, exist_ok=True)
+    target = history_path(version, history_dir)
+    if not os.path.exists(target):
+        tmp_path = f"{target}.tmp.{os.getpid()}"
+        shutil.copyfile(snapshot_path, tmp_path)
+        os.replace(tmp_path, target)
+    else:
+        # Same content rebuilt: mark it as the most recent
+        os.utime(target)
+
+    archived = sorted(
+        (entry for entry in os.scandir(history_dir) if entry.name.endswith('.snapshot')),
+        key=lambda entry: entry.stat().st_mtime_ns
+    )
+    for entry in archived[:max(len(archived) - keep, 0)]:
+        os.remove(entry.path)
+    return target
+
+
+def list_versions(history_dir: str = HISTORY_DIR) -> List[Dict]:
+    """
+    Archived snapshot versions, most recently archived first. This is the
+    file modification time, the same order archive_snapshot prunes by: a
+    rebuilt version keeps the created_at of its first build but moves to the
+    front when it is archived again.
+    """
+    versions = []
+    if not os.path.isdir(history_dir):
+        return versions
+    archived = []
+    for entry in os.scandir(history_dir):
+        if not entry.name.endswith('.snapshot'):
+            continue
+        try:
+            snapshot = read_snapshot(entry.path)
+            mtime_ns = entry.stat().st_mtime_ns
+        except (SnapshotError, OSError):
+            continue
+        archived.append((mtime_ns, snapshot))
+    archived.sort(key=lambda item: item[0], reverse=True)
+    for mtime_ns, snapshot in archived:
+        versions.append({'version': snapshot.version, 'created_at': snapshot.created_at,
+                         'archived_at': datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).isoformat(),
+                         'rows': snapshot.rows})
+    return versions
+
+
+def load_version(version: str, history_dir: str = HISTORY_DIR):
+    """Snapshot for a version ('current' for the live snapshot). Raises SnapshotError if unknown."""
+    if version == 'current':
+        return read_snapshot(SNAPSHOT_PATH)
+    if not version.isalnum():
+        raise SnapshotError(f"Invalid snapshot version: {version}")
+    return read_snapshot(history_path(version, history_dir))
+
+
+def _require_sorted(snapshot) -> None:
+    codes = snapshot.column('CountryCode')
+    if any(codes[k] > codes[k + 1] for k in range(len(codes) - 1)):
+        raise SnapshotError(f"Snapshot {snapshot.version} is not sorted by CountryCode")
+
+
+def _attribute(old, new, i: int, j: int, old_base: float, new_base: float) -> Dict:
+    """Rate effect of each input between row i of old and row j of new"""
+    effects = {}
+    if old.has_column('adjustment_factor') and new.has_column('adjustment_factor'):
+        for name in INDICATORS:
+            column = f'{name}_contribution'
+            delta = new.column(column)[j] - old.column(column)[i]
+            effects[name] = round(new_base * delta, 4)
+        old_factor = old.column('adjustment_factor')[i]
+    else:
+        old_factor = old.column('Rate')[i] / old_base if old_base else 0.0
+    effects['base_rate'] = round((new_base - old_base) * old_factor, 4)
+
+    driver = max(effects, key=lambda name: abs(effects[name]))
+    result = {'driver': driver if effects[driver] else None, 'effects': effects}
+
+    if new.has_column('clipped') and new.column('clipped')[j]:
+        # Indicator effects are partly or fully absorbed by the factor bounds
+        result['clipped'] = 'lower' if new.column('clipped')[j] == 1 else 'upper'
+    if new.has_column('pinned') and new.column('pinned')[j]:
+        result['driver'] = 'base_rate'
+    return result
+
+
+def _change(old, new, i: int, j: int, old_base: float, new_base: float) -> Dict:
+    """Changed-country entry for row i of old and row j of new"""
+    old_rate, new_rate = old.column('Rate')[i], new.column('Rate')[j]
+    entry = {
+        'CountryCode': new.column('CountryCode')[j],
+        'old_rate': old_rate,
+        'new_rate': new_rate,
+        'delta': round(new_rate - old_rate, 2),
+        'pct_change': round((new_rate - old_rate) / old_rate * 100, 2) if old_rate else None,
+    }
+    entry.update(_attribute(old, new, i, j, old_base, new_base))
+    return entry
+
+
+def diff_snapshots(old, new) -> Dict:
+    """
+    Compare two snapshots with a sorted merge on CountryCode (a plain row by
+    row pass when both hold the same countries). Reports added, removed and
+    changed countries, with rate deltas and their main driver.
+    """
+    _require_sorted(old)
+    _require_sorted(new)
+
+    old_codes, new_codes = old.column('CountryCode'), new.column('CountryCode')
+    old_rates, new_rates = old.column('Rate'), new.column('Rate')
+    old_base = old.meta.get('base_rate') or 0.0
+    new_base = new.meta.get('base_rate') or 0.0
+
+    added, removed, changed = [], [], []
+    unchanged = 0
+
+    if old_codes == new_codes:
+        # Same countries in both (the common case): compare rates row by row
+        for i, (old_rate, new_rate) in enumerate(zip(old_rates, new_rates)):
+            if old_rate != new_rate:
+                changed.append(_change(old, new, i, i, old_base, new_base))
+        unchanged = len(new_codes) - len(changed)
+        old_codes = new_codes = ()
+
+    i = j = 0
+    while i < len(old_codes) or j < len(new_codes):
+        if j >= len(new_codes) or (i < len(old_codes) and old_codes[i] < new_codes[j]):
+            removed.append({'CountryCode': old_codes[i], 'Rate': old_rates[i]})
+            i += 1
+        elif i >= len(old_codes) or new_codes[j] < old_codes[i]:
+            added.append({'CountryCode': new_codes[j], 'Rate': new_rates[j]})
+            j += 1
+        else:
+            if old_rates[i] != new_rates[j]:
+                changed.append(_change(old, new, i, j, old_base, new_base))
+            else:
+                unchanged += 1
+            i += 1
+            j += 1
+
+    drivers: Dict[str, int] = {}
+    for entry in changed:
+        if entry['driver']:
+            drivers[entry['driver']] = drivers.get(entry['driver'], 0) + 1
+
+    return {
+        'from': old.version,
+        'to': new.version,
+        'summary': {
+            'added': len(added),
+            'removed': len(removed),
+            'changed': len(changed),
+            'unchanged': unchanged,
+            'base_rate': {'from': old_base, 'to': new_base},
+            'drivers': drivers,
+        },
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+    }
+
+
+def diff_versions(from_version: str, to_version: str = 'current',
+                  history_dir: str = HISTORY_DIR) -> Dict:
+    """Diff two snapshot versions by name"""
+    return diff_snapshots(load_version(from_version, history_dir), load_version(to_version, history_dir))
+
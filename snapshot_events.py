@@ -0,0 +1,167 @@
+"""
+Snapshot change notifications for Server-Sent Events
+
+One background poller per process watches the rates snapshot through a
+SharedSnapshot (normally the app's own), so a check is a read of the mapped
+generation counter and a new version is mapped once and shared with the
+request handlers rather than read into a private copy. When a new version is
+published it builds a single event that includes a compact delta of the
+changed countries. Connected clients block on a shared condition variable and
+are woken together, with no per-client polling or file reads.
+
+Each connected client holds its worker until it disconnects. Under a
+threaded server that is a whole thread per idle client. The app is therefore
+served with gevent workers (gunicorn.conf.py), where an idle client is a
+parked greenlet and one worker holds thousands of streams:
+
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from snapshot import SNAPSHOT_PATH, SharedSnapshot, SnapshotError
+from snapshot_diff import diff_snapshots
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# Client reconnection delay suggested to EventSource (ms)
+RETRY_MS = 3000
+
+
+def _delta(diff: Dict) -> Dict:
+    """Compact delta of a snapshot diff: summary plus code/rate pairs"""
+    return {
+        'summary': diff['summary'],
+        'added': [{'CountryCode': entry['CountryCode'], 'Rate': entry['Rate']} for entry in diff['added']],
+        'removed': [entry['CountryCode'] for entry in diff['removed']],
+        'changed': [{'CountryCode': entry['CountryCode'], 'old_rate': entry['old_rate'],
+                     'new_rate': entry['new_rate'], 'driver': entry['driver']} for entry in diff['changed']],
+    }
+
+
+def format_event(event: str, data: Dict, event_id: Optional[str] = None) -> str:
+    """Serialise one Server-Sent Event"""
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class SnapshotBroadcaster:
+    """
+    Publishes an event whenever the snapshot at ``path`` changes version
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH, interval: float = POLL_INTERVAL,
+                 shared: Optional[SharedSnapshot] = None):
+        self.path = path
+        self.interval = interval
+        # Mapped snapshot, shared with whoever else serves from it
+        self._shared = shared if shared is not None else SharedSnapshot(path)
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._event: Optional[Dict] = None
+        self._snapshot = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the poller thread (once per process)"""
+        with self._start_lock:
+            if self._thread is None:
+                self.poll()
+                self._thread = threading.Thread(target=self._run, name='snapshot-events', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling snapshot: {e}")
+
+    def poll(self) -> bool:
+        """Check the snapshot once; publish an event if its version changed"""
+        try:
+            snapshot = self._shared.current()
+        except SnapshotError as e:
+            print(f"Error loading snapshot: {e}")
+            return False
+
+        previous = self._snapshot
+        if snapshot is None or snapshot is previous:
+            return False
+        if previous is not None and previous.version == snapshot.version:
+            self._snapshot = snapshot
+            return False
+
+        event = {
+            'version': snapshot.version,
+            'previous': previous.version if previous is not None else None,
+            'created_at': snapshot.created_at,
+            'rows': snapshot.rows,
+            'delta': None,
+        }
+        if previous is not None:
+            try:
+                event['delta'] = _delta(diff_snapshots(previous, snapshot))
+            except SnapshotError as e:
+                print(f"Error computing snapshot delta: {e}")
+
+        self._snapshot = snapshot
+        with self._condition:
+            self._sequence += 1
+            self._event = event
+            self._condition.notify_all()
+        return True
+
+    def current(self):
+        """(sequence, event) of the latest published version"""
+        with self._condition:
+            return self._sequence, self._event
+
+    def wait(self, sequence: int, timeout: float):
+        """Block until an event newer than ``sequence`` is published (or timeout)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > sequence, timeout)
+            return self._sequence, self._event
+
+    def stream(self, include_delta: bool = False, last_event_id: Optional[str] = None,
+               heartbeat: float = HEARTBEAT_INTERVAL) -> Iterator[str]:
+        """
+        Event stream for one client: the current version on connect (unless
+        ``last_event_id`` is already current), then one event per new version,
+        with comment heartbeats while idle. A delta is only attached when it
+        applies to the version the client last received; otherwise the client
+        should refetch.
+        """
+        self.start()
+        yield f'retry: {RETRY_MS}\n\n'
+
+        sequence, event = self.current()
+        # Version the client holds; a delta is only meaningful relative to it
+        seen = last_event_id
+        if event is not None and event['version'] != seen:
+            yield format_event('snapshot', self._payload(event, include_delta, seen), event['version'])
+            seen = event['version']
+
+        while True:
+            new_sequence, event = self.wait(sequence, heartbeat)
+            if new_sequence == sequence:
+                yield ': keep-alive\n\n'
+                continue
+            sequence = new_sequence
+            yield format_event('snapshot', self._payload(event, include_delta, seen), event['version'])
+            seen = event['version']
+
+    @staticmethod
+    def _payload(event: Dict, include_delta: bool, seen: Optional[str]) -> Dict:
+        if include_delta and seen is not None and event['previous'] == seen:
+            return event
+        return dict(event, delta=None)
@@ -0,0 +1,42 @@
+"""Budget allocation input checks and edge cases"""
+
+import math
+
+import pytest
+
+from allocation import MODES, allocate, allocate_participants
+from rate_table import RateTable
+
+
+def table() -> RateTable:
+    return RateTable(['USA', 'IND'], ['United States', 'India'], ['', ''], [7.5, 2.5])
+
+
+@pytest.mark.parametrize('bad', [math.nan, math.inf, -math.inf])
+def test_rejects_non_finite_budget(bad):
+    with pytest.raises(ValueError):
+        allocate([7.5, 2.5], [10, 10], bad)
+
+
+@pytest.mark.parametrize('bad', [math.nan, math.inf])
+def test_rejects_non_finite_hours_and_rates(bad):
+    with pytest.raises(ValueError):
+        allocate([7.5, 2.5], [10, bad], 100.0)
+    with pytest.raises(ValueError):
+        allocate([7.5, bad], [10, 10], 100.0)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_zero_budget_funds_nothing(mode):
+    result = allocate([7.5, 2.5], [10, 4], 0.0, mode, priority=[1, 2])
+    assert result['amount'].tolist() == [0.0, 0.0]
+    assert result['fraction'].tolist() == [0.0, 0.0]
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_no_participants(mode):
+    result = allocate_participants(table(), [], [], 100.0, mode, [])
+    assert result['amount'].tolist() == []
+    assert result['summary']['participants'] == 0
+    assert result['summary']['allocated'] == 0.0
+    assert result['summary']['remaining'] == 100.0
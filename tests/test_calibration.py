@@ -0,0 +1,45 @@
+"""Calibration on indicator data with gaps"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from calibration import CalibrationProblem, calibrate
+from core_algo import EconomicRateCalculator
+
+
+def calculator(tmp_path) -> EconomicRateCalculator:
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'base_rate': 7.5}))
+    calc = EconomicRateCalculator(str(config_path))
+    calc.merged_data = pd.DataFrame({
+        'country_code': ['USA', 'AAA', 'BBB', 'CCC', 'DDD', 'EEE'],
+        'ppp': [1.0, 0.3, 0.6, np.nan, 0.8, 0.5],
+        'inflation': [2.95, 4.0, 2.0, 3.0, np.inf, 6.0],
+        'coli': [128.03, 50.0, 90.0, 70.0, 110.0, np.nan],
+    })
+    return calc
+
+
+def test_rows_with_missing_indicators_are_dropped(tmp_path):
+    problem = CalibrationProblem(calculator(tmp_path), fairness_weight=1.0)
+    assert problem.codes.tolist() == ['AAA', 'BBB']
+    assert problem.dropped == 3
+
+
+def test_calibration_with_gaps_returns_finite_parameters(tmp_path):
+    targets = pd.Series({'AAA': 3.0, 'BBB': 5.0, 'CCC': 4.0, 'EEE': 4.0})
+    fitted = calibrate(calculator(tmp_path), targets, fairness_weight=0.5, iterations=200)
+    values = list(fitted['weights'].values()) + [fitted['inflation_cap']] + fitted['factor_bounds']
+    assert np.isfinite(values).all()
+    assert fitted['calibration']['target_countries'] == 2
+    assert np.isfinite(fitted['calibration']['final_loss'])
+
+
+def test_no_complete_rows_is_an_error(tmp_path):
+    calc = calculator(tmp_path)
+    calc.merged_data['coli'] = np.nan
+    with pytest.raises(ValueError):
+        CalibrationProblem(calc, fairness_weight=1.0)
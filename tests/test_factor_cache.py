@@ -0,0 +1,32 @@
+"""FactorCache keys, eviction and counters"""
+
+from factor_cache import FactorCache
+
+
+def test_alternating_fingerprints_stay_cached():
+    cache = FactorCache(maxsize=8)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    for _ in range(3):
+        assert cache.get_or_compute('scenario-a', ('USA',), lambda: compute(1.0)) == 1.0
+        assert cache.get_or_compute('scenario-b', ('USA',), lambda: compute(2.0)) == 2.0
+
+    assert calls == [1.0, 2.0]
+    assert cache.stats()['hits'] == 4
+    assert cache.stats()['fingerprints'] == 2
+
+
+def test_lru_eviction_and_clear():
+    cache = FactorCache(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        cache.get_or_compute(None, (key,), lambda: key)
+    assert len(cache) == 2
+    assert cache.stats()['evictions'] == 1
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'size': 0, 'maxsize': 2,
+                             'evictions': 0, 'fingerprints': 0}
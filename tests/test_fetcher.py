@@ -0,0 +1,140 @@
+"""Fetcher against a local stand-in HTTP server serving fixture files"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fetcher import ConnectionPool, Fetcher, _keep_alive
+
+FIXTURES = {
+    '/ppp.csv': b'country_code,ppp\nDEU,0.74\nIND,0.24\n',
+    '/coli.csv': b'country_code,coli\nDEU,65.3\nIND,21.9\n',
+}
+REDIRECTS = {'/old/ppp.csv': '/ppp.csv'}
+
+
+def _etag(body: bytes) -> str:
+    return '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+
+
+def make_handler(protocol: str, drop_reused: bool = False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = protocol
+        seen = []
+
+        def setup(self):
+            super().setup()
+            self.served = 0
+
+        def do_GET(self):
+            self.seen.append((self.path, self.headers.get('If-None-Match')))
+            self.served += 1
+            if drop_reused and self.served > 1:
+                # An idle keep-alive connection the server has timed out: closed without a response
+                self.close_connection = True
+                return
+            if self.path in REDIRECTS:
+                self.send_response(301)
+                self.send_header('Location', REDIRECTS[self.path])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif self.path in FIXTURES:
+                body = FIXTURES[self.path]
+                if self.headers.get('If-None-Match') == _etag(body):
+                    self.send_response(304)
+                    self.send_header('ETag', _etag(body))
+                    self.end_headers()
+                else:
+                    self.send_response(200)
+                    self.send_header('ETag', _etag(body))
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+@pytest.fixture(params=['HTTP/1.0', 'HTTP/1.1'])
+def server(request):
+    handler = make_handler(request.param)
+    server, base_url = serve(handler)
+    yield base_url, handler
+    server.shutdown()
+    server.server_close()
+
+
+def run_fetch(sources, tmp_path, per_host=1):
+    data_dir = tmp_path / 'data'
+    fetcher = Fetcher(sources, data_dir=str(data_dir), cache_path=str(data_dir / '.fetch_cache.json'))
+    fetcher.pool = ConnectionPool(per_host)
+    results = asyncio.run(fetcher.run())
+    return {result['target']: result for result in results}, fetcher.pool
+
+
+def test_keep_alive_rules():
+    sized = {'content-length': '10'}
+    assert _keep_alive('HTTP/1.1', sized)
+    assert not _keep_alive('HTTP/1.1', dict(sized, connection='close'))
+    assert not _keep_alive('HTTP/1.1', {})
+    assert _keep_alive('HTTP/1.1', {}, has_body=False)
+    assert not _keep_alive('HTTP/1.0', sized)
+    assert not _keep_alive('HTTP/1.0', {}, has_body=False)
+    assert _keep_alive('HTTP/1.0', dict(sized, connection='keep-alive'))
+
+
+def test_unchanged_sources_cost_one_304(server, tmp_path):
+    base_url, handler = server
+    sources = {'ppp.csv': f'{base_url}/ppp.csv', 'coli.csv': f'{base_url}/coli.csv'}
+
+    first, _ = run_fetch(sources, tmp_path)
+    assert {result['status'] for result in first.values()} == {'fetched'}
+    assert (tmp_path / 'data' / 'ppp.csv').read_bytes() == FIXTURES['/ppp.csv']
+    assert (tmp_path / 'data' / 'coli.csv').read_bytes() == FIXTURES['/coli.csv']
+
+    second, pool = run_fetch(sources, tmp_path)
+    assert {result['status'] for result in second.values()} == {'not_modified'}
+    assert not list((tmp_path / 'data').glob('*.part'))
+    # HTTP/1.0 closes after every response unless keep-alive is negotiated
+    assert pool.reused == (1 if handler.protocol_version == 'HTTP/1.1' else 0)
+
+
+def test_redirected_source_is_revalidated(server, tmp_path):
+    base_url, handler = server
+    sources = {'ppp.csv': f'{base_url}/old/ppp.csv'}
+
+    assert run_fetch(sources, tmp_path)[0]['ppp.csv']['status'] == 'fetched'
+    cache = json.loads((tmp_path / 'data' / '.fetch_cache.json').read_text())
+    assert cache['ppp.csv']['url'] == f'{base_url}/old/ppp.csv'
+    assert cache['ppp.csv']['final_url'] == f'{base_url}/ppp.csv'
+
+    assert run_fetch(sources, tmp_path)[0]['ppp.csv']['status'] == 'not_modified'
+    assert handler.seen[-1] == ('/ppp.csv', _etag(FIXTURES['/ppp.csv']))
+
+
+def test_closed_pooled_connection_is_retried(tmp_path):
+    server, base_url = serve(make_handler('HTTP/1.1', drop_reused=True))
+    try:
+        sources = {'ppp.csv': f'{base_url}/ppp.csv', 'coli.csv': f'{base_url}/coli.csv'}
+        results, pool = run_fetch(sources, tmp_path)
+        assert {result['status'] for result in results.values()} == {'fetched'}
+        assert pool.reused == 1 and pool.opened == 2
+        assert (tmp_path / 'data' / 'coli.csv').read_bytes() == FIXTURES['/coli.csv']
+    finally:
+        server.shutdown()
+        server.server_close()
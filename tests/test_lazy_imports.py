@@ -0,0 +1,16 @@
+"""Serving imports stay free of numpy/pandas until a handler needs them"""
+
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_app_does_not_load_numpy_or_pandas():
+    # A fresh interpreter: other tests have long since imported numpy here
+    code = ("import sys, app; "
+            "loaded = [name for name in ('numpy', 'pandas') if name in sys.modules]; "
+            "assert not loaded, loaded")
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,21 @@
+"""Per-stage memory records of PipelineTracer"""
+
+import pytest
+
+from pipeline_trace import PipelineTracer, _current_rss_mb
+
+
+@pytest.mark.skipif(_current_rss_mb() is None, reason="current RSS is not reported on this platform")
+def test_rss_delta_is_per_stage():
+    tracer = PipelineTracer()
+    with tracer.stage('allocate'):
+        block = bytearray(b'x' * (64 * 1024 * 1024))
+    with tracer.stage('idle'):
+        pass
+    del block
+
+    allocate, idle = tracer.stages
+    assert allocate['rss_delta_mb'] > 48
+    assert abs(idle['rss_delta_mb']) < 16
+    # The process peak is cumulative: the idle stage reports at least the allocating one's
+    assert idle['process_peak_rss_mb'] >= allocate['process_peak_rss_mb']
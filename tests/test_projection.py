@@ -0,0 +1,28 @@
+"""Inflation paths of RateProjector"""
+
+import numpy as np
+
+from projection import MIN_TREND_YEARS, RateProjector
+
+CODES = ['AAA', 'BBB']
+
+
+def test_trend_needs_enough_history():
+    two_years = RateProjector(CODES, [3.0, 5.0], {2023: [2.0, 6.0], 2024: [3.0, 5.0]})
+    assert MIN_TREND_YEARS > 2
+    assert not two_years.trended().any()
+    assert np.array_equal(two_years.inflation_paths('trend', 'year', 3),
+                          two_years.inflation_paths('latest', 'year', 3))
+
+
+def test_trend_moves_paths_within_observed_range():
+    history = {2022: [1.0, 8.0], 2023: [4.0, 6.0], 2024: [2.0, np.nan]}
+    projector = RateProjector(CODES, [2.0, 6.0], history)
+    assert projector.trended().tolist() == [True, False]
+
+    paths = projector.inflation_paths('trend', 'year', 6)
+    # Slope +0.5/year from the latest 2.0, damped and never above the observed 4.0
+    assert paths[0, 0] == 2.25
+    assert np.all(np.diff(paths[0]) > 0) and paths[0].max() <= 4.0
+    # Too little history: the latest inflation
+    assert paths[1].tolist() == [6.0] * 6
@@ -0,0 +1,18 @@
+"""SQLiteRateStore on an empty store"""
+
+from rate_store import SQLiteRateStore, _connect, _create_schema
+from rate_table import RateTable
+
+
+def test_empty_store_matches_empty_table(tmp_path):
+    path = str(tmp_path / 'rates.db')
+    connection = _connect(path)
+    _create_schema(connection)
+    connection.close()
+
+    store = SQLiteRateStore(path)
+    table = RateTable([], [], [], [])
+    assert not store
+    assert len(store) == 0
+    assert store.stats() == table.stats()
+    assert table.stats()['total_countries'] == 0
@@ -0,0 +1,28 @@
+"""Country lookups on RateTable"""
+
+from rate_table import RateTable
+
+
+def table() -> RateTable:
+    return RateTable(['USA', 'SLB', 'KOR', 'XKX'], ['United States', 'SLB', 'South Korea', 'Kosovo'],
+                     ['', '', '', ''], [7.5, 6.4, 5.87, 6.1])
+
+
+def test_exact_code_and_name():
+    rates = table()
+    assert rates.match('usa') == (0, 'code')
+    assert rates.match('  south korea ') == (2, 'name')
+
+
+def test_fuzzy_is_opt_in():
+    rates = table()
+    assert rates.match('south kroea') == (None, None)
+    assert rates.match('south kroea', fuzzy=True) == (2, 'fuzzy')
+
+
+def test_fuzzy_never_matches_codes_or_short_queries():
+    rates = table()
+    # Mistyped codes and short queries must not resolve to another country
+    assert rates.match('USB', fuzzy=True) == (None, None)
+    assert rates.match('xx', fuzzy=True) == (None, None)
+    assert rates.match('SLBB', fuzzy=True) == (None, None)
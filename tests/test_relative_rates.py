@@ -0,0 +1,40 @@
+"""Country-to-country factors of RelativeRateMatrix"""
+
+import numpy as np
+
+from core_algo import DEFAULT_WEIGHTS, adjustment_factors
+from relative_rates import MIN_REFERENCE_INFLATION, RelativeRateMatrix
+
+CODES = ['USA', 'AFG', 'LCA', 'IND', 'DEU', 'SSD', 'CHE']
+PPP = [1.0, 0.21, 0.63, 0.24, 0.74, 0.9, 1.1]
+# Deflation, near-zero, ordinary and very high inflation
+INFLATION = [2.95, -6.6, 0.7, 4.9, 2.3, 91.4, MIN_REFERENCE_INFLATION]
+COLI = [128.03, 45.0, 90.0, 30.0, 84.0, 70.0, 150.0]
+
+
+def matrix(**kwargs) -> RelativeRateMatrix:
+    return RelativeRateMatrix(CODES, PPP, INFLATION, COLI, block_size=3, **kwargs)
+
+
+def test_factor_relative_to_itself_is_one():
+    relative = matrix()
+    for code in CODES:
+        assert relative.factor(code, code) == 1.0
+        assert relative.column(code)[relative.position(code)] == 1.0
+
+
+def test_usa_column_matches_published_factors():
+    relative = matrix()
+    published = adjustment_factors(np.array(PPP), np.array(INFLATION), np.array(COLI), DEFAULT_WEIGHTS,
+                                   1.0, 2.95, 128.03)
+    assert np.array_equal(relative.column('USA'), published)
+    assert [relative.factor('USA', code) for code in CODES] == published.tolist()
+
+
+def test_clipped_lists_recipients_at_the_bounds():
+    relative = matrix()
+    lower_bound, upper_bound = relative.factor_bounds
+    factors = dict(zip(CODES, relative.column('IND').tolist()))
+    clipped = relative.clipped('IND')
+    assert clipped['upper'] == [code for code, factor in factors.items() if factor >= upper_bound]
+    assert clipped['lower'] == [code for code, factor in factors.items() if factor <= lower_bound]
@@ -0,0 +1,88 @@
+"""Sharded rate calculation against the single-process pipeline on synthetic data"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core_algo import EconomicRateCalculator
+from sharding import generate_rates_sharded, partition_rows
+
+ROWS = 400
+
+
+def synthetic_merged(rows: int = ROWS, seed: int = 7) -> pd.DataFrame:
+    """A merged (unfilled) table with gaps in inflation and COLI and a handful of vintages"""
+    rng = np.random.default_rng(seed)
+    ppp = np.exp(rng.normal(-0.8, 0.6, rows))
+    inflation = rng.gamma(2.0, 2.0, rows) - 0.5
+    coli = np.clip(128.03 * ppp ** 0.7 * np.exp(rng.normal(0, 0.15, rows)), 20, 250)
+    inflation[rng.random(rows) < 0.1] = np.nan
+    coli[rng.random(rows) < 0.3] = np.nan
+    ppp_year = rng.choice([2019.0, 2020.0, 2021.0, 2022.0, np.nan], rows, p=[0.1, 0.2, 0.3, 0.35, 0.05])
+    return pd.DataFrame({
+        'country_code': [f'C{i:04d}' for i in range(rows)],
+        'ppp': ppp,
+        'ppp_year': ppp_year,
+        'inflation': inflation,
+        'inflation_year': np.full(rows, 2023.0),
+        'coli': coli,
+    })
+
+
+def calculator(tmp_path, merged: pd.DataFrame, coli_imputation: str) -> EconomicRateCalculator:
+    config = {
+        'base_rate': 7.5,
+        'imputation': {'coli': coli_imputation, 'same_region': False},
+        'programs': {'travel': {'base_rate': 12.0, 'rate_floor': 6.0, 'rate_cap': 15.0}},
+    }
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps(config))
+    calc = EconomicRateCalculator(str(config_path))
+    calc.merged_data = merged.copy()
+    return calc
+
+
+@pytest.mark.parametrize('coli_imputation', ['curve', 'knn'])
+@pytest.mark.parametrize('shard_by,shards,workers', [
+    ('country', 7, 1),
+    ('vintage', 3, 1),
+    ('country', 4, 2),
+    ('vintage', 8, 2),
+])
+def test_sharded_matches_single_process(tmp_path, coli_imputation, shard_by, shards, workers):
+    merged = synthetic_merged()
+
+    single = calculator(tmp_path, merged, coli_imputation)
+    single.fill_missing_data()
+    expected = single.generate_all_rates()
+
+    sharded = calculator(tmp_path, merged, coli_imputation)
+    rates = generate_rates_sharded(sharded, workers=workers, shards=shards, shard_by=shard_by)
+
+    pd.testing.assert_frame_equal(rates, expected, check_exact=True)
+    pd.testing.assert_frame_equal(sharded.rate_components, single.rate_components, check_exact=True)
+    pd.testing.assert_frame_equal(sharded.program_rates, single.program_rates, check_exact=True)
+    pd.testing.assert_frame_equal(sharded.merged_data, single.merged_data, check_exact=True)
+
+
+def test_partition_rows_covers_every_row_once():
+    merged = synthetic_merged()
+    for shard_by in ('country', 'vintage'):
+        partitions = partition_rows(merged, 6, shard_by)
+        positions = np.concatenate(partitions)
+        assert sorted(positions.tolist()) == list(range(len(merged)))
+        assert all(len(part) for part in partitions)
+
+    # Rows of one vintage (including the missing one) never straddle shards
+    vintages = merged['ppp_year'].fillna(-1)
+    for part in partition_rows(merged, 6, 'vintage'):
+        inside = set(vintages.iloc[part])
+        outside = set(vintages.drop(index=part))
+        assert not inside & outside
+
+
+def test_partition_rows_rejects_unknown_key():
+    with pytest.raises(ValueError):
+        partition_rows(synthetic_merged(10), 2, 'region')
@@ -0,0 +1,27 @@
+"""SnapshotBroadcaster change detection over a SharedSnapshot"""
+
+from snapshot import SharedSnapshot, build_rates_snapshot
+from snapshot_events import SnapshotBroadcaster
+
+MAPPING = {'USA': {'name': 'United States'}, 'IND': {'name': 'India'}}
+
+
+def test_publishes_once_per_version(tmp_path):
+    path = str(tmp_path / 'rates.snapshot')
+    build_rates_snapshot(['IND', 'USA'], [2.5, 7.5], path, mapping=MAPPING)
+    shared = SharedSnapshot(path)
+    broadcaster = SnapshotBroadcaster(path, shared=shared)
+
+    assert broadcaster.poll()
+    assert not broadcaster.poll()
+    sequence, event = broadcaster.current()
+    assert event['previous'] is None
+    # The broadcaster serves from the shared mapping rather than its own copy
+    assert broadcaster._snapshot is shared.current()
+
+    build_rates_snapshot(['IND', 'USA'], [2.75, 7.5], path, mapping=MAPPING)
+    assert broadcaster.poll()
+    new_sequence, new_event = broadcaster.current()
+    assert new_sequence == sequence + 1
+    assert new_event['previous'] == event['version']
+    assert [entry['CountryCode'] for entry in new_event['delta']['changed']] == ['IND']
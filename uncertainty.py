@@ -0,0 +1,179 @@
+"""
+Monte Carlo uncertainty bands for country rates
+
+The published rate is a point estimate, but its inputs are not equally reliable:
+inflation may come from the 2023 fallback year, missing inflation is replaced by
+the global median, and missing COLI is estimated from PPP. This module perturbs
+each country's indicators with noise scaled to how the value was obtained and
+reports p5/p50/p95 rate bands.
+
+Samples are evaluated with the vectorised factor formula over countries x draws
+blocks. Blocks are sized to a fixed element budget to bound memory, seeded
+independently so results do not depend on the worker count, and can be spread
+across a process pool.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core_algo import EconomicRateCalculator, adjustment_factors, configure_logging
+
+logger = logging.getLogger(__name__)
+
+BANDS_PATH = os.path.join('rates', 'rate_bands.csv')
+
+# Noise per indicator source. PPP and COLI use multiplicative (log-normal)
+# noise given as a relative standard deviation; inflation uses additive noise
+# in percentage points.
+DEFAULT_NOISE = {
+    'ppp': 0.03,
+    'ppp_fallback': 0.06,          # value taken from the previous year
+    'inflation': 0.5,
+    'inflation_fallback': 1.5,
+    'inflation_imputed': 4.0,      # global median used in place of a value
+    'coli': 0.05,
+    'coli_imputed': 0.25,          # estimated from PPP
+}
+
+# Upper bound on samples evaluated at once (countries x draws in one block)
+BLOCK_ELEMENTS = 2_000_000
+
+
+def noise_levels(merged: pd.DataFrame, noise: Optional[Dict[str, float]] = None,
+                 latest_year: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Per-country noise standard deviations for each indicator"""
+    levels = dict(DEFAULT_NOISE)
+    levels.update(noise or {})
+    n = len(merged)
+
+    def is_fallback(column: str) -> np.ndarray:
+        if column not in merged:
+            return np.zeros(n, dtype=bool)
+        years = merged[column].to_numpy(dtype=float)
+        newest = latest_year if latest_year is not None else np.nanmax(years)
+        return years < newest
+
+    ppp_sd = np.where(is_fallback('ppp_year'), levels['ppp_fallback'], levels['ppp'])
+
+    inflation_sd = np.where(is_fallback('inflation_year'), levels['inflation_fallback'], levels['inflation'])
+    if 'inflation_imputed' in merged:
+        inflation_sd = np.where(merged['inflation_imputed'].to_numpy(dtype=bool),
+                                levels['inflation_imputed'], inflation_sd)
+
+    coli_sd = np.full(n, levels['coli'])
+    if 'coli_imputed' in merged:
+        coli_sd = np.where(merged['coli_imputed'].to_numpy(dtype=bool), levels['coli_imputed'], coli_sd)
+
+    return {'ppp': ppp_sd, 'inflation': inflation_sd, 'coli': coli_sd}
+
+
+def _simulate_block(ppp, inflation, coli, ppp_sd, inflation_sd, coli_sd, fixed,
+                    draws: int, params: Dict, seed, percentiles: Sequence[float]) -> np.ndarray:
+    """Rate percentiles for one block of countries. Returns a (countries, len(percentiles)) array."""
+    rng = np.random.default_rng(seed)
+    shape = (len(ppp), draws)
+
+    # Log-normal noise keeps PPP and COLI positive
+    ppp_samples = ppp[:, None] * np.exp(rng.standard_normal(shape) * ppp_sd[:, None])
+    coli_samples = coli[:, None] * np.exp(rng.standard_normal(shape) * coli_sd[:, None])
+    inflation_samples = inflation[:, None] + rng.standard_normal(shape) * inflation_sd[:, None]
+
+    factors = adjustment_factors(
+        ppp_samples, inflation_samples, coli_samples, params['weights'],
+        params['usa_ppp'], params['usa_inflation'], params['usa_coli'],
+        params['inflation_cap'], params['factor_bounds']
+    )
+    rates = params['base_rate'] * factors
+
+    # Countries pinned to the base rate (the USA) have no uncertainty
+    rates[fixed] = params['base_rate']
+
+    return np.percentile(rates, percentiles, axis=1).T
+
+
+def simulate_rate_bands(calculator: EconomicRateCalculator, draws: int = 100_000, seed: int = 0,
+                        noise: Optional[Dict[str, float]] = None, workers: Optional[int] = None,
+                        percentiles: Sequence[float] = (5, 50, 95)) -> pd.DataFrame:
+    """
+    Monte Carlo rate bands for every country in the calculator's filled,
+    merged dataset. Returns CountryCode, Rate and one column per percentile.
+    """
+    if calculator.merged_data is None or 'coli_imputed' not in calculator.merged_data:
+        raise ValueError("No filled data available. Call fill_missing_data() first.")
+
+    merged = calculator.merged_data
+    sd = noise_levels(merged, noise)
+
+    ppp = merged['ppp'].to_numpy(dtype=float)
+    inflation = merged['inflation'].to_numpy(dtype=float)
+    coli = merged['coli'].to_numpy(dtype=float)
+    fixed = (merged['country_code'] == 'USA').to_numpy()
+
+    params = calculator.parameters()
+
+    # Block by countries so every country's draws are evaluated together and the
+    # percentiles are exact; the block size does not depend on the worker count
+    countries_per_block = max(1, BLOCK_ELEMENTS // draws)
+    starts = range(0, len(merged), countries_per_block)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+    blocks = []
+    for start, block_seed in zip(starts, seeds):
+        rows = slice(start, start + countries_per_block)
+        blocks.append((ppp[rows], inflation[rows], coli[rows], sd['ppp'][rows],
+                       sd['inflation'][rows], sd['coli'][rows], fixed[rows],
+                       draws, params, block_seed, tuple(percentiles)))
+
+    logger.info(f"Simulating {len(merged)} countries x {draws} draws in {len(blocks)} blocks")
+
+    if workers and workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_block, *zip(*blocks)))
+    else:
+        results = [_simulate_block(*block) for block in blocks]
+
+    bands = np.vstack(results)
+
+    result = pd.DataFrame({
+        'CountryCode': merged['country_code'].to_numpy(),
+        'Rate': params['base_rate'] * calculator.calculate_adjustment_factors(ppp, inflation, coli, params),
+    })
+    result.loc[fixed, 'Rate'] = params['base_rate']
+    for i, q in enumerate(percentiles):
+        result[f'p{q:g}'] = bands[:, i]
+
+    numeric = result.columns.drop('CountryCode')
+    result[numeric] = result[numeric].round(2)
+    return result.sort_values('CountryCode').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo uncertainty bands for country rates")
+    parser.add_argument('--draws', type=int, default=100_000, help="Samples per country")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: in-process)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=BANDS_PATH)
+    args = parser.parse_args()
+
+    configure_logging()
+
+    calculator = EconomicRateCalculator()
+    calculator.load_economic_data()
+    calculator.merge_datasets()
+    calculator.fill_missing_data()
+
+    bands = simulate_rate_bands(calculator, draws=args.draws, seed=args.seed, workers=args.workers)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    bands.to_csv(args.output, index=False)
+    logger.info(f"Rate bands saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Watch the pipeline inputs and rerun the affected stages
+
+Long-running daemon that watches data/, final_data/ and config.json and
+reruns only the stages downstream of a changed file:
+- raw World Bank PPP export     -> ppp_processor.py       -> core_algo.py
+- raw World Bank inflation      -> inflation_processor.py -> core_algo.py
+- raw Numbeo COLI data          -> aggregator.py, convert_iso2_to_iso3.py -> core_algo.py
+- final_data/*, config.json, country_groups.json -> core_algo.py
+
+Changes are detected with inotify (through ctypes, Linux only) and fall back
+to polling file signatures elsewhere. Bursts of writes are debounced into one
+run. Each stage runs as its own process, exactly as when run by hand;
+core_algo.py publishes rates/rates.csv and the snapshot by atomic rename, so
+the app never reads a half-written file.
+
+Each run is summarised in rates/watch_status.json, including the freshness
+latency: time from the earliest changed input to the new rates being
+published.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATES_PATH = os.path.join('rates', 'rates.csv')
+WATCH_STATUS_PATH = os.path.join('rates', 'watch_status.json')
+
+# Watched file -> first stage it invalidates
+TRIGGERS = {
+    os.path.join('data', 'raw data from worldbank.csv'): 'ppp',
+    os.path.join('data', 'raw inflation data from world bank.csv'): 'inflation',
+    os.path.join('data', 'COLI Numbeo Raw data.csv'): 'coli',
+    os.path.join('final_data', 'PPP.csv'): 'rates',
+    os.path.join('final_data', 'INFLATION.csv'): 'rates',
+    os.path.join('final_data', 'INFLATION_HISTORY.csv'): 'rates',
+    os.path.join('final_data', 'COLI.csv'): 'rates',
+    'config.json': 'rates',
+    'country_groups.json': 'rates',
+}
+
+# Stages in execution order: scripts run in turn, and the files they write
+STAGES = {
+    'ppp': (['ppp_processor.py'], [os.path.join('final_data', 'PPP.csv')]),
+    'inflation': (['inflation_processor.py'], [os.path.join('final_data', 'INFLATION.csv'),
+                                               os.path.join('final_data', 'INFLATION_HISTORY.csv')]),
+    'coli': (['aggregator.py', 'convert_iso2_to_iso3.py'], [os.path.join('final_data', 'COLI.csv')]),
+    'rates': (['core_algo.py'], [RATES_PATH]),
+}
+
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify(7) event masks
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """
+    Change notifications for a set of directories through the inotify syscalls.
+    Raises OSError when inotify is unavailable.
+    """
+
+    def __init__(self, directories: List[str]):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: Dict[int, str] = {}
+        # IN_ATTRIB catches touch(1); unchanged signatures are filtered out later
+        mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory or '.'), mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory!r}")
+            self._directories[wd] = directory
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """Paths changed within the timeout; None if events were lost (rescan everything)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed: Set[str] = set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd in self._directories and name:
+                changed.add(os.path.join(self._directories[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback: reports every watched file each interval, for signature comparison"""
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def affected_stages(paths) -> List[str]:
+    """Stages to run, in order, for a set of changed watched files"""
+    first = {TRIGGERS[path] for path in paths if path in TRIGGERS}
+    if not first:
+        return []
+    # Every upstream stage feeds the rate calculation
+    return [stage for stage in STAGES if stage in first or stage == 'rates']
+
+
+class PipelineWatcher:
+    """
+    Debounces input changes and runs the affected pipeline stages
+    """
+
+    def __init__(self, watcher=None, debounce: float = DEFAULT_DEBOUNCE,
+                 max_delay: float = DEFAULT_MAX_DELAY, status_path: str = WATCH_STATUS_PATH):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.status_path = status_path
+        self.watcher = watcher or self._default_watcher()
+        self.signatures = {path: _signature(path) for path in TRIGGERS}
+        self.runs = 0
+
+    @staticmethod
+    def _default_watcher():
+        directories = sorted({os.path.dirname(path) for path in TRIGGERS})
+        try:
+            watcher = InotifyWatcher(directories)
+            logger.info(f"Watching {', '.join(d or '.' for d in directories)} with inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify unavailable ({e}), polling every {DEFAULT_POLL_INTERVAL}s")
+            return PollingWatcher()
+
+    def _changed(self, candidates: Optional[Set[str]]) -> Dict[str, float]:
+        """Watched files whose signature changed, with their modification time"""
+        changed = {}
+        for path in (TRIGGERS if candidates is None else candidates & TRIGGERS.keys()):
+            signature = _signature(path)
+            if signature != self.signatures.get(path):
+                self.signatures[path] = signature
+                changed[path] = signature[0] / 1e9 if signature else time.time()
+        return changed
+
+    def run_stages(self, stages: List[str]) -> List[Dict]:
+        """Run the stages in order, stopping at the first failure"""
+        records = []
+        for stage in stages:
+            scripts, outputs = STAGES[stage]
+            started = time.perf_counter()
+            record = {'stage': stage, 'status': 'ok'}
+            for script in scripts:
+                result = subprocess.run([sys.executable, script], capture_output=True, text=True)
+                if result.returncode != 0:
+                    record['status'] = 'error'
+                    record['error'] = (result.stderr or result.stdout).strip().splitlines()[-1:]
+                    logger.error(f"{script} failed (exit {result.returncode}): {result.stderr.strip()}")
+                    break
+            record['seconds'] = round(time.perf_counter() - started, 3)
+            records.append(record)
+            # Our own outputs must not trigger another run
+            for output in outputs:
+                if output in self.signatures:
+                    self.signatures[output] = _signature(output)
+            if record['status'] != 'ok':
+                break
+        return records
+
+    def _publish_status(self, status: Dict) -> None:
+        os.makedirs(os.path.dirname(self.status_path), exist_ok=True)
+        tmp_path = f"{self.status_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_path, self.status_path)
+
+    def handle(self, changed: Dict[str, float], detected_at: float) -> Optional[Dict]:
+        """Run the stages affected by a debounced set of changes and report freshness"""
+        stages = affected_stages(changed)
+        if not stages:
+            return None
+        logger.info(f"Changed: {', '.join(sorted(changed))}; running {', '.join(stages)}")
+        started = time.time()
+        records = self.run_stages(stages)
+        finished = time.time()
+        ok = all(record['status'] == 'ok' for record in records) and len(records) == len(stages)
+
+        earliest = min(changed.values())
+        status = {
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'status': 'ok' if ok else 'error',
+            'changed': sorted(changed),
+            'stages': records,
+            'debounce_seconds': round(started - detected_at, 3),
+            'pipeline_seconds': round(finished - started, 3),
+        }
+        if ok:
+            # Input written -> new rates published
+            published = os.path.getmtime(RATES_PATH) if os.path.exists(RATES_PATH) else finished
+            status['freshness_seconds'] = round(max(published - earliest, 0.0), 3)
+            logger.info(f"Rates republished {status['freshness_seconds']}s after the input changed")
+        self._publish_status(status)
+        self.runs += 1
+        return status
+
+    def run(self, max_runs: Optional[int] = None) -> None:
+        """Watch until interrupted (or until max_runs pipeline runs)"""
+        pending: Dict[str, float] = {}
+        first_seen = last_seen = detected_at = 0.0
+        while max_runs is None or self.runs < max_runs:
+            timeout = None
+            if pending:
+                now = time.monotonic()
+                timeout = max(0.0, min(last_seen + self.debounce, first_seen + self.max_delay) - now)
+            changed = self._changed(self.watcher.wait(timeout))
+            now = time.monotonic()
+            if changed:
+                if not pending:
+                    first_seen = now
+                    detected_at = time.time()
+                pending.update({path: min(mtime, pending.get(path, mtime)) for path, mtime in changed.items()})
+                last_seen = now
+            if pending and (now - last_seen >= self.debounce or now - first_seen >= self.max_delay):
+                batch, pending = pending, {}
+                self.handle(batch, detected_at)
+
+    def close(self) -> None:
+        self.watcher.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rerun the rate pipeline when its inputs change")
+    parser.add_argument('--poll', action='store_true', help="Poll file signatures instead of using inotify")
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL, help="Polling interval (s)")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help="Quiet period after the last change before running (s)")
+    parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY,
+                        help="Run at the latest this long after the first change (s)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    watcher = PipelineWatcher(PollingWatcher(args.interval) if args.poll else None,
+                              debounce=args.debounce, max_delay=args.max_delay)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())